@@ -0,0 +1,33 @@
+"""add_ingest_job_leases
+
+Revision ID: 23b6c27ac3dc
+Revises: 702f12776aff
+Create Date: 2026-10-18 10:41:53.210846
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '23b6c27ac3dc'
+down_revision: Union[str, Sequence[str], None] = '702f12776aff'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ingest_jobs', sa.Column('lease_owner', sa.String(), nullable=True))
+    op.add_column('ingest_jobs', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_ingest_jobs_lease', 'ingest_jobs', ['lease_expires_at'],
+                    postgresql_where=sa.text("status = 'running'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ingest_jobs_lease', table_name='ingest_jobs')
+    op.drop_column('ingest_jobs', 'lease_expires_at')
+    op.drop_column('ingest_jobs', 'lease_owner')
@@ -0,0 +1,30 @@
+"""add_ingest_job_checkpoint
+
+Revision ID: 46a771f3494f
+Revises: 23b6c27ac3dc
+Create Date: 2026-10-18 11:02:17.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '46a771f3494f'
+down_revision: Union[str, Sequence[str], None] = '23b6c27ac3dc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ingest_jobs', sa.Column('chunks_done', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('ingest_jobs', sa.Column('chunks_total', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('ingest_jobs', 'chunks_total')
+    op.drop_column('ingest_jobs', 'chunks_done')
@@ -0,0 +1,28 @@
+"""add_corpus_version_to_chats
+
+Revision ID: 617fee811e88
+Revises: d24e23db313e
+Create Date: 2026-10-18 09:12:41.503127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '617fee811e88'
+down_revision: Union[str, Sequence[str], None] = 'd24e23db313e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chats', sa.Column('corpus_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chats', 'corpus_version')
@@ -0,0 +1,33 @@
+"""add_hot_path_indexes
+
+Revision ID: 68013a4abd87
+Revises: 89d8b49bb6d5
+Create Date: 2026-10-18 17:26:51.930417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '68013a4abd87'
+down_revision: Union[str, Sequence[str], None] = '89d8b49bb6d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_notes_chat_id', 'notes', ['chat_id'])
+    op.create_index('ix_files_chat_id', 'files', ['chat_id'])
+    op.create_index('ix_files_key_prefix', 'files', ['key'],
+                    postgresql_ops={'key': 'text_pattern_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_files_key_prefix', table_name='files')
+    op.drop_index('ix_files_chat_id', table_name='files')
+    op.drop_index('ix_notes_chat_id', table_name='notes')
@@ -0,0 +1,46 @@
+"""add_ingest_jobs
+
+Revision ID: 702f12776aff
+Revises: 617fee811e88
+Create Date: 2026-10-18 10:02:17.384512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '702f12776aff'
+down_revision: Union[str, Sequence[str], None] = '617fee811e88'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ingest_jobs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('file_id', sa.UUID(), nullable=False),
+    sa.Column('status', sa.Enum('queued', 'running', 'done', 'failed', name='ingest_job_status'), server_default='queued', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('run_after', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['file_id'], ['files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('uq_ingest_jobs_file_queued', 'ingest_jobs', ['file_id'], unique=True,
+                    postgresql_where=sa.text("status = 'queued'"))
+    op.create_index('ix_ingest_jobs_claim', 'ingest_jobs', ['status', 'run_after'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ingest_jobs_claim', table_name='ingest_jobs')
+    op.drop_index('uq_ingest_jobs_file_queued', table_name='ingest_jobs')
+    op.drop_table('ingest_jobs')
+    sa.Enum(name='ingest_job_status').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,43 @@
+"""add_file_chunks_and_content_hash
+
+Revision ID: 71cae3c110b0
+Revises: 46a771f3494f
+Create Date: 2026-10-18 11:38:52.106274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '71cae3c110b0'
+down_revision: Union[str, Sequence[str], None] = '46a771f3494f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('files', sa.Column('content_sha256', sa.String(length=64), nullable=True))
+    op.create_index('ix_files_indexed_etag', 'files', ['etag', 'size'],
+                    postgresql_where=sa.text("status = 'indexed'"))
+    op.create_index('ix_files_indexed_sha256', 'files', ['content_sha256'],
+                    postgresql_where=sa.text("status = 'indexed'"))
+    op.create_table('file_chunks',
+    sa.Column('file_id', sa.UUID(), nullable=False),
+    sa.Column('chunk_index', sa.Integer(), nullable=False),
+    sa.Column('vector_id', sa.String(), nullable=False),
+    sa.Column('chunk_hash', sa.String(length=64), nullable=False),
+    sa.ForeignKeyConstraint(['file_id'], ['files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('file_id', 'chunk_index')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('file_chunks')
+    op.drop_index('ix_files_indexed_sha256', table_name='files')
+    op.drop_index('ix_files_indexed_etag', table_name='files')
+    op.drop_column('files', 'content_sha256')
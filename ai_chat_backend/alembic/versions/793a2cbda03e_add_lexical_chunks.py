@@ -0,0 +1,34 @@
+"""add lexical_chunks
+
+Revision ID: 793a2cbda03e
+Revises: 68013a4abd87
+Create Date: 2026-10-18 10:12:41.530218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '793a2cbda03e'
+down_revision: Union[str, Sequence[str], None] = '68013a4abd87'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('lexical_chunks',
+    sa.Column('file_id', sa.UUID(), nullable=False),
+    sa.Column('chunk_index', sa.Integer(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['file_id'], ['files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('file_id', 'chunk_index')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('lexical_chunks')
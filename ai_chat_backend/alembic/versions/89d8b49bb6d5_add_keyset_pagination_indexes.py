@@ -0,0 +1,30 @@
+"""add_keyset_pagination_indexes
+
+Revision ID: 89d8b49bb6d5
+Revises: 8eb1605b11cd
+Create Date: 2026-10-18 16:02:37.418263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '89d8b49bb6d5'
+down_revision: Union[str, Sequence[str], None] = '8eb1605b11cd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_messages_chat_created', 'messages', ['chat_id', 'created_at', 'id'])
+    op.create_index('ix_chats_user_updated', 'chats', ['user_id', 'updated_at', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chats_user_updated', table_name='chats')
+    op.drop_index('ix_messages_chat_created', table_name='messages')
@@ -0,0 +1,29 @@
+"""add_file_ingest_stats
+
+Revision ID: 8eb1605b11cd
+Revises: 71cae3c110b0
+Create Date: 2026-10-18 13:02:17.418263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8eb1605b11cd'
+down_revision: Union[str, Sequence[str], None] = '71cae3c110b0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('files', sa.Column('ingest_stats', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('files', 'ingest_stats')
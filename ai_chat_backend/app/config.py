@@ -5,6 +5,12 @@ import os
 load_dotenv()
 class Settings(BaseSettings):
     DATABASE_URL: str
+    DB_POOL_SIZE: int = 5  # connections per worker process; size against Postgres max_connections
+    DB_MAX_OVERFLOW: int = 10  # extra connections opened under load, closed when returned
+    DB_POOL_TIMEOUT_S: float = 30.0  # how long a request waits for a connection before failing
+    DB_POOL_PRE_PING: bool = False  # test each connection on checkout (survives server-side restarts)
+    DB_POOL_RECYCLE_S: int = -1  # replace connections older than this; -1 = never
+    DB_STATEMENT_CACHE_SIZE: int = 100  # prepared statements cached per connection; 0 behind pgbouncer
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
@@ -26,6 +32,56 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: str
     S3_ENDPOINT: str
     DAILY_TOKEN_LIMIT: int = 50000
+    LLM_TIMEOUT_S: float = 60.0
+    RAG_SEARCH_TIMEOUT_S: float = 10.0
+    EMBED_TIMEOUT_S: float = 10.0  # one query embedding (answer-cache lookup, retrieval)
+    REDIS_URL: str = ""
+    AUTH_CACHE_TTL_S: int = 30  # decoded tokens and user snapshots; 0 disables
+    AUTH_CACHE_SIZE: int = 10000
+    EMBED_CACHE_SIZE: int = 2048
+    EMBED_CACHE_TTL_S: int = 3600
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL_S: int = 86400
+    ANSWER_CACHE_MAX_CHATS: int = 1024
+    ANSWER_CACHE_PER_CHAT: int = 64
+    RAG_RETRIEVAL_STRATEGY: str = "sequential"  # sequential | parallel
+    RAG_FALLBACK_HINT_TTL_S: int = 3600
+    VECTOR_BACKEND: str = "pinecone"  # pinecone | local
+    LOCAL_INDEX_PATH: str = "vector_index"
+    LOCAL_INDEX_DTYPE: str = "float32"  # float32 | float16
+    HYBRID_RETRIEVAL: bool = True
+    LEXICAL_TOP_K: int = 8
+    LEXICAL_FASTPATH_MIN_TERMS: int = 2
+    LEXICAL_FASTPATH_MIN_COVERAGE: float = 1.0
+    LEXICAL_FASTPATH_MARGIN: float = 1.5
+    RRF_K: int = 60
+    PROMPT_TOKEN_BUDGET: int = 6000
+    PROMPT_CONTEXT_SHARE: float = 0.7
+    INGEST_WORKERS: int = 2  # 0 disables the in-process worker pool
+    INGEST_POLL_INTERVAL_S: float = 2.0
+    INGEST_MAX_ATTEMPTS: int = 3
+    INGEST_RETRY_BACKOFF_S: float = 30.0
+    INGEST_LEASE_S: int = 60  # a running job whose lease isn't renewed for this long is claimed again
+    INGEST_DOWNLOAD_CONCURRENCY: int = 4
+    INGEST_EXTRACT_CONCURRENCY: int = 2  # documents being extracted at once
+    INGEST_EMBED_CONCURRENCY: int = 8  # embedding requests in flight, over all ingests
+    INGEST_TMP_DIR: str = ""  # where downloads are spooled; empty = system temp dir
+    S3_RANGE_THRESHOLD_MB: int = 32
+    S3_RANGE_PART_MB: int = 8
+    S3_RANGE_CONCURRENCY: int = 4
+    PDF_EXTRACT_PROCESSES: int = 0  # 0 = one per CPU; 1 extracts in-process
+    PDF_PAGES_PER_TASK: int = 16
+    PDF_PAGE_TIMEOUT_S: float = 10.0
+    INGEST_FRAGMENT_QUEUE: int = 8  # extracted pages/text blocks waiting to be chunked
+    INGEST_CHUNK_QUEUE: int = 256  # chunks waiting to be batched for embedding
+    CHUNK_TOKENS: int = 512  # per chunk, in the embedding model's tokens
+    CHUNK_OVERLAP_TOKENS: int = 64
+    EMBED_BATCH_SIZE: int = 96  # chunks per embedding request; also the checkpoint granularity
+    EMBED_MAX_IN_FLIGHT: int = 4  # concurrent embed+upsert batches per file
+    EMBED_MAX_ATTEMPTS: int = 6  # per batch, on rate limits / timeouts / 5xx
+    EMBED_RETRY_BASE_S: float = 1.0
+    EMBED_RETRY_MAX_S: float = 30.0
+    UPSERT_BATCH_SIZE: int = 50  # vectors per Pinecone upsert request (2 MB request cap)
 
 
     class Config:
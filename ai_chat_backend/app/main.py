@@ -14,8 +14,10 @@ from sqlalchemy import create_engine, inspect
 from starlette.concurrency import run_in_threadpool
 
 from app.config import settings
-from app.routers import auth, file, ai, note, chat, message
+from app.routers import auth, file, ai, note, chat, message, metrics
 from app.services.rag_store import init_rag
+from app.services.ingest_queue import ingest_pool
+from app.services.pdf_extract import shutdown_pool as shutdown_pdf_pool
 
 logging.basicConfig(level=logging.INFO)
 
@@ -110,7 +112,12 @@ async def lifespan(app: FastAPI):
         except Exception:
             logging.exception("init_rag failed")
 
-        yield
+        ingest_pool.start(settings.INGEST_WORKERS)
+        try:
+            yield
+        finally:
+            await ingest_pool.stop()
+            shutdown_pdf_pool()
     except Exception:
         logging.exception("Startup lifecycle failed")
         raise
@@ -133,6 +140,7 @@ app.include_router(file.router, tags=["File"])
 app.include_router(message.router, tags=["Message"])
 app.include_router(note.router, tags=["Note"])
 app.include_router(ai.router)
+app.include_router(metrics.router)
 
 # (dev) hiện trace lỗi ra JSON để debug confirm/presign
 from fastapi import Request
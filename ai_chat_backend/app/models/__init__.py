@@ -3,3 +3,6 @@ from .chat import Chat
 from .message import Message
 from .file import File
 from .note import Note
+from .ingest_job import IngestJob
+from .file_chunk import FileChunk
+from .lexical_chunk import LexicalChunk
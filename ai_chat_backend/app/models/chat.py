@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, func
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, Integer, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from uuid import uuid4
@@ -18,9 +18,15 @@ class Chat(Base):
         onupdate=func.now(),
         nullable=False
     )
+    # bumped whenever the chat's indexed documents change; keys the answer cache
+    corpus_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     files = relationship("File", back_populates="chat", cascade="all, delete-orphan")
     note = relationship("Note", back_populates="chat", uselist=False, cascade="all, delete-orphan")
     user = relationship("User", back_populates="chats")
     messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # keyset pages of a user's chats by last activity
+        Index("ix_chats_user_updated", "user_id", "updated_at", "id"),
+    )
@@ -1,7 +1,7 @@
 from enum import Enum as PyEnum
 from sqlalchemy import Enum as SqlEnum
-from sqlalchemy import Column, String, DateTime, ForeignKey, LargeBinary, func, BigInteger
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, DateTime, ForeignKey, LargeBinary, func, BigInteger, Index, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 from uuid import uuid4
 from datetime import datetime
@@ -32,6 +32,17 @@ class File(Base):
     size = Column(BigInteger)
     status = Column(SqlEnum(FileStatus, names="file_status", validate_strings=True),
                     nullable=False, server_default=FileStatus.requested.value)
+    content_sha256 = Column(String(64))  # set at ingest; identical bytes share one set of embeddings
+    ingest_stats = Column(JSONB)  # timings and counts of the last ingest, see IngestStats
 
     chat = relationship("Chat", back_populates="files")
 
+    __table_args__ = (
+        # ingest dedup: find an indexed file with the same content before downloading/embedding
+        Index("ix_files_indexed_etag", "etag", "size", postgresql_where=text("status = 'indexed'")),
+        Index("ix_files_indexed_sha256", "content_sha256", postgresql_where=text("status = 'indexed'")),
+        Index("ix_files_chat_id", "chat_id"),
+        # ownership checks match key LIKE 'uploads/{user_id}/%'; text_pattern_ops lets a prefix
+        # LIKE use the index whatever the database collation
+        Index("ix_files_key_prefix", "key", postgresql_ops={"key": "text_pattern_ops"}),
+    )
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy.dialects.postgresql import UUID
+from ..database import Base
+
+class FileChunk(Base):
+    """One row per stored chunk of an indexed file: where its vector lives and what it contained."""
+    __tablename__ = "file_chunks"
+
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    vector_id = Column(String, nullable=False)
+    chunk_hash = Column(String(64), nullable=False)  # sha256 of the chunk text
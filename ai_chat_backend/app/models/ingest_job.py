@@ -0,0 +1,43 @@
+from enum import Enum as PyEnum
+from sqlalchemy import Column, DateTime, Enum as SqlEnum, ForeignKey, Index, Integer, String, func, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+from uuid import uuid4
+from ..database import Base
+
+class IngestJobStatus(str, PyEnum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    status = Column(SqlEnum(IngestJobStatus, name="ingest_job_status", validate_strings=True),
+                    nullable=False, server_default=IngestJobStatus.queued.value)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    error = Column(String)
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    # the worker running the job renews lease_expires_at; an expired lease means it died
+    lease_owner = Column(String)
+    lease_expires_at = Column(DateTime(timezone=True))
+    # embed progress: chunks_done of the chunks_total chunks this job had to embed are stored;
+    # a retry finds them by their content-derived vector ids and only embeds the rest
+    chunks_done = Column(Integer, nullable=False, default=0, server_default="0")
+    chunks_total = Column(Integer)
+
+    file = relationship("File")
+
+    __table_args__ = (
+        # at most one queued job per file: re-enqueueing returns the pending one
+        Index("uq_ingest_jobs_file_queued", "file_id", unique=True,
+              postgresql_where=text("status = 'queued'")),
+        Index("ix_ingest_jobs_claim", "status", "run_after"),
+        Index("ix_ingest_jobs_lease", "lease_expires_at", postgresql_where=text("status = 'running'")),
+    )
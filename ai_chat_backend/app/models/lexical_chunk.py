@@ -0,0 +1,11 @@
+from sqlalchemy import Column, ForeignKey, Integer, Text
+from sqlalchemy.dialects.postgresql import UUID
+from ..database import Base
+
+class LexicalChunk(Base):
+    """The text of one chunk of an indexed file, as the BM25 index reads it; shared by every pod."""
+    __tablename__ = "lexical_chunks"
+
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
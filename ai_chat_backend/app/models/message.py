@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, func
+from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, Index, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from uuid import uuid4
@@ -20,4 +20,9 @@ class Message(Base):
     tag = Column(String, nullable=True)
     created_at = Column(DateTime, default=func.now())
 
-    chat = relationship("Chat", back_populates="messages")
\ No newline at end of file
+    chat = relationship("Chat", back_populates="messages")
+
+    __table_args__ = (
+        # keyset pages of a chat's history, newest or oldest first
+        Index("ix_messages_chat_created", "chat_id", "created_at", "id"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, func
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from uuid import uuid4
@@ -17,3 +17,7 @@ class Note(Base):
 
     chat = relationship("Chat", back_populates="note")
 
+    __table_args__ = (
+        Index("ix_notes_chat_id", "chat_id"),
+    )
+
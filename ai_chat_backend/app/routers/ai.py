@@ -1,85 +1,280 @@
+import asyncio
+import json
+import logging
+from contextlib import aclosing
 from datetime import date
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from typing import Awaitable, TypeVar
+from uuid import UUID
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
 from app.utils.dependencies import get_db, get_current_user
 from app.models.user import User
 from app.models.chat import Chat
 from app.models.message import Message, RoleType
 from app.schemas.chat import ChatAskRequest
 from app.schemas.message import MessageOut
-from app.services.rag_service import get_rag_answer, REFUSAL_PREFIX, NO_CONTEXT_PREFIX
+from app.services.rag_service import (
+    get_rag_answer, stream_rag_answer, lookup_cached_answer, search_lexical, StreamedAnswer,
+    REFUSAL_PREFIX, NO_CONTEXT_PREFIX,
+)
 SYSTEM_TAGS = {"refusal", "no_context", "legacy"}
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/ai", tags=["AI"])
 
+T = TypeVar("T")
+DISCONNECT_POLL_S = 0.5
+
 
-def _check_rate_limit(user: User) -> None:
+def _over_rate_limit(user: User) -> bool:
+    """Start a new day's count if needed; True when the user has used up today's tokens."""
     today = date.today()
     if user.last_ask_date != today:
         user.daily_token_count = 0
         user.last_ask_date = today
-    if user.daily_token_count >= settings.DAILY_TOKEN_LIMIT:
-        raise HTTPException(
-            status_code=429,
-            detail=f"Daily token limit of {settings.DAILY_TOKEN_LIMIT} reached. Try again tomorrow."
-        )
+    return user.daily_token_count >= settings.DAILY_TOKEN_LIMIT
 
 
-@router.post("/ask", response_model=MessageOut)
-async def ask_chat(
-    body: ChatAskRequest,
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    chat = await db.get(Chat, body.chat_id)
-    if not chat or chat.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Chat not found")
+def _rate_limited() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"Daily token limit of {settings.DAILY_TOKEN_LIMIT} reached. Try again tomorrow."
+    )
+
 
-    _check_rate_limit(current_user)
+def _tag_for_answer(answer: str) -> str | None:
+    if answer.startswith(REFUSAL_PREFIX):
+        return "refusal"
+    if answer.startswith(NO_CONTEXT_PREFIX):
+        return "no_context"
+    return None
 
+
+async def _load_history(db: AsyncSession, chat_id: UUID) -> list[dict]:
+    # newest 20 turns, oldest first; the prompt builder trims further to the token budget
     history_rows = await db.execute(
         select(Message)
-        .where(Message.chat_id == body.chat_id)
-        .order_by(Message.created_at.asc())
+        .where(Message.chat_id == chat_id)
+        .order_by(Message.created_at.desc())
         .limit(20)
     )
-    history = [
+    return [
         {"role": m.role.value, "content": m.content}
-        for m in history_rows.scalars()
+        for m in reversed(history_rows.scalars().all())
         if m.tag not in SYSTEM_TAGS
     ]
 
-    user_msg = Message(
-        role=RoleType.USER,
-        content=body.question,
-        chat_id=body.chat_id
-    )
-    db.add(user_msg)
 
-    answer, tokens_used = get_rag_answer(body.question, chat_id=str(body.chat_id), history=history)
-    current_user.daily_token_count += tokens_used
+async def _start_ask(db: AsyncSession, body: ChatAskRequest, user: User) -> tuple[Chat, list[dict], bool]:
+    """
+    Everything the ask needs from the request's session: the chat, the rate-limit state and
+    the history. Saves the question, then commits, so the session gives its connection back to
+    the pool before anything slow (lexical search, answer-cache lookup, LLM call) runs.
+    Returns (chat, history, over_limit). Cache hits cost no tokens, so an over-limit ask is only
+    refused once the cache missed; its question is saved with the cached answer instead.
+    """
+    chat = await db.get(Chat, body.chat_id)
+    if not chat or chat.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    over_limit = _over_rate_limit(user)
+    history = await _load_history(db, body.chat_id)
+    if not over_limit:
+        db.add(Message(
+            role=RoleType.USER,
+            content=body.question,
+            chat_id=body.chat_id
+        ))
+    await db.commit()
+    return chat, history, over_limit
 
-    tag = None
-    if answer.startswith(REFUSAL_PREFIX):
-        tag = "refusal"
-    elif answer.startswith(NO_CONTEXT_PREFIX):
-        tag = "no_context"
-
-    assistant_msg = Message(
-        role=RoleType.ASSISTANT,
-        content=answer,
-        chat_id=body.chat_id,
-        tag=tag,
-    )
-    db.add(assistant_msg)
 
-    await db.commit()
-    await db.refresh(assistant_msg)
+async def _lexical_or_cached(question: str, chat_id: UUID, corpus_version: int, history: list[dict]):
+    """
+    (lexical result, cached answer). A confident lexical match is answered without embedding
+    the question, so it skips the answer cache, whose lookup embeds.
+    Raises asyncio.TimeoutError when the embedding does not come back in EMBED_TIMEOUT_S.
+    """
+    lexical = await search_lexical(question, chat_id, corpus_version)
+    if lexical is not None and lexical.confident:
+        return lexical, None
+    return lexical, await lookup_cached_answer(question, chat_id, corpus_version, history)
+
+
+async def _cancel_on_disconnect(request: Request, aw: Awaitable[T]) -> T:
+    """
+    Await `aw`, cancelling it if the client goes away so an abandoned ask
+    doesn't keep paying for retrieval and generation.
+    """
+    task = asyncio.ensure_future(aw)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_S)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+@router.post("/ask", response_model=MessageOut)
+async def ask_chat(
+    body: ChatAskRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    chat, history, over_limit = await _start_ask(db, body, current_user)
+    chat_id, user_id, corpus_version = body.chat_id, current_user.id, chat.corpus_version
+
+    try:
+        lexical, cached_answer = await _lexical_or_cached(body.question, chat_id, corpus_version, history)
+        if cached_answer is not None:
+            answer, tokens_used = cached_answer, 0
+        elif over_limit:
+            raise _rate_limited()
+        else:
+            answer, tokens_used = await _cancel_on_disconnect(
+                request,
+                get_rag_answer(
+                    body.question,
+                    chat_id=str(chat_id),
+                    history=history,
+                    corpus_version=corpus_version,
+                    lexical=lexical,
+                ),
+            )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out while generating the answer")
 
+    assistant_msg = await _persist_answer(
+        chat_id, user_id, answer, tokens_used, question=body.question if over_limit else None
+    )
+    if assistant_msg is None:
+        raise HTTPException(status_code=502, detail="The model returned an empty answer")
     return MessageOut(
         content=assistant_msg.content,
         id=assistant_msg.id,
         created_at=assistant_msg.created_at
     )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _persist_answer(
+        chat_id: UUID, user_id: UUID, answer: str, tokens_used: int, question: str | None = None
+) -> Message | None:
+    """
+    Save the answer and charge its tokens in a short transaction of its own, so no connection
+    is held while the answer is generated. The token charge is a single UPDATE, which stays
+    correct when asks of the same user finish concurrently. `question` is the user's message
+    when _start_ask did not save it (an over-limit ask answered from the cache); it gets a
+    transaction of its own first, so it sorts before the answer.
+    """
+    async with AsyncSessionLocal() as session:
+        if question is not None:
+            session.add(Message(role=RoleType.USER, content=question, chat_id=chat_id))
+            await session.commit()
+        assistant_msg = None
+        if answer:
+            assistant_msg = Message(
+                role=RoleType.ASSISTANT,
+                content=answer,
+                chat_id=chat_id,
+                tag=_tag_for_answer(answer),
+            )
+            session.add(assistant_msg)
+        if tokens_used:
+            await session.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(daily_token_count=User.daily_token_count + tokens_used)
+            )
+        await session.commit()
+        if assistant_msg is not None:
+            await session.refresh(assistant_msg)
+        return assistant_msg
+
+
+async def _persist_streamed_answer(
+        chat_id: UUID, user_id: UUID, result: StreamedAnswer, question: str | None = None
+) -> Message | None:
+    """Whatever was streamed, including a partial answer; the request-scoped session is closed by now."""
+    return await _persist_answer(chat_id, user_id, result.text, result.estimate_tokens(), question)
+
+
+@router.post("/ask/stream")
+async def ask_chat_stream(
+    body: ChatAskRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Server-sent events variant of /ask: `token` events carry answer deltas as the
+    model produces them, then a final `done` (or `error`) event. The assistant
+    message is persisted when the stream ends, including on client disconnect.
+    """
+    chat, history, over_limit = await _start_ask(db, body, current_user)
+    chat_id, user_id, corpus_version = body.chat_id, current_user.id, chat.corpus_version
+
+    try:
+        lexical, cached_answer = await _lexical_or_cached(body.question, chat_id, corpus_version, history)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out while generating the answer")
+    if cached_answer is None and over_limit:
+        raise _rate_limited()
+    question = body.question if over_limit else None
+    result = StreamedAnswer()
+
+    async def answer_tokens():
+        if cached_answer is not None:
+            result.parts.append(cached_answer)
+            yield cached_answer
+            return
+        async with aclosing(
+                stream_rag_answer(body.question, str(chat_id), history, result, corpus_version, lexical)
+        ) as tokens:
+            async for delta in tokens:
+                yield delta
+
+    async def event_stream():
+        persisted = False
+        try:
+            async with aclosing(answer_tokens()) as tokens:
+                async for delta in tokens:
+                    yield _sse("token", {"delta": delta})
+            persisted = True
+            assistant_msg = await _persist_streamed_answer(chat_id, user_id, result, question)
+            if assistant_msg is None:
+                yield _sse("error", {"detail": "The model returned an empty answer"})
+                return
+            yield _sse("done", {
+                "id": assistant_msg.id,
+                "content": assistant_msg.content,
+                "created_at": assistant_msg.created_at,
+            })
+        except asyncio.TimeoutError:
+            yield _sse("error", {"detail": "Timed out while generating the answer"})
+        finally:
+            if not persisted:
+                # client went away or generation failed: keep the partial answer and its cost
+                with anyio.CancelScope(shield=True):
+                    try:
+                        await _persist_streamed_answer(chat_id, user_id, result, question)
+                    except Exception:
+                        logger.exception("failed to persist streamed answer chat_id=%s", chat_id)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -7,8 +7,8 @@ from app.schemas.user import LoginResponse
 from app.schemas.user import UserOut, LoginResponse
 import logging
 from fastapi import Cookie, HTTPException
-from app.models import User
-from app.utils.dependencies import get_current_user
+from app.services.auth_cache import Principal
+from app.utils.dependencies import get_current_principal
 from fastapi.responses import JSONResponse
 
 logger = logging.getLogger(__name__)
@@ -70,7 +70,7 @@ async def refresh_token(
     return LoginResponse(user=user_out, token=new_token)
 
 @router.get("/me", response_model=UserOut)
-async def get_me(user: User = Depends(get_current_user)):
+async def get_me(user: Principal = Depends(get_current_principal)):
     return UserOut.from_orm(user)
 
 
@@ -1,12 +1,15 @@
+from typing import Literal, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Path
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Path, Query
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services import chat_service
-from app.utils.dependencies import get_db, get_current_user
-from app.models import Chat, User
-from app.schemas.chat import ChatSummary
+from app.services.auth_cache import Principal
+from app.utils.dependencies import get_db, get_current_principal
+from app.models import Chat
+from app.schemas.chat import ChatSummary, ChatPage
+from app.utils.pagination import NEWEST_FIRST, keyset_page, split_page
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
@@ -15,7 +18,7 @@ router = APIRouter(prefix="/chat", tags=["Chat"])
 async def create_chat_minimal(
         title: str = Form(...),
         db: AsyncSession = Depends(get_db),
-        current_user=Depends(get_current_user),
+        current_user=Depends(get_current_principal),
 ):
     chat = await chat_service.create_chat_minimal(
         db=db,
@@ -28,7 +31,7 @@ async def create_chat_minimal(
 async def get_chat_title(
     chat_id: UUID,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     result = await db.execute(
         select(Chat).where(Chat.id == chat_id, Chat.user_id == current_user.id)
@@ -44,7 +47,7 @@ async def get_chat_title(
 async def delete_chat(
         chat_id: UUID,
         db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        current_user: Principal = Depends(get_current_principal)
 ):
     result = await db.execute(
         select(Chat).where(Chat.id == chat_id, Chat.user_id == current_user.id)
@@ -59,21 +62,29 @@ async def delete_chat(
     return
 
 
-@router.get("/", response_model=list[ChatSummary])
+@router.get("/", response_model=ChatPage)
 async def get_all_chats(
+        limit: int = Query(50, ge=1, le=200),
+        cursor: Optional[str] = None,
+        order: Literal["desc", "asc"] = NEWEST_FIRST,
         db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        current_user: Principal = Depends(get_current_principal)
 ):
-    result = await db.execute(
-        select(Chat).where(Chat.user_id == current_user.id).order_by(Chat.updated_at.desc())
-    )
-    chats = result.scalars().all()
+    # a chat that gets a new message while the list is paged moves to the front and is not seen again
+    result = await db.execute(keyset_page(
+        select(Chat.id, Chat.title, Chat.updated_at).where(Chat.user_id == current_user.id),
+        Chat.updated_at, Chat.id, cursor, limit, order,
+    ))
+    chats, next_cursor = split_page(result.all(), limit, "updated_at")
 
-    return [
-        ChatSummary(
-            id=chat.id,
-            title=chat.title,
-            updated_at=chat.updated_at
-        )
-        for chat in chats
-    ]
+    return ChatPage(
+        items=[
+            ChatSummary(
+                id=chat.id,
+                title=chat.title,
+                updated_at=chat.updated_at
+            )
+            for chat in chats
+        ],
+        next_cursor=next_cursor,
+    )
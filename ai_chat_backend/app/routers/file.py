@@ -7,13 +7,13 @@ import boto3
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends
 from app.utils.dependencies import get_db
-from app.schemas.file import FileResponse, AttachReq, DiscardReq
+from app.schemas.file import FileResponse, AttachReq, DiscardReq, IngestJobOut, IngestStatsOut
 from app.services.file_service import FileService
 from app.models import Chat
 from app.config import settings
 from botocore.config import Config
 from app.schemas.file import PresignByKeyReq, ConfirmReq
-from app.utils.dependencies import get_current_user
+from app.utils.dependencies import get_current_principal
 from app.models.file import File, FileStatus
 from fastapi import File as FastAPIFile, APIRouter
 from fastapi import BackgroundTasks
@@ -22,10 +22,13 @@ from uuid import UUID
 import asyncio
 from fastapi import HTTPException, Depends
 from sqlalchemy import update, and_, select, delete
+from sqlalchemy.orm import aliased
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import File, Chat
 from app.utils.s3_utils import _norm_uuid_list
-from app.services.ingest_from_s3 import ingest_file_s3
+from app.models.ingest_job import IngestJob
+from app.services.answer_cache import bump_corpus_version
+from app.services.ingest_queue import enqueue_ingest, ingest_pool
 
 router = APIRouter(prefix="/file", tags=["File Upload"])
 
@@ -79,7 +82,7 @@ async def delete_file(file_id: UUID, session: AsyncSession = Depends(get_db)):
 async def presign_by_key(
         req: PresignByKeyReq,
         db: AsyncSession = Depends(get_db),
-        user=Depends(get_current_user)
+        user=Depends(get_current_principal)
 ):
     # _validate(str(user.id), req.key, req.contentType, req.size)
     key = f"uploads/{user.id}/{uuid4()}.pdf"
@@ -143,7 +146,7 @@ ETAG_RE = re.compile(r'^"?([0-9a-fA-F]{32}(-\d+)?)"?$')
 async def confirm(
         body: ConfirmReq,
         db: AsyncSession = Depends(get_db),
-        user=Depends(get_current_user),
+        user=Depends(get_current_principal),
         background: BackgroundTasks = None,
 ):
     try:
@@ -176,32 +179,59 @@ async def confirm(
         f.filetype = body.mime
         f.url = body.s3_url
         f.status = FileStatus.uploaded
-
+        job_id = await enqueue_ingest(db, f.id)
 
         await db.commit()
         await db.refresh(f)
     except Exception:
         raise HTTPException(500, "DB commit failed")
+    ingest_pool.notify()
 
-    return {"id": str(f.id), "status": f.status}
+    return {"id": str(f.id), "status": f.status, "job_id": str(job_id)}
 
 @router.post("/ingest/{file_id}")
 async def ingest_now(
     file_id: UUID,
     db: AsyncSession = Depends(get_db),
 ):
-
-    await ingest_file_s3(str(file_id), db)
-
+    """Queue an ingest of the file and return at once; poll GET /file/jobs/{job_id}."""
     f = await db.get(File, file_id)
     if not f:
-        raise HTTPException(status_code=404, detail="File not found after ingest")
+        raise HTTPException(status_code=404, detail="File not found")
+
+    job_id = await enqueue_ingest(db, f.id)
+    await db.commit()
+    ingest_pool.notify()
 
-    return {"id": str(file_id), "status": getattr(f, "status", None)}
+    return {"id": str(file_id), "status": f.status, "job_id": str(job_id)}
+
+
+@router.get("/jobs/{job_id}", response_model=IngestJobOut)
+async def get_ingest_job(job_id: UUID, db: AsyncSession = Depends(get_db), user=Depends(get_current_principal)):
+    job = (await db.execute(
+        select(IngestJob)
+        .join(File, File.id == IngestJob.file_id)
+        .where(IngestJob.id == job_id, File.key.startswith(f"uploads/{user.id}/"))
+    )).scalar_one_or_none()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/{file_id}/ingest-stats", response_model=IngestStatsOut)
+async def get_ingest_stats(file_id: UUID, db: AsyncSession = Depends(get_db), user=Depends(get_current_principal)):
+    """Stage timings and counts of the file's last ingest (see IngestStats)."""
+    row = (await db.execute(
+        select(File.id, File.status, File.ingest_stats)
+        .where(File.id == file_id, File.key.startswith(f"uploads/{user.id}/"))
+    )).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="File not found")
+    return IngestStatsOut(file_id=row.id, status=row.status, ingest_stats=row.ingest_stats)
 
 
 @router.post("/attach")
-async def attach_files(req: AttachReq, db: AsyncSession=Depends(get_db), user=Depends(get_current_user)):
+async def attach_files(req: AttachReq, db: AsyncSession=Depends(get_db), user=Depends(get_current_principal)):
     chat_id = req.chat_id if isinstance(req.chat_id, uuid.UUID) else uuid.UUID(str(req.chat_id))
     file_ids = _norm_uuid_list(req.file_ids)
 
@@ -212,27 +242,42 @@ async def attach_files(req: AttachReq, db: AsyncSession=Depends(get_db), user=De
     if not file_ids:
         return {"updated": 0, "attached_ids": []}
 
+    prev = aliased(File, name="prev")  # the row as it was, for the chat the file leaves
     stmt = (
         update(File)
         .where(
             and_(
                 File.id.in_(file_ids),
                 File.key.startswith(f"uploads/{user.id}/"),
+                prev.id == File.id,
             )
         )
         .values(chat_id=chat_id)
-        .returning(File.id)
+        .returning(File.id, File.status, prev.chat_id.label("old_chat_id"))
         .execution_options(synchronize_session=False)
     )
 
     res = await db.execute(stmt)
-    attached_ids = res.scalars().all()
+    rows = res.all()
+    attached_ids = [r.id for r in rows]
+    # both chats' documents changed: drop their cached answers and lexical indexes now,
+    # not when the re-index finishes (the chat the file left is never re-indexed)
+    if rows:
+        for changed in sorted({chat_id, *(r.old_chat_id for r in rows)} - {None}, key=str):
+            await bump_corpus_version(db, changed)
+    # re-index uploaded files so their chunks carry the chat_id; not-yet-uploaded ones get a job on confirm
+    job_ids = {
+        str(r.id): str(await enqueue_ingest(db, r.id))
+        for r in rows if r.status != FileStatus.requested
+    }
     await db.commit()
+    if job_ids:
+        ingest_pool.notify()
 
-    return {"updated": len(attached_ids), "attached_ids": attached_ids}
+    return {"updated": len(attached_ids), "attached_ids": attached_ids, "job_ids": job_ids}
 
 @router.post("/discard")
-async def discard_files(req: DiscardReq, db: AsyncSession=Depends(get_db), user=Depends(get_current_user)):
+async def discard_files(req: DiscardReq, db: AsyncSession=Depends(get_db), user=Depends(get_current_principal)):
     if not req.file_ids:
         return {"deleted": 0}
 
@@ -1,15 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 from datetime import datetime, timezone
 
-from app.schemas.message import MessageCreate, MessageResponse
+from app.schemas.message import MessageCreate, MessageResponse, MessagePage
 from app.models.message import Message
 from app.models.chat import Chat
-from app.models.user import User
-from app.utils.dependencies import get_db, get_current_user
-from app.utils.dependencies import get_current_user
+from app.services.auth_cache import Principal
+from app.utils.dependencies import get_db, get_current_principal
+from app.utils.pagination import NEWEST_FIRST, keyset_page, split_page
 
 from app.models.message import RoleType
 
@@ -19,7 +21,7 @@ router = APIRouter(prefix="/message", tags=["Messages"])
 async def send_message(
     msg: MessageCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     chat = await db.get(Chat, msg.chat_id)
     if not chat or chat.user_id != current_user.id:
@@ -37,19 +39,22 @@ async def send_message(
     await db.refresh(new_msg)
     return new_msg
 
-@router.get("/{chat_id}", response_model=list[MessageResponse])
+@router.get("/{chat_id}", response_model=MessagePage)
 async def get_messages_by_chat(
     chat_id: UUID,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    order: Literal["desc", "asc"] = NEWEST_FIRST,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     chat = await db.get(Chat, chat_id)
     if not chat or chat.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    result = await db.execute(
-        select(Message).where(Message.chat_id == chat_id).order_by(Message.created_at.asc())
-    )
-    messages = result.scalars().all()
-    return messages
-
+    result = await db.execute(keyset_page(
+        select(Message).where(Message.chat_id == chat_id),
+        Message.created_at, Message.id, cursor, limit, order,
+    ))
+    messages, next_cursor = split_page(result.scalars().all(), limit, "created_at")
+    return MessagePage(items=messages, next_cursor=next_cursor)
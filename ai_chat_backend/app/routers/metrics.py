@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from app.utils import metrics
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
@@ -3,9 +3,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from uuid import UUID
 
-from app.models import Note, Chat, User
+from app.models import Note, Chat
 from app.schemas.note import NoteUpdate, NoteResponse
-from app.utils.dependencies import get_db, get_current_user
+from app.services.auth_cache import Principal
+from app.utils.dependencies import get_db, get_current_principal
 
 router = APIRouter(prefix="/note", tags=["Note"])
 
@@ -13,7 +14,7 @@ router = APIRouter(prefix="/note", tags=["Note"])
 async def get_note_by_chat_id(
     chat_id: UUID,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     result = await db.execute(
         select(Note).where(Note.chat_id == chat_id)
@@ -34,7 +35,7 @@ async def update_note(
     id: UUID,
     note_update: NoteUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     note = await db.get(Note, id)
     if not note:
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, ConfigDict
 from uuid import UUID
 from datetime import datetime
+from typing import List, Optional
 
 class ChatAskRequest(BaseModel):
     chat_id: UUID
@@ -12,3 +13,6 @@ class ChatSummary(BaseModel):  # dùng thay ChatListItem nếu muốn
     title: str
     updated_at: datetime
 
+class ChatPage(BaseModel):
+    items: List[ChatSummary]
+    next_cursor: Optional[str] = None
@@ -33,3 +33,21 @@ class AttachReq(BaseModel):
 
 class DiscardReq(BaseModel):
     file_ids: list[UUID]
+
+class IngestJobOut(BaseModel):
+    id: UUID
+    file_id: UUID
+    status: str
+    attempts: int
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+class IngestStatsOut(BaseModel):
+    file_id: UUID
+    status: str
+    ingest_stats: dict | None = None  # None until an ingest of the file has finished or failed
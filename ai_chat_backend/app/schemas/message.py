@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 from datetime import datetime
 from enum import Enum
@@ -22,6 +22,10 @@ class MessageResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class MessagePage(BaseModel):
+    items: List[MessageResponse]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page; None on the last one
+
 class MessageOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     id: UUID
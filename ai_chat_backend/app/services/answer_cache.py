@@ -0,0 +1,118 @@
+# app/services/answer_cache.py
+"""
+Semantic answer cache: (chat_id, corpus_version, history digest) -> recent (query embedding,
+answer) pairs. A lookup hits when a cached query's cosine similarity reaches
+ANSWER_CACHE_THRESHOLD.
+
+Answers are generated at temperature=0, so a repeated question over an unchanged corpus,
+after the same conversation, gets the same answer. The history is part of the key because a
+follow-up ("and the second one?") means something else after a different exchange. Chat.corpus_version is bumped in the DB when a file in the chat is
+indexed or deleted, which invalidates the entries in every worker.
+"""
+import hashlib
+import json
+import threading
+from typing import List, Optional
+from uuid import UUID
+
+import numpy as np
+from cachetools import TTLCache
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.chat import Chat
+from app.utils import metrics
+
+
+class _ChatEntries:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.vectors: Optional[np.ndarray] = None  # (n, dim) unit rows
+        self.answers: List[str] = []
+
+    def add(self, vec: np.ndarray, answer: str) -> None:
+        row = vec[None, :]
+        self.vectors = row if self.vectors is None else np.vstack([self.vectors, row])[-self.capacity:]
+        self.answers = (self.answers + [answer])[-self.capacity:]
+
+    def best(self, vec: np.ndarray) -> tuple[float, Optional[str]]:
+        if self.vectors is None:
+            return 0.0, None
+        sims = self.vectors @ vec
+        idx = int(np.argmax(sims))
+        return float(sims[idx]), self.answers[idx]
+
+
+def _unit(embedding: List[float]) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def history_digest(history: Optional[list]) -> str:
+    """Key part for the history an answer was generated after; "" for a history-free ask."""
+    if not history:
+        return ""
+    raw = json.dumps(history, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float, max_chats: int, per_chat: int, ttl_s: int):
+        self.threshold = threshold
+        self.per_chat = per_chat
+        self._entries: TTLCache = TTLCache(maxsize=max_chats, ttl=ttl_s)
+        self._lock = threading.Lock()
+        self._hits = metrics.counter("answer_cache_hits")
+        self._misses = metrics.counter("answer_cache_misses")
+
+    def lookup(self, chat_id, corpus_version: int, embedding: List[float], history: str = "") -> Optional[str]:
+        with self._lock:
+            entries = self._entries.get((str(chat_id), corpus_version, history))
+            score, answer = entries.best(_unit(embedding)) if entries else (0.0, None)
+        if answer is not None and score >= self.threshold:
+            self._hits.inc()
+            return answer
+        self._misses.inc()
+        return None
+
+    def store(self, chat_id, corpus_version: int, embedding: List[float], answer: str,
+              history: str = "") -> None:
+        key = (str(chat_id), corpus_version, history)
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries is None:
+                entries = self._entries[key] = _ChatEntries(self.per_chat)
+            entries.add(_unit(embedding), answer)
+
+    def drop(self, chat_id) -> None:
+        chat_key = str(chat_id)
+        with self._lock:
+            for key in [k for k in self._entries.keys() if k[0] == chat_key]:
+                self._entries.pop(key, None)
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=settings.ANSWER_CACHE_THRESHOLD,
+    max_chats=settings.ANSWER_CACHE_MAX_CHATS,
+    per_chat=settings.ANSWER_CACHE_PER_CHAT,
+    ttl_s=settings.ANSWER_CACHE_TTL_S,
+)
+
+
+async def bump_corpus_version(db: AsyncSession, chat_id: UUID | None) -> None:
+    """
+    Invalidate cached answers for a chat whose documents changed.
+    Runs in the caller's transaction; the caller commits. updated_at is kept as it is: the
+    chat list is ordered by it, and an ingest is not chat activity.
+    """
+    if chat_id is None:
+        return
+    await db.execute(
+        update(Chat)
+        .where(Chat.id == chat_id)
+        .values(corpus_version=Chat.corpus_version + 1, updated_at=Chat.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    answer_cache.drop(chat_id)
@@ -0,0 +1,237 @@
+# app/services/auth_cache.py
+"""
+Cache behind get_current_user / get_current_principal, so an authenticated request needs
+neither a JWT decode nor a users lookup when the same token and user were seen recently.
+
+- Tokens: decoded claims keyed by sha256(token), in process only (a Redis round trip costs
+  more than the decode), kept until AUTH_CACHE_TTL_S or the token's exp, whichever is first
+- Users: a Principal snapshot per user id
+  - Tier 1: bounded in-process LRU with TTL
+  - Tier 2 (optional): Redis, shared by every worker, when REDIS_URL is set
+- Invalidation: a User updated (email, name, avatar) or deleted through the ORM is dropped
+  from this process and from Redis once its transaction commits; copies in other workers'
+  memory lapse within AUTH_CACHE_TTL_S.
+AUTH_CACHE_TTL_S=0 turns the cache off.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from cachetools import TTLCache
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from app.config import settings
+from app.models.user import User
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+_SNAPSHOT_FIELDS = ("email", "name", "avatar")  # changes to these invalidate a cached Principal
+_PENDING_KEY = "auth_cache_invalidate"
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as most endpoints need it: identity, no ORM session attached."""
+    id: UUID
+    email: str
+    name: Optional[str]
+    avatar: Optional[str]
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(id=user.id, email=user.email, name=user.name, avatar=user.avatar, created_at=user.created_at)
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data["id"] = str(self.id)
+        data["created_at"] = self.created_at.isoformat() if self.created_at else None
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw) -> "Principal":
+        data = json.loads(raw)
+        data["id"] = UUID(data["id"])
+        data["created_at"] = datetime.fromisoformat(data["created_at"]) if data["created_at"] else None
+        return cls(**data)
+
+
+class AuthCache:
+    def __init__(self, maxsize: int = 10_000, ttl_s: int = 30, redis_url: str = ""):
+        self.ttl_s = ttl_s
+        self.enabled = ttl_s > 0
+        ttl = max(ttl_s, 1)
+        self._tokens: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._users: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._redis = None
+        self._aredis = None
+        if redis_url and self.enabled:
+            import redis
+            import redis.asyncio as aredis
+            self._redis = redis.Redis.from_url(redis_url)
+            self._aredis = aredis.Redis.from_url(redis_url)
+        self._pending_deletes: set = set()  # keeps fire-and-forget Redis deletes alive
+
+        self._token_hits = metrics.counter("auth_cache_hits", kind="token", tier="memory")
+        self._token_misses = metrics.counter("auth_cache_misses", kind="token")
+        self._hits_memory = metrics.counter("auth_cache_hits", kind="user", tier="memory")
+        self._hits_redis = metrics.counter("auth_cache_hits", kind="user", tier="redis")
+        self._misses = metrics.counter("auth_cache_misses", kind="user")
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _user_key(user_id) -> str:
+        return f"auth:user:{user_id}"
+
+    # -----------------------
+    # Tokens
+    # -----------------------
+
+    def get_claims(self, token: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        key = self._token_key(token)
+        with self._lock:
+            entry = self._tokens.get(key)
+        if entry is not None:
+            claims, expires_at = entry
+            if expires_at is None or time.time() < expires_at:
+                self._token_hits.inc()
+                return claims
+            with self._lock:
+                self._tokens.pop(key, None)
+        self._token_misses.inc()
+        return None
+
+    def put_claims(self, token: str, claims: dict) -> None:
+        if not self.enabled:
+            return
+        exp = claims.get("exp")
+        with self._lock:
+            self._tokens[self._token_key(token)] = (claims, float(exp) if exp is not None else None)
+
+    # -----------------------
+    # Users
+    # -----------------------
+
+    async def get_principal(self, user_id: UUID) -> Optional[Principal]:
+        if not self.enabled:
+            return None
+        key = self._user_key(user_id)
+        with self._lock:
+            principal = self._users.get(key)
+        if principal is not None:
+            self._hits_memory.inc()
+            return principal
+
+        if self._aredis is not None:
+            try:
+                raw = await self._aredis.get(key)
+            except Exception:
+                logger.warning("auth cache: redis get failed", exc_info=True)
+                raw = None
+            if raw:
+                self._hits_redis.inc()
+                principal = Principal.from_json(raw)
+                with self._lock:
+                    self._users[key] = principal
+                return principal
+
+        self._misses.inc()
+        return None
+
+    async def put_principal(self, principal: Principal) -> None:
+        if not self.enabled:
+            return
+        key = self._user_key(principal.id)
+        with self._lock:
+            self._users[key] = principal
+        if self._aredis is not None:
+            try:
+                await self._aredis.set(key, principal.to_json(), ex=self.ttl_s)
+            except Exception:
+                logger.warning("auth cache: redis set failed", exc_info=True)
+
+    def invalidate(self, user_id) -> None:
+        key = self._user_key(user_id)
+        with self._lock:
+            self._users.pop(key, None)
+        if self._redis is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # no event loop: a script or the ingest worker's thread
+            try:
+                self._redis.delete(key)
+            except Exception:
+                logger.warning("auth cache: redis delete failed", exc_info=True)
+            return
+        task = loop.create_task(self._adelete(key))
+        self._pending_deletes.add(task)
+        task.add_done_callback(self._pending_deletes.discard)
+
+    async def _adelete(self, key: str) -> None:
+        try:
+            await self._aredis.delete(key)
+        except Exception:
+            logger.warning("auth cache: redis delete failed", exc_info=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+
+
+auth_cache = AuthCache(
+    maxsize=settings.AUTH_CACHE_SIZE,
+    ttl_s=settings.AUTH_CACHE_TTL_S,
+    redis_url=settings.REDIS_URL,
+)
+
+
+# -----------------------
+# Invalidation on User changes
+# -----------------------
+
+def _mark(target: User) -> None:
+    session = object_session(target)
+    if session is None:
+        auth_cache.invalidate(target.id)
+    else:
+        session.info.setdefault(_PENDING_KEY, set()).add(target.id)
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target: User) -> None:
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in _SNAPSHOT_FIELDS):
+        _mark(target)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target: User) -> None:
+    _mark(target)
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_committed(session: Session) -> None:
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        auth_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
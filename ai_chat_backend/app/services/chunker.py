@@ -0,0 +1,245 @@
+# app/services/chunker.py
+"""
+Token-budgeted, structure-aware chunking.
+
+Pages are split into blocks (paragraphs, headings, tables) and packed into chunks of at most
+CHUNK_TOKENS tokens of the embedding model's tokenizer:
+- A block is never cut while it fits in a chunk; an oversized one is split at sentence (or,
+  for tables, row) boundaries, and a single oversized sentence at token boundaries.
+- A heading starts a new chunk once the current one is half full, and so does a page break.
+- Consecutive chunks share up to CHUNK_OVERLAP_TOKENS of whole trailing sentences; no overlap
+  is carried across a heading.
+Each block is encoded once and every piece of text is copied into at most two chunks, so the
+cost is linear in the input. iter_stream_chunks takes the text in fragments of any size and
+holds back only the paragraph still open.
+"""
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import tiktoken
+
+from app.config import settings
+
+ENCODING_NAME = "cl100k_base"  # text-embedding-3-*
+PAGE_BREAK = "\f"
+BLOCK_SEPARATOR = "\n\n"
+
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+_HEADING = re.compile(r"#{1,6}\s+\S|(\d+(\.\d+)*\.?|[IVXLC]+\.)\s+[A-Z]\S*|[A-Z][A-Z0-9 ,:&'()\-]{2,79}$")
+_ROW_END = re.compile(r"\n")
+_TABLE_ROW = re.compile(r"\|.*\||\S\t+\S")
+
+TEXT, HEADING, TABLE = "text", "heading", "table"
+_PAGE_END = None  # between the blocks of two pages
+_MAX_PENDING = 1 << 20  # chars of one unterminated paragraph held by iter_stream_chunks
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> tiktoken.Encoding:
+    # loaded on first use: tiktoken may have to fetch the BPE file
+    return tiktoken.get_encoding(ENCODING_NAME)
+
+
+def _spans(text: str, boundary: re.Pattern) -> Iterator[str]:
+    """Slices of `text` ending after each `boundary` match, the separator kept with the slice."""
+    start = 0
+    for m in boundary.finditer(text):
+        if m.end() > start:
+            yield text[start:m.end()]
+            start = m.end()
+    if start < len(text):
+        yield text[start:]
+
+
+def _blocks(page: str) -> Iterator[Tuple[str, str]]:
+    """(kind, text) per paragraph of a page; a heading line leading a paragraph is its own block."""
+    for para in _spans(page, _PARAGRAPH_BREAK):
+        para = para.strip()
+        if not para:
+            continue
+        first, _, rest = para.partition("\n")
+        first = first.strip()
+        if len(first) <= 80 and _HEADING.match(first) and not first.endswith((".", ",", ";", ":")):
+            yield HEADING, first
+            para = rest.strip()
+            if not para:
+                continue
+        lines = para.split("\n")
+        if len(lines) > 1 and sum(1 for line in lines if _TABLE_ROW.search(line)) * 2 > len(lines):
+            yield TABLE, para
+        else:
+            yield TEXT, para
+
+
+def _fit(kind: str, text: str, max_tokens: int) -> Iterator[Tuple[str, int]]:
+    """
+    (piece, tokens) no larger than max_tokens: the block itself, or its rows/sentences/token
+    windows. Pieces carry their leading separator, so a chunk is their concatenation.
+    """
+    enc = _encoding()
+    n = len(enc.encode(text, disallowed_special=()))
+    if n <= max_tokens:
+        yield BLOCK_SEPARATOR + text, n
+        return
+    parts = _spans(text, _ROW_END) if kind == TABLE else _spans(text, _SENTENCE_END)
+    sep = BLOCK_SEPARATOR
+    for part in parts:
+        tokens = enc.encode(part, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            yield sep + part, len(tokens)
+        else:
+            for i in range(0, len(tokens), max_tokens):
+                window = tokens[i:i + max_tokens]
+                yield (sep if i == 0 else "") + enc.decode(window), len(window)
+        sep = ""
+
+
+def _tail(units: List[Tuple[str, int]], overlap_tokens: int) -> List[Tuple[str, int]]:
+    """The trailing whole sentences of a chunk that fit in overlap_tokens."""
+    if overlap_tokens <= 0 or not units:
+        return []
+    enc = _encoding()
+    carried: List[Tuple[str, int]] = []
+    used = 0
+    for text, n in reversed(units):
+        if used + n <= overlap_tokens:
+            carried.append((text, n))
+            used += n
+            continue
+        # the unit is too big to carry whole: take its last sentences
+        for sentence in reversed(list(_spans(text, _SENTENCE_END))):
+            m = len(enc.encode(sentence, disallowed_special=()))
+            if used + m > overlap_tokens:
+                break
+            carried.append((sentence, m))
+            used += m
+        break
+    carried.reverse()
+    return carried
+
+
+def _paged(pages: Iterable[str]) -> Iterator[Optional[Tuple[str, str]]]:
+    for page in pages:
+        yield from _blocks(page)
+        yield _PAGE_END
+
+
+def _streamed(fragments: Iterable[str]) -> Iterator[Optional[Tuple[str, str]]]:
+    """
+    Blocks of text arriving in arbitrary fragments, PAGE_BREAK between pages. Only the
+    paragraph still open is held back, so a fragment is cut where the whole text would be.
+    """
+    pending = ""
+    for fragment in fragments:
+        *closed, fragment = fragment.split(PAGE_BREAK)
+        for tail in closed:
+            yield from _blocks(pending + tail)
+            yield _PAGE_END
+            pending = ""
+        # a paragraph break may straddle the previous fragment's trailing whitespace
+        start = len(pending.rstrip())
+        pending += fragment
+        last = None
+        for last in _PARAGRAPH_BREAK.finditer(pending, max(start - 1, 0)):
+            pass
+        if last is not None:
+            yield from _blocks(pending[:last.end()])
+            pending = pending[last.end():]
+        elif len(pending) > _MAX_PENDING:  # no paragraph break in sight: don't buffer without bound
+            yield from _blocks(pending)
+            pending = ""
+    yield from _blocks(pending)
+    yield _PAGE_END
+
+
+def _pack(
+        blocks: Iterable[Optional[Tuple[str, str]]],
+        max_tokens: Optional[int],
+        overlap_tokens: Optional[int],
+) -> Iterator[str]:
+    max_tokens = max_tokens or settings.CHUNK_TOKENS
+    overlap_tokens = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    if not 0 <= overlap_tokens < max_tokens:
+        raise ValueError("overlap_tokens must be in [0, max_tokens)")
+
+    units: List[Tuple[str, int]] = []  # pieces of the chunk being built
+    carried = 0  # how many of the leading units are overlap from the previous chunk
+    used = 0  # tokens in units
+    fresh = 0  # tokens in units that are not overlap
+    heading_last = False  # the last unit is a heading no text follows yet
+
+    def flush(carry: bool) -> Iterator[str]:
+        nonlocal units, carried, used, fresh
+        chunk = "".join(text for text, _ in units).strip()
+        if chunk:
+            yield chunk
+        units = _tail(units, overlap_tokens) if carry else []
+        carried = len(units)
+        used = sum(n for _, n in units)
+        fresh = 0
+
+    half = max_tokens // 2
+    for block in blocks:
+        if block is _PAGE_END:
+            if fresh >= half:
+                yield from flush(carry=True)
+            continue
+        kind, text = block
+        if kind == HEADING:
+            if fresh >= half:
+                yield from flush(carry=False)
+            elif not fresh:  # only overlap so far: a section starts clean
+                units, carried, used = [], 0, 0
+        for piece, n in _fit(kind, text, max_tokens):
+            if fresh and used + n > max_tokens:
+                if heading_last and fresh > units[-1][1]:
+                    # don't end a chunk on a heading: it opens the next one, without overlap
+                    heading = units.pop()
+                    yield from flush(carry=False)
+                    units, used, fresh = [heading], heading[1], heading[1]
+                else:
+                    yield from flush(carry=True)
+            while carried and used + n > max_tokens:  # drop overlap the piece has no room for
+                used -= units.pop(0)[1]
+                carried -= 1
+            if fresh and used + n > max_tokens:  # a lone heading before a near-full piece
+                yield from flush(carry=False)
+            units.append((piece, n))
+            used += n
+            fresh += n
+            heading_last = kind == HEADING
+    if fresh:
+        yield from flush(carry=False)
+
+
+def iter_chunks(
+        pages: Iterable[str],
+        max_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+) -> Iterator[str]:
+    """Chunks of the text of `pages`, in order, as they are produced."""
+    return _pack(_paged(pages), max_tokens, overlap_tokens)
+
+
+def iter_stream_chunks(
+        fragments: Iterable[str],
+        max_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Chunks of a text read in pieces of any size, pages separated by PAGE_BREAK; the same
+    chunks as iter_chunks over the whole text split into pages.
+    """
+    return _pack(_streamed(fragments), max_tokens, overlap_tokens)
+
+
+def count_tokens(texts: Iterable[str]) -> int:
+    enc = _encoding()
+    return sum(len(enc.encode(text, disallowed_special=())) for text in texts)
+
+
+def chunk_text(text: str, max_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None) -> List[str]:
+    """All chunks of `text` at once; pages are separated by form feeds."""
+    return list(iter_chunks(text.split(PAGE_BREAK), max_tokens, overlap_tokens))
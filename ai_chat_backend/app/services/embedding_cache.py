@@ -0,0 +1,159 @@
+# app/services/embedding_cache.py
+"""
+Query-embedding cache in front of the LangChain embeddings used by the vector store.
+
+- Key: model + normalized query text (trimmed, whitespace-collapsed, casefolded); a miss
+  embeds the text as given, so the first spelling of a question is the one that is embedded
+- Tier 1: bounded in-process LRU with TTL
+- Tier 2 (optional): Redis, shared by every worker, when REDIS_URL is set
+Only single queries are cached; document batches at ingest time pass straight through.
+"""
+import hashlib
+import logging
+import re
+import threading
+from array import array
+from typing import List, Optional
+
+from cachetools import TTLCache
+from langchain_core.embeddings import Embeddings
+
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    return _WS_RE.sub(" ", text).strip().casefold()
+
+
+def _pack(vec: List[float]) -> bytes:
+    return array("f", vec).tobytes()
+
+
+def _unpack(raw: bytes) -> List[float]:
+    vec = array("f")
+    vec.frombytes(raw)
+    return vec.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(
+            self,
+            inner: Embeddings,
+            model: str,
+            maxsize: int = 2048,
+            ttl_s: int = 3600,
+            redis_url: str = "",
+    ):
+        self.inner = inner
+        self.model = model
+        self.ttl_s = ttl_s
+        self._local: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl_s)
+        self._lock = threading.Lock()
+        self._redis = None
+        self._aredis = None
+        if redis_url:
+            import redis
+            import redis.asyncio as aredis
+            self._redis = redis.Redis.from_url(redis_url)
+            self._aredis = aredis.Redis.from_url(redis_url)
+
+        self._hits_memory = metrics.counter("embedding_cache_hits", tier="memory")
+        self._hits_redis = metrics.counter("embedding_cache_hits", tier="redis")
+        self._misses = metrics.counter("embedding_cache_misses")
+
+    def stats(self) -> dict:
+        return {
+            "hits_memory": self._hits_memory.value,
+            "hits_redis": self._hits_redis.value,
+            "misses": self._misses.value,
+            "size": len(self._local),
+        }
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+        return f"emb:{self.model}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vec = self._local.get(key)
+        if vec is not None:
+            self._hits_memory.inc()
+        return vec
+
+    def _put_local(self, key: str, vec: List[float]) -> None:
+        with self._lock:
+            self._local[key] = vec
+
+    # -----------------------
+    # Sync
+    # -----------------------
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vec = self._get_local(key)
+        if vec is not None:
+            return vec
+
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(key)
+            except Exception:
+                logger.warning("embedding cache: redis get failed", exc_info=True)
+                raw = None
+            if raw:
+                self._hits_redis.inc()
+                vec = _unpack(raw)
+                self._put_local(key, vec)
+                return vec
+
+        self._misses.inc()
+        vec = self.inner.embed_query(text)
+        self._put_local(key, vec)
+        if self._redis is not None:
+            try:
+                self._redis.set(key, _pack(vec), ex=self.ttl_s)
+            except Exception:
+                logger.warning("embedding cache: redis set failed", exc_info=True)
+        return vec
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    # -----------------------
+    # Async
+    # -----------------------
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vec = self._get_local(key)
+        if vec is not None:
+            return vec
+
+        if self._aredis is not None:
+            try:
+                raw = await self._aredis.get(key)
+            except Exception:
+                logger.warning("embedding cache: redis get failed", exc_info=True)
+                raw = None
+            if raw:
+                self._hits_redis.inc()
+                vec = _unpack(raw)
+                self._put_local(key, vec)
+                return vec
+
+        self._misses.inc()
+        vec = await self.inner.aembed_query(text)
+        self._put_local(key, vec)
+        if self._aredis is not None:
+            try:
+                await self._aredis.set(key, _pack(vec), ex=self.ttl_s)
+            except Exception:
+                logger.warning("embedding cache: redis set failed", exc_info=True)
+        return vec
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.inner.aembed_documents(texts)
@@ -1,9 +1,16 @@
+import asyncio
+import logging
 import os
 from uuid import UUID
 from sqlalchemy import select
 from app.models.file import File
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
+from app.services.answer_cache import bump_corpus_version
+from app.services.ingest_from_s3 import stored_in
+from app.services.rag_store import delete_file_vectors
+
+logger = logging.getLogger(__name__)
 
 
 class FileService:
@@ -28,6 +35,12 @@ class FileService:
         if db_file.url and os.path.exists(db_file.url):
             os.remove(db_file.url)
 
+        try:
+            await asyncio.to_thread(delete_file_vectors, db_file.id, stored_in(db_file.chat_id, db_file.ingest_stats))
+        except Exception:
+            logger.warning("failed to delete vectors for file_id=%s", db_file.id, exc_info=True)
+
         await session.delete(db_file)
+        await bump_corpus_version(session, db_file.chat_id)
         await session.commit()
         return db_file
@@ -1,27 +1,49 @@
 """
 Ingest pipeline:
 - Resolve (bucket, key) from file.url or file.key
-- Download bytes from S3
-- Extract text by MIME
-- Chunk → Embed → Upsert vector store
+- Reuse the chunks/vectors of an indexed file with the same content, if there is one
+- Stream the object from S3 into a temp file
+- Extract text by MIME → Chunk → Embed → Upsert vector store, as a pipeline of bounded stages;
+  each batch's lexical rows are committed on their own, so no transaction spans the document
 - Update DB status: processing → indexed/failed
 """
 
 from __future__ import annotations
+import asyncio
+import codecs
+import hashlib
 import io
 import logging
-from typing import Iterable, List, Tuple
-from uuid import UUID
+import os
+import time
+from contextlib import aclosing, closing, contextmanager
+from dataclasses import dataclass, field
+from collections import Counter
+from typing import (
+    IO, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple,
+    TypeVar, Union,
+)
+from uuid import UUID, uuid5
 import boto3
+import openai
 from botocore.config import Config
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, exists, insert, select
 from fastapi import HTTPException, Depends
-from PyPDF2 import PdfReader
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception, stop_after_attempt, wait_random_exponential
 from app.config import settings
 from app.models.file import File, FileStatus
-from app.services.rag_store import get_vectorstore  # vector store đã có
-from app.utils.s3_utils import parse_s3_url, s3_download_bytes
+from app.models.file_chunk import FileChunk
+from app.services.chunker import PAGE_BREAK, count_tokens, iter_stream_chunks
+from app.services.pdf_extract import PAGE_SEPARATOR, iter_pages_inline, iter_pdf_pages
+from app.services.rag_store import (  # vector store đã có
+    delete_file_vectors, delete_vectors, fetch_vectors, get_embeddings, upsert_vectors,
+)
+from app.services.answer_cache import bump_corpus_version
+from app.services.lexical_index import copy_chunks, drop_chunks, store_chunks
+from app.utils import metrics
+from app.utils.s3_utils import STREAM_CHUNK, parse_s3_url, s3_download_to_tempfile, s3_head
+from app.utils.streams import batched, iterate_blocking, iterate_in_thread
 
 from app.utils.dependencies import get_db
 
@@ -32,112 +54,714 @@ logging.basicConfig(
 
 logger = logging.getLogger("ingest")
 logger.setLevel(logging.INFO)
+
+# per-stage limits shared by every ingest running in this process
+_stage_limits = {
+    "download": asyncio.Semaphore(settings.INGEST_DOWNLOAD_CONCURRENCY),
+    "extract": asyncio.Semaphore(settings.INGEST_EXTRACT_CONCURRENCY),
+    "embed": asyncio.Semaphore(settings.INGEST_EMBED_CONCURRENCY),
+}
+_THROUGHPUT_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+_TEXT_BLOCK = 1 << 16  # bytes per read when decoding a text file
+_BYTES_BUCKETS = tuple(2 ** i * 1024 for i in range(0, 20, 2))  # 1 KiB .. 256 MiB
+_COUNT_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+T = TypeVar("T")
 # -----------------------
 # Extraction
 # -----------------------
 
-def extract_text(data: bytes, mime: str) -> str:
+def _iter_decoded(stream: IO[bytes]) -> Iterator[str]:
+    stream.seek(0)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    for block in iter(lambda: stream.read(_TEXT_BLOCK), b""):
+        text = decoder.decode(block)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def iter_text(source: Union[bytes, IO[bytes]], mime: str) -> Iterator[str]:
     """
     Route by MIME. Keep it simple now; swap in better libs later.
-    - application/pdf: PyPDF2/fitz
+    - application/pdf: PyPDF2, page ranges on the process pool when `source` is a named file
     - text/plain, text/markdown: decode utf-8
     - application/vnd.openxmlformats-officedocument.wordprocessingml.document: python-docx
-    Return plain text (str).
+    `source` is raw bytes or a seekable binary file (the spooled download), which is parsed
+    in place instead of being copied into memory first.
+    Yields the text in fragments as it is extracted (pages, paragraphs or decoded blocks),
+    with PAGE_SEPARATOR between pages.
     """
+    stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
     if mime == "application/pdf":
-        # Minimal extractor via PyPDF2
-        reader = PdfReader(io.BytesIO(data))
-        pages = []
-        for pg in reader.pages:
-            try:
-                pages.append(pg.extract_text() or "")
-            except Exception:
-                pages.append("")
-        return "\n\n".join(pages)
-
-    if mime in ("text/plain", "text/markdown"):
-        return data.decode("utf-8", errors="ignore")
+        path = getattr(stream, "name", None)
+        if isinstance(path, str) and os.path.isfile(path):
+            stream.flush()
+            pages = iter_pdf_pages(path)
+        else:
+            pages = iter_pages_inline(stream)
+        with closing(pages):
+            for i, page in enumerate(pages):
+                if i:
+                    yield PAGE_SEPARATOR
+                yield page
+        return
 
     if mime in ("application/msword",
                 "application/vnd.openxmlformats-officedocument.wordprocessingml.document"):
         try:
             import docx
-            doc = docx.Document(io.BytesIO(data))
-            return "\n".join(p.text or "" for p in doc.paragraphs)
+            doc = docx.Document(stream)
         except Exception:
             # fallback: best-effort decode
-            return data.decode("utf-8", errors="ignore")
+            yield from _iter_decoded(stream)
+            return
+        for i, p in enumerate(doc.paragraphs):
+            yield ("\n\n" if i else "") + (p.text or "")
+        return
 
-    # Default fallback
-    return data.decode("utf-8", errors="ignore")
+    # text/plain, text/markdown and the default fallback
+    yield from _iter_decoded(stream)
 
 
-# -----------------------
-# Chunking
-# -----------------------
+def extract_text(source: Union[bytes, IO[bytes]], mime: str) -> str:
+    """All of iter_text at once."""
+    return "".join(iter_text(source, mime))
+
+
+def _timed(items: Iterable[T], add: Callable[[float], object]) -> Iterator[T]:
+    """Items of `items`; add() gets the time spent producing each one."""
+    it = iter(items)
+    try:
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                add(time.perf_counter() - t0)
+            yield item
+    finally:
+        close = getattr(it, "close", None)
+        if close is not None:
+            close()
+
 
-def chunk_text(text: str, target_chars: int = 3000, overlap: int = 300) -> List[str]:
+async def stream_chunks(source: IO[bytes], mime: str, stats: Optional[IngestStats] = None) -> AsyncIterator[str]:
     """
-    Simple char-based chunker (ổn cho MVP).
+    Chunks of `source` while it is still being extracted. Extraction and chunking each run
+    on their own thread behind a bounded queue: extraction stays at most INGEST_FRAGMENT_QUEUE
+    fragments (pages) ahead of chunking, and chunking INGEST_CHUNK_QUEUE chunks ahead of us.
+    `stats` gets the busy time of both stages and the page and character counts.
+    An extract permit is held until the document is extracted, not while its tail is embedded.
     """
-    if not text:
-        return []
-    chunks: List[str] = []
-    i = 0
-    n = len(text)
-    while i < n:
-        j = min(i + target_chars, n)
-        chunks.append(text[i:j])
-        i = max(j - overlap, j)
-    return chunks
+    loop = asyncio.get_running_loop()
+    stats = stats or IngestStats()
+
+    def extracted() -> Iterator[str]:
+        for fragment in _timed(iter_text(source, mime), lambda s: stats.add("extract", s)):
+            stats.chars += len(fragment)
+            stats.pages += fragment.count(PAGE_BREAK)
+            yield fragment
+        if stats.chars:
+            stats.pages += 1
+
+    def chunked() -> Iterator[str]:
+        # chunking time is the time in the chunker minus the time it waited for fragments
+        waited = _timed(iterate_blocking(fragments, loop), lambda s: stats.add("chunk", -s))
+        return _timed(iter_stream_chunks(waited), lambda s: stats.add("chunk", s))
+
+    async def limited() -> AsyncIterator[str]:
+        async with _stage_limits["extract"]:
+            async with aclosing(iterate_in_thread(extracted, settings.INGEST_FRAGMENT_QUEUE)) as extracting:
+                async for fragment in extracting:
+                    yield fragment
+
+    fragments = limited()
+    async with aclosing(fragments):
+        chunks = iterate_in_thread(chunked, settings.INGEST_CHUNK_QUEUE)
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                yield chunk
 
 
 # -----------------------
 # Upsert to vector store
 # -----------------------
 
-def upsert_chunks(
+@dataclass
+class IngestCheckpoint:
+    """
+    Progress of the job running this ingest: `done` of the `total` chunks it had to embed are
+    stored, and `save(done, total)` persists new progress. The total is None until the
+    document has been read to the end. `fence(db)` runs before each commit the ingest makes:
+    it locks the job in db's transaction and returns False when the job's lease was lost.
+    """
+    done: int = 0
+    total: Optional[int] = None
+    save: Optional[Callable[[int, Optional[int]], Awaitable[object]]] = None
+    fence: Optional[Callable[[AsyncSession], Awaitable[bool]]] = None
+
+
+class LeaseLost(Exception):
+    """The job running this ingest was taken over; its File writes were rolled back."""
+
+
+async def _commit_fenced(db: AsyncSession, checkpoint: Optional[IngestCheckpoint]) -> None:
+    if checkpoint is not None and checkpoint.fence is not None and not await checkpoint.fence(db):
+        await db.rollback()
+        raise LeaseLost("ingest job lease lost")
+    await db.commit()
+
+
+@dataclass
+class UpsertStats:
+    chunks: int = 0  # embedded and upserted
+    unchanged: int = 0  # already stored with the right metadata
+    moved: int = 0  # already stored, metadata rewritten
+    deleted: int = 0  # orphaned vectors of chunks no longer in the file
+    batches: int = 0
+    retries: int = 0
+    tokens: int = 0  # sent to the embedding model
+    seconds: float = 0.0
+    embed_seconds: float = 0.0  # summed over batches, which run concurrently
+    upsert_seconds: float = 0.0
+    first_stored_s: Optional[float] = None  # until the first batch was stored
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class IngestStats:
+    """
+    Where one ingest spent its time and what went through it; stored on File.ingest_stats.
+    Stage times are busy time. The stages overlap while streaming, so they can add up to
+    more than `seconds`, the wall time of the whole ingest.
+    """
+    stages: Dict[str, float] = field(default_factory=lambda: {"download": 0.0, "extract": 0.0, "chunk": 0.0})
+    seconds: float = 0.0
+    bytes: int = 0
+    pages: int = 0
+    chars: int = 0
+    chunks: int = 0
+    reused_from: Optional[str] = None  # the file whose vectors were copied
+    chat_id: Optional[str] = None  # the chat whose shard the vectors were stored in
+    upsert: UpsertStats = field(default_factory=UpsertStats)
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t0)
+
+    def stage_seconds(self) -> Dict[str, float]:
+        return {**self.stages, "embed": self.upsert.embed_seconds, "upsert": self.upsert.upsert_seconds}
+
+    def as_dict(self) -> dict:
+        u = self.upsert
+        return {
+            "seconds": round(self.seconds, 3),
+            "stages": {k: round(v, 3) for k, v in self.stage_seconds().items()},
+            "bytes": self.bytes,
+            "pages": self.pages,
+            "chars": self.chars,
+            "chunks": self.chunks,
+            "embedded": u.chunks,
+            "unchanged": u.unchanged,
+            "moved": u.moved,
+            "deleted": u.deleted,
+            "batches": u.batches,
+            "retries": u.retries,
+            "embed_tokens": u.tokens,
+            "first_batch_s": None if u.first_stored_s is None else round(u.first_stored_s, 3),
+            "reused_from": self.reused_from,
+            "chat_id": self.chat_id,
+        }
+
+    def observe(self) -> None:
+        for stage, seconds in self.stage_seconds().items():
+            if seconds:
+                metrics.histogram("ingest_stage_seconds", stage=stage).observe(seconds)
+        metrics.histogram("ingest_file_seconds").observe(self.seconds)
+        metrics.histogram("ingest_file_bytes", _BYTES_BUCKETS).observe(self.bytes)
+        metrics.histogram("ingest_file_pages", _COUNT_BUCKETS).observe(self.pages)
+        metrics.histogram("ingest_file_chunks", _COUNT_BUCKETS).observe(self.chunks)
+        metrics.counter("ingest_embed_tokens").inc(self.upsert.tokens)
+
+
+def _retryable(exc: BaseException) -> bool:
+    """Rate limits, timeouts and 5xx from OpenAI or the vector store."""
+    if isinstance(exc, (openai.RateLimitError, openai.APITimeoutError,
+                        openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    status = getattr(exc, "status", None) or getattr(exc, "status_code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+
+Batch = Tuple[List[str], List[dict], Optional[List[str]]]  # texts, metadatas, vector ids
+
+
+async def upsert_batches(
+        batches: AsyncIterable[Batch],
+        on_progress: Optional[Callable[[int], Awaitable[object]]] = None,
+        stats: Optional[UpsertStats] = None,
+) -> UpsertStats:
+    """
+    Embed and upsert batches as they arrive, EMBED_MAX_IN_FLIGHT at a time; the next batch is
+    not taken from `batches` before a slot frees up. Embedding requests also take one of the
+    process-wide INGEST_EMBED_CONCURRENCY permits. The embed and the upsert of a batch each
+    retry transient errors with jittered exponential backoff. `on_progress(n)` is awaited
+    whenever the first n chunks, in the order of `batches`, are all stored.
+    Vector ids of None let the store pick random ones. Counts and timings go to `stats`,
+    which is also up to date when a batch fails.
+    """
+    stats = stats or UpsertStats()
+    embeddings = get_embeddings()
+    limit = asyncio.Semaphore(settings.EMBED_MAX_IN_FLIGHT)
+    finished: dict[int, int] = {}  # batch number -> chunks, for batches past the watermark
+    next_seq = watermark = saved = 0
+    progress_lock = asyncio.Lock()
+
+    def on_retry(state: RetryCallState) -> None:
+        stats.retries += 1
+        metrics.counter("ingest_embed_retries").inc()
+        logger.warning("[INGEST] batch retry %d: %s", state.attempt_number, state.outcome.exception())
+
+    def retrying() -> AsyncRetrying:
+        return AsyncRetrying(
+            retry=retry_if_exception(_retryable),
+            wait=wait_random_exponential(multiplier=settings.EMBED_RETRY_BASE_S, max=settings.EMBED_RETRY_MAX_S),
+            stop=stop_after_attempt(settings.EMBED_MAX_ATTEMPTS),
+            before_sleep=on_retry,
+            reraise=True,
+        )
+
+    async def run_batch(seq: int, texts: List[str], metadatas: List[dict], ids: Optional[List[str]]) -> None:
+        nonlocal next_seq, watermark, saved
+        try:
+            tokens = await asyncio.to_thread(count_tokens, texts)
+            t = time.perf_counter()
+            try:
+                async for attempt in retrying():
+                    with attempt:
+                        # the permit is per request, and not held through a retry's backoff
+                        async with _stage_limits["embed"]:
+                            vectors = await asyncio.to_thread(embeddings.embed_documents, texts)
+            finally:
+                stats.embed_seconds += time.perf_counter() - t
+            t = time.perf_counter()
+            try:
+                async for attempt in retrying():
+                    with attempt:
+                        await asyncio.to_thread(upsert_vectors, texts, vectors, metadatas, ids)
+            finally:
+                stats.upsert_seconds += time.perf_counter() - t
+        finally:
+            limit.release()
+        stats.batches += 1
+        stats.chunks += len(texts)
+        stats.tokens += tokens
+        if stats.first_stored_s is None:
+            stats.first_stored_s = time.perf_counter() - t0
+        metrics.counter("ingest_chunks_embedded").inc(len(texts))
+
+        finished[seq] = len(texts)
+        advanced = False
+        while next_seq in finished:
+            watermark += finished.pop(next_seq)
+            next_seq += 1
+            advanced = True
+        if advanced and on_progress is not None:
+            async with progress_lock:  # one save at a time, so the stored watermark only grows
+                if watermark > saved:
+                    saved = watermark
+                    await on_progress(saved)
+
+    def reap(tasks: set) -> None:
+        for task in [t for t in tasks if t.done()]:
+            tasks.discard(task)
+            task.result()  # re-raises a failed batch
+
+    t0 = time.perf_counter()
+    tasks: set = set()
+    try:
+        seq = 0
+        async for texts, metadatas, ids in batches:
+            await limit.acquire()
+            try:
+                reap(tasks)
+            except BaseException:
+                limit.release()
+                raise
+            tasks.add(asyncio.create_task(run_batch(seq, texts, metadatas, ids)))
+            seq += 1
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    stats.seconds = time.perf_counter() - t0
+    metrics.histogram("ingest_embed_chunks_per_s", _THROUGHPUT_BUCKETS).observe(stats.chunks_per_s)
+    return stats
+
+
+async def upsert_chunks(
         chunks: List[str],
         metadata_common: dict,
-):
+        on_progress: Optional[Callable[[int], Awaitable[object]]] = None,
+        ids: Optional[List[str]] = None,
+        positions: Optional[List[int]] = None,
+) -> UpsertStats:
     """
-    Add documents to vector store with common metadata.
+    upsert_batches over a list, in EMBED_BATCH_SIZE batches.
+    `ids` (one per chunk) are used as vector ids; the store picks random ones without them.
+    `positions` are the chunks' chunk_index in the file when only some of its chunks are passed.
     """
-    if not chunks:
-        return
-    vs = get_vectorstore()
-    metadatas = []
-    for idx, _ in enumerate(chunks):
-        md = dict(metadata_common)
-        md["chunk_index"] = idx
-        metadatas.append(md)
-    vs.add_texts(texts=chunks, metadatas=metadatas)
+    positions = positions or list(range(len(chunks)))
+    size = settings.EMBED_BATCH_SIZE
+
+    async def batches() -> AsyncIterator[Batch]:
+        for lo in range(0, len(chunks), size):
+            hi = min(lo + size, len(chunks))
+            metadatas = [{**metadata_common, "chunk_index": i} for i in positions[lo:hi]]
+            yield chunks[lo:hi], metadatas, ids and ids[lo:hi]
+
+    return await upsert_batches(batches(), on_progress)
+
+
+async def drop_file_index(db: AsyncSession, f: File, vectors: bool = True) -> None:
+    """Remove a previous ingest of the file (vectors + lexical rows) before re-indexing it."""
+    if vectors:
+        await asyncio.to_thread(delete_file_vectors, f.id, stored_in(f.chat_id, f.ingest_stats))
+    await drop_chunks(db, f.id)
+
+
+# -----------------------
+# Chunk identity
+# -----------------------
+
+_VECTOR_ID_NS = UUID("6f1c4f0e-7a52-4b8e-9d33-2f0c8a1e5b47")
+
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def chunk_vector_ids(file_id, hashes: List[str], seen: Optional[Counter] = None) -> List[str]:
+    """
+    Vector id per chunk from (file_id, chunk hash): an edited file keeps the ids of the chunks
+    it still contains wherever they moved. Repeats of the same text get their own occurrence number;
+    pass the same `seen` to continue the count over the hashes of the next batch.
+    """
+    seen = Counter() if seen is None else seen
+    ids = []
+    for h in hashes:
+        ids.append(str(uuid5(_VECTOR_ID_NS, f"{file_id}:{h}:{seen[h]}")))
+        seen[h] += 1
+    return ids
+
+
+def _same_metadata(stored: dict, wanted: dict) -> bool:
+    # Pinecone hands numbers back as floats and adds the text; 3.0 == 3 holds
+    return all(stored.get(k) == v for k, v in wanted.items())
+
+
+def stored_in(chat_id, ingest_stats: Optional[dict]) -> Optional[List[Optional[str]]]:
+    """
+    Chats whose shards can hold a file's stored vectors: its current chat, the unscoped shard,
+    the chat its last ingest stored them under and, after failed attempts, the chats of the
+    ingests before (see failed_stats). None (look everywhere) for files ingested before that
+    was recorded.
+    """
+    if not ingest_stats or "chat_id" not in ingest_stats:
+        return None
+    return list(dict.fromkeys([
+        str(chat_id) if chat_id else None, ingest_stats["chat_id"], *ingest_stats.get("prior_chat_ids", ()), None,
+    ]))
+
+
+def failed_stats(stats: IngestStats, previous: Optional[dict], error: str) -> dict:
+    """
+    File.ingest_stats of a failed attempt. The previous ingest's vectors can still be in another
+    chat's shard, so its chats stay listed for stored_in; when the previous stats do not say
+    where they are, chat_id is left out and the next ingest looks everywhere.
+    """
+    out = {**stats.as_dict(), "error": error}
+    if previous and "chat_id" not in previous:
+        del out["chat_id"]
+    elif previous:
+        out["prior_chat_ids"] = list(dict.fromkeys([*previous.get("prior_chat_ids", ()), previous["chat_id"]]))
+    return out
+
+
+def restamp_vectors(
+        ids: List[str], texts: List[str], vectors: List, metadatas: List[dict], stored_chats: List[Optional[str]]
+) -> None:
+    """
+    Rewrite the metadata of stored vectors without re-embedding (the chat shard may change).
+    `stored_chats` are the chat_ids of their stored metadata: the shards they are deleted from.
+    """
+    delete_vectors(ids, stored_chats)
+    upsert_vectors(texts, vectors, metadatas, ids)
+
+
+async def index_chunks(
+        file_id,
+        db: Optional[AsyncSession],
+        chunks: AsyncIterable[str],
+        metadata_common: dict,
+        reuse: bool,
+        on_progress: Optional[Callable[[int], Awaitable[object]]] = None,
+        stats: Optional[UpsertStats] = None,
+        reuse_from: Optional[List[Optional[str]]] = None,
+        commit: Optional[Callable[[], Awaitable[object]]] = None,
+) -> Tuple[UpsertStats, List[str]]:
+    """
+    Index a file's chunks as they arrive, EMBED_BATCH_SIZE at a time, and return the stats and
+    the chunk hashes. Each batch's texts go to lexical_chunks through `db` right away (None
+    skips them) and `commit()` makes them durable, so the transaction never outgrows a batch;
+    with `reuse`, chunks
+    whose vector is already stored (in the shards of the chats `reuse_from`, all if None) are
+    not embedded again (their metadata is rewritten if it changed), the rest are embedded and
+    upserted while the next batches are read.
+    """
+    size = settings.EMBED_BATCH_SIZE
+    hashes: List[str] = []
+    seen: Counter = Counter()
+    moved = 0
+
+    async def to_embed() -> AsyncIterator[Batch]:
+        nonlocal moved
+        texts: List[str] = []
+        metadatas: List[dict] = []
+        ids: List[str] = []
+        async for batch in batched(chunks, size):
+            start = len(hashes)
+            batch_hashes = [chunk_hash(c) for c in batch]
+            batch_ids = chunk_vector_ids(file_id, batch_hashes, seen)
+            batch_metas = [{**metadata_common, "chunk_index": start + i} for i in range(len(batch))]
+            hashes.extend(batch_hashes)
+            if db is not None:
+                await store_chunks(db, file_id, batch, start)
+                if commit is not None:
+                    await commit()
+
+            stored = await asyncio.to_thread(fetch_vectors, batch_ids, reuse_from) if reuse else {}
+            stale = [i for i, id_ in enumerate(batch_ids)
+                     if id_ in stored and not _same_metadata(stored[id_][2], batch_metas[i])]
+            if stale:
+                await asyncio.to_thread(
+                    restamp_vectors,
+                    [batch_ids[i] for i in stale], [batch[i] for i in stale],
+                    [stored[batch_ids[i]][1] for i in stale], [batch_metas[i] for i in stale],
+                    [stored[batch_ids[i]][2].get("chat_id") or None for i in stale],
+                )
+                moved += len(stale)
+            for i, id_ in enumerate(batch_ids):
+                if id_ not in stored:
+                    texts.append(batch[i])
+                    metadatas.append(batch_metas[i])
+                    ids.append(id_)
+            while len(texts) >= size:
+                yield texts[:size], metadatas[:size], ids[:size]
+                texts, metadatas, ids = texts[size:], metadatas[size:], ids[size:]
+        if texts:
+            yield texts, metadatas, ids
+
+    async with aclosing(to_embed()) as batches:
+        stats = await upsert_batches(batches, on_progress, stats)
+    stats.moved = moved
+    stats.unchanged = len(hashes) - stats.chunks - moved
+    return stats, hashes
+
+
+async def reindex_chunks(
+        db: AsyncSession,
+        f: File,
+        chunks: AsyncIterable[str],
+        metadata_common: dict,
+        reindex: bool,
+        checkpoint: Optional[IngestCheckpoint] = None,
+        stats: Optional[UpsertStats] = None,
+) -> Tuple[UpsertStats, List[str]]:
+    """
+    Bring the file's vectors in line with `chunks`: embed only chunks whose id is not stored
+    yet, rewrite the metadata of stored ones that moved or changed chat, and delete the vectors
+    of chunks the file no longer has. Re-ingesting an unchanged file embeds nothing.
+    Returns the stats and the chunk hashes.
+    """
+    old_ids = set((await db.execute(select(FileChunk.vector_id).where(FileChunk.file_id == f.id))).scalars())
+    # ids stored by the last successful ingest or by an earlier attempt of this job can be kept;
+    # a file that never finished, or was indexed before vector ids were content-addressed, starts clean
+    reuse = reindex and bool(old_ids or (checkpoint is not None and checkpoint.done))
+    if reindex:
+        await drop_file_index(db, f, not reuse)
+
+    on_progress = None
+    if checkpoint is not None and checkpoint.save is not None:
+        on_progress = lambda done: checkpoint.save(done, None)  # the total is known at the end
+    stats, hashes = await index_chunks(
+        f.id, db, chunks, metadata_common, reuse, on_progress, stats, stored_in(f.chat_id, f.ingest_stats),
+        commit=lambda: _commit_fenced(db, checkpoint),
+    )
+
+    orphans = list(old_ids - set(chunk_vector_ids(f.id, hashes)))
+    if orphans:
+        await asyncio.to_thread(delete_vectors, orphans, stored_in(f.chat_id, f.ingest_stats))
+    stats.deleted = len(orphans)
+    if on_progress is not None and stats.chunks:
+        await checkpoint.save(stats.chunks, stats.chunks)
+    return stats, hashes
+
+
+async def record_chunks(db: AsyncSession, file_id, hashes: List[str]) -> None:
+    """Replace the file's file_chunks rows (not committed)."""
+    await db.execute(delete(FileChunk).where(FileChunk.file_id == file_id))
+    if hashes:
+        await db.execute(insert(FileChunk), [
+            {"file_id": file_id, "chunk_index": i, "vector_id": id_, "chunk_hash": h}
+            for i, (id_, h) in enumerate(zip(chunk_vector_ids(file_id, hashes), hashes))
+        ])
+
+
+# -----------------------
+# Content-addressed reuse
+# -----------------------
+
+def _sha256(stream: IO[bytes]) -> str:
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(STREAM_CHUNK), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+async def find_indexed_copy(db: AsyncSession, f: File, etag: Optional[str] = None, sha256: Optional[str] = None):
+    """
+    (id, content_sha256, chat_id, ingest_stats) of another indexed file of the same type with
+    the same S3 ETag + size, or sha256.
+    """
+    has_chunks = exists().where(FileChunk.file_id == File.id)
+    q = select(File.id, File.content_sha256, File.chat_id, File.ingest_stats).where(
+        File.id != f.id, File.status == FileStatus.indexed, File.filetype == f.filetype, has_chunks
+    )
+    if sha256:
+        q = q.where(File.content_sha256 == sha256)
+    elif etag:
+        q = q.where(File.etag == etag, File.size == f.size)
+    else:
+        return None
+    return (await db.execute(q.order_by(File.created_at).limit(1))).first()
+
+
+def copy_vectors(
+        vector_ids: List[str],
+        hashes: List[str],
+        file_id,
+        metadata_common: dict,
+        donor_chats: Optional[List[Optional[str]]] = None,
+) -> bool:
+    """
+    Store the donor's vectors again under `file_id` with this file's metadata, EMBED_BATCH_SIZE
+    at a time. `donor_chats` are the chats whose shards hold the donor's vectors (see
+    stored_in). False when some of them are no longer in the vector store (the batches before
+    it are already copied).
+    """
+    ids = chunk_vector_ids(file_id, hashes)
+    size = settings.EMBED_BATCH_SIZE
+    for lo in range(0, len(vector_ids), size):
+        batch = vector_ids[lo:lo + size]
+        stored = fetch_vectors(batch, donor_chats)
+        if len(stored) < len(batch):
+            return False
+        upsert_vectors(
+            [stored[v][0] for v in batch],
+            [stored[v][1] for v in batch],
+            [{**metadata_common, "chunk_index": lo + i} for i in range(len(batch))],
+            ids[lo:lo + size],
+        )
+    return True
+
+
+async def _reuse_copy(
+        db: AsyncSession, f: File, meta: dict, reindex: bool, stats: IngestStats, **match
+) -> Optional[List[str]]:
+    """Chunk hashes copied from an indexed duplicate of `f`, or None if there is none."""
+    donor = await find_indexed_copy(db, f, **match)
+    if donor is None:
+        return None
+    rows = (await db.execute(
+        select(FileChunk.vector_id, FileChunk.chunk_hash)
+        .where(FileChunk.file_id == donor.id)
+        .order_by(FileChunk.chunk_index)
+    )).all()
+    if reindex:
+        await drop_file_index(db, f)
+    hashes = [r.chunk_hash for r in rows]
+    with stats.timed("copy"):
+        copied = await asyncio.to_thread(
+            copy_vectors, [r.vector_id for r in rows], hashes, f.id, meta,
+            stored_in(donor.chat_id, donor.ingest_stats),
+        )
+    if not copied:
+        logger.warning("[INGEST] donor file_id=%s lost its vectors; ingesting file_id=%s in full", donor.id, f.id)
+        # whatever was copied before that
+        await asyncio.to_thread(delete_file_vectors, f.id, stored_in(f.chat_id, f.ingest_stats))
+        return None
+    await copy_chunks(db, donor.id, f.id)
+    f.content_sha256 = f.content_sha256 or donor.content_sha256
+    stats.reused_from = str(donor.id)
+    metrics.counter("ingest_dedup_hits", match="sha256" if "sha256" in match else "etag").inc()
+    logger.info("[INGEST] reused %d chunks of file_id=%s for file_id=%s", len(hashes), donor.id, f.id)
+    return hashes
 
 
 # -----------------------
 # Main job
 # -----------------------
 
-async def ingest_file_s3(file_id: str, db: AsyncSession = Depends(get_db)):
+async def ingest_file_s3(
+        file_id: str,
+        db: AsyncSession = Depends(get_db),
+        checkpoint: Optional[IngestCheckpoint] = None,
+):
     """
     Background job: move File -> processing, download, extract, chunk, embed, index, mark indexed.
-    Idempotent: nếu đã indexed, return.
+    Re-running it re-indexes the file (e.g. after /file/attach moved it into a chat).
+    A file whose bytes match an already indexed file reuses that file's chunks and vectors.
+    Re-indexing embeds only chunks that are not stored yet, so a retry or an unchanged file
+    costs no embeddings; `checkpoint` records the job's progress and fences the File writes
+    on the job's lease (LeaseLost when another worker took the job over).
+    Raises after marking the file failed, so the job queue can record and retry it.
     """
-    print("[INGEST] start file_id=%s", file_id)
+    logger.info("[INGEST] start file_id=%s", file_id)
     # 1) Load file
     f = await db.get(File, UUID(file_id))
     if not f:
-        print("[INGEST] file not found: %s", file_id)
+        logger.warning("[INGEST] file not found: %s", file_id)
         return
 
-
-
     # 2) Mark processing
+    reindex = f.status in (FileStatus.indexed, FileStatus.failed, FileStatus.processing)
     f.status = FileStatus.processing
-    await db.commit()
+    await _commit_fenced(db, checkpoint)
     await db.refresh(f)
-    print("[INGEST] status=ingesting key=%s mime=%s", f.key, f.filetype)
+    logger.info("[INGEST] status=processing file_id=%s key=%s mime=%s", file_id, f.key, f.filetype)
 
+    stats = IngestStats()
+    t0 = time.perf_counter()
     try:
         # 3) Resolve bucket/key
         if f.key:
@@ -145,21 +769,14 @@ async def ingest_file_s3(file_id: str, db: AsyncSession = Depends(get_db)):
             key = f.key
         else:
             bucket, key = parse_s3_url(f.url)
-        print("[INGEST] s3 resolve bucket=%s key=%s", bucket, key)
-
-        # 4) Download bytes
-        data = s3_download_bytes(bucket, key)
-        print("[INGEST] s3 download done bytes=%d", len(data or b""))
-
-        # 5) Extract text
-        text = extract_text(data, mime=f.filetype or "application/octet-stream")
-        pages = text.count("\f") + 1 if text else 0  # hoặc 0 nếu không tách trang
-        logger.info("[INGEST] extract done pages=%d chars=%d", pages, len(text))
-
-        # 6) Chunk & Upsert
-        chunks = chunk_text(text, target_chars=3000, overlap=300)
-        print("[INGEST] chunk done chunks=%d", len(chunks))
 
+        # the client-reported ETag/size must not pick a dedup donor: ask S3
+        f.etag, f.size = await asyncio.to_thread(s3_head, bucket, key)
+        # File writes are committed as soon as they are made: left pending, the next query would
+        # autoflush them and keep the files row locked (blocking attach and delete) to the end
+        await _commit_fenced(db, checkpoint)
+        stats.bytes = f.size or 0
+        stats.chat_id = str(f.chat_id) if f.chat_id else None
         meta = {
             "project_id": str(getattr(f, "project_id", "") or ""),
             "chat_id": str(getattr(f, "chat_id", "") or ""),
@@ -169,18 +786,59 @@ async def ingest_file_s3(file_id: str, db: AsyncSession = Depends(get_db)):
             "etag": f.etag,
             "mime": f.filetype,
         }
-        upsert_chunks(chunks, metadata_common=meta)
-        print("[INGEST] upsert done")
 
+        # 4) Same bytes already indexed (by ETag, then by sha256 once downloaded): copy its
+        #    chunks and vectors instead of extracting and embedding again
+        hashes = await _reuse_copy(db, f, meta, reindex, stats, etag=f.etag)
+        if hashes is None:
+            # 5) Download bytes
+            # spooled to a temp file: memory per ingest stays flat whatever the object size; pinned
+            # to the HEAD's ETag, so the bytes hashed and indexed are the ones f.etag names
+            async with _stage_limits["download"]:
+                with stats.timed("download"):
+                    spool = await asyncio.to_thread(s3_download_to_tempfile, bucket, key, f.etag)
+            try:
+                with stats.timed("hash"):
+                    f.content_sha256 = await asyncio.to_thread(_sha256, spool)
+                await _commit_fenced(db, checkpoint)
+                hashes = await _reuse_copy(db, f, meta, reindex, stats, sha256=f.content_sha256)
+                if hashes is None:
+                    # 6) Extract → Chunk → Embed → Upsert, streamed: batches are searchable as they
+                    #    land, and memory follows the batch size rather than the document size.
+                    #    Extraction and each embedding request take their own stage permits.
+                    chunks = stream_chunks(spool, f.filetype or "application/octet-stream", stats)
+                    async with aclosing(chunks):
+                        _, hashes = await reindex_chunks(
+                            db, f, chunks, meta, reindex, checkpoint, stats.upsert
+                        )
+            finally:
+                spool.close()
+
+        # 7) Record the chunk list
+        await record_chunks(db, f.id, hashes)
+        stats.chunks = len(hashes)
 
-        # 7) Mark indexed
+        # 8) Mark indexed
+        stats.seconds = time.perf_counter() - t0
+        f.ingest_stats = stats.as_dict()
         f.status = FileStatus.indexed
-        await db.commit()
-        print("[INGEST] DONE status=ready file_id=%s", file_id)
+        await bump_corpus_version(db, f.chat_id)
+        await _commit_fenced(db, checkpoint)
+        stats.observe()
+        logger.info("[INGEST] done file_id=%s %s", file_id, f.ingest_stats)
 
+    except LeaseLost:
+        logger.warning("[INGEST] lease lost file_id=%s, leaving the file to the new owner", file_id)
+        raise
     except Exception as e:
-        # 8) Mark failed
+        # 9) Mark failed, keeping what the attempt got through
+        stats.seconds = time.perf_counter() - t0
+        f.ingest_stats = failed_stats(stats, f.ingest_stats, f"{type(e).__name__}: {e}"[:500])
         f.status = FileStatus.failed
-        await db.commit()
-        # log thực tế bằng logger
-        print("INGEST FAILED:", f.id, e)
+        # the attempt may have dropped or replaced part of the file's chunks: rebuild the
+        # chat's lexical indexes and drop its cached answers
+        await bump_corpus_version(db, f.chat_id)
+        await _commit_fenced(db, checkpoint)
+        metrics.counter("ingest_files_failed").inc()
+        logger.exception("[INGEST] failed file_id=%s", file_id)
+        raise
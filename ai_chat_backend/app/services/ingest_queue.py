@@ -0,0 +1,326 @@
+# app/services/ingest_queue.py
+"""
+Durable ingest queue on the ingest_jobs table.
+
+- enqueue_ingest() adds a job in the caller's transaction; a file has at most one queued job,
+  so confirm, attach and /ingest can all enqueue without piling up duplicates
+- IngestWorkerPool runs INGEST_WORKERS coroutines that claim jobs with FOR UPDATE SKIP LOCKED,
+  so API processes and standalone workers (app.worker) can all serve the same table
+- A claimed job carries a lease (owner + expiry) renewed by a heartbeat. When a worker dies its
+  lease runs out and the job is claimed again; a worker that loses its lease stops the ingest,
+  and every state change, the job's and the file's, is fenced on the owner so a stale worker
+  can't overwrite it
+- A failed job is retried up to INGEST_MAX_ATTEMPTS times with linear backoff; the ingest
+  checkpoints embed progress on the job, so a retry resumes instead of re-embedding everything
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import and_, exists, func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.file import File
+from app.models.ingest_job import IngestJob, IngestJobStatus
+from app.services.ingest_from_s3 import IngestCheckpoint, LeaseLost, ingest_file_s3
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+_QUEUED = text("status = 'queued'")  # predicate of uq_ingest_jobs_file_queued
+
+
+@dataclass
+class ClaimedJob:
+    id: UUID
+    file_id: UUID
+    attempts: int
+    owner: str
+    chunks_done: int = 0
+    chunks_total: Optional[int] = None
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def enqueue_ingest(db: AsyncSession, file_id: UUID) -> UUID:
+    """
+    Queue an ingest of `file_id` without committing. Returns the new job id,
+    or the id of the job already queued for that file.
+    """
+    for _ in range(3):
+        job_id = (await db.execute(
+            insert(IngestJob)
+            .values(file_id=file_id)
+            .on_conflict_do_nothing(index_elements=[IngestJob.file_id], index_where=_QUEUED)
+            .returning(IngestJob.id)
+        )).scalar_one_or_none()
+        if job_id is not None:
+            metrics.counter("ingest_jobs_enqueued").inc()
+            return job_id
+        job_id = (await db.execute(
+            select(IngestJob.id).where(IngestJob.file_id == file_id, IngestJob.status == IngestJobStatus.queued)
+        )).scalar_one_or_none()
+        if job_id is not None:
+            return job_id
+        # the queued job was claimed between the two statements; insert again
+    raise RuntimeError(f"could not enqueue ingest for file {file_id}")
+
+
+def _lease_until():
+    return func.now() + timedelta(seconds=settings.INGEST_LEASE_S)
+
+
+def _file_busy(file_id, job_id):
+    """Another job of the file is running under a live lease."""
+    other = aliased(IngestJob, name="other")
+    return exists().where(
+        other.file_id == file_id,
+        other.id != job_id,
+        other.status == IngestJobStatus.running,
+        other.lease_expires_at > func.now(),
+    )
+
+
+async def claim_job(owner: str) -> Optional[ClaimedJob]:
+    """
+    Atomically lease the next due job to `owner`: a queued job, or a running one whose
+    lease expired. None when there is nothing to do.
+
+    Never runs two ingests of one file at once (e.g. attach re-queued it mid-ingest). The
+    job's files row is locked along with it, and the file is checked again once both locks
+    are held: the picking query's snapshot can predate a claim of another job of the same
+    file that committed just before this one got the lock.
+    """
+    async with AsyncSessionLocal() as db:
+        picked = (await db.execute(
+            select(IngestJob.id, IngestJob.file_id)
+            .join(File, File.id == IngestJob.file_id)
+            .where(
+                or_(
+                    and_(IngestJob.status == IngestJobStatus.queued, IngestJob.run_after <= func.now()),
+                    and_(IngestJob.status == IngestJobStatus.running, IngestJob.lease_expires_at <= func.now()),
+                ),
+                ~_file_busy(IngestJob.file_id, IngestJob.id),
+            )
+            .order_by(IngestJob.run_after)
+            .limit(1)
+            .with_for_update(of=[IngestJob, File], skip_locked=True)
+        )).first()
+        if picked is None:
+            return None
+        # a new statement, so a new snapshot: every claim that held this file's lock has committed
+        if (await db.execute(select(_file_busy(picked.file_id, picked.id)))).scalar():
+            return None
+        row = (await db.execute(
+            update(IngestJob)
+            .where(IngestJob.id == picked.id)
+            .values(
+                status=IngestJobStatus.running,
+                attempts=IngestJob.attempts + 1,
+                started_at=func.now(),
+                lease_owner=owner,
+                lease_expires_at=_lease_until(),
+            )
+            .returning(IngestJob.id, IngestJob.file_id, IngestJob.attempts,
+                       IngestJob.chunks_done, IngestJob.chunks_total)
+            .execution_options(synchronize_session=False)
+        )).one()
+        await db.commit()
+    return ClaimedJob(row.id, row.file_id, row.attempts, owner, row.chunks_done, row.chunks_total)
+
+
+async def _set(job: ClaimedJob, **values) -> bool:
+    """Update the job if `job.owner` still holds its lease; False when the lease was lost."""
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(
+            update(IngestJob)
+            .where(
+                IngestJob.id == job.id,
+                IngestJob.status == IngestJobStatus.running,
+                IngestJob.lease_owner == job.owner,
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return res.rowcount == 1
+
+
+async def _hold_lease(job: ClaimedJob, db: AsyncSession) -> bool:
+    """
+    Lock the job row in db's transaction if `job.owner` still holds its lease: nobody can
+    claim the job until db commits, so the writes committed with it can't be stale.
+    """
+    row = (await db.execute(
+        select(IngestJob.id)
+        .where(
+            IngestJob.id == job.id,
+            IngestJob.status == IngestJobStatus.running,
+            IngestJob.lease_owner == job.owner,
+        )
+        .with_for_update()
+    )).first()
+    return row is not None
+
+
+async def renew_lease(job: ClaimedJob) -> bool:
+    return await _set(job, lease_expires_at=_lease_until())
+
+
+_RELEASED = {"lease_owner": None, "lease_expires_at": None}
+
+
+async def _finish(job: ClaimedJob, error: Optional[BaseException]) -> None:
+    if error is None:
+        if await _set(job, status=IngestJobStatus.done, finished_at=func.now(), error=None, **_RELEASED):
+            metrics.counter("ingest_jobs", status="done").inc()
+        return
+
+    message = f"{type(error).__name__}: {error}"[:1000]
+    if job.attempts < settings.INGEST_MAX_ATTEMPTS:
+        delay = timedelta(seconds=settings.INGEST_RETRY_BACKOFF_S * job.attempts)
+        try:
+            if await _set(job, status=IngestJobStatus.queued, run_after=func.now() + delay, error=message,
+                          **_RELEASED):
+                metrics.counter("ingest_jobs", status="retried").inc()
+            return
+        except IntegrityError:
+            pass  # a newer job is already queued for this file and will redo the work
+    if await _set(job, status=IngestJobStatus.failed, finished_at=func.now(), error=message, **_RELEASED):
+        metrics.counter("ingest_jobs", status="failed").inc()
+
+
+async def _release(job: ClaimedJob) -> None:
+    """Put a job interrupted by shutdown back in the queue without charging an attempt."""
+    try:
+        await _set(job, status=IngestJobStatus.queued, attempts=IngestJob.attempts - 1, **_RELEASED)
+    except IntegrityError:
+        await _set(job, status=IngestJobStatus.failed, finished_at=func.now(), error="superseded", **_RELEASED)
+
+
+async def _heartbeat(job: ClaimedJob, work: asyncio.Task) -> None:
+    """Renew the lease every third of INGEST_LEASE_S; stop the ingest if it was lost."""
+    interval = settings.INGEST_LEASE_S / 3
+    while not work.done():
+        await asyncio.sleep(interval)
+        try:
+            renewed = await renew_lease(job)
+        except Exception:
+            logger.warning("ingest job %s: lease renewal failed", job.id, exc_info=True)
+            continue  # the lease is still valid for a while; try again next beat
+        if not renewed:
+            logger.warning("ingest job %s: lease lost, stopping", job.id)
+            metrics.counter("ingest_leases_lost").inc()
+            work.cancel()
+            return
+
+
+async def _save_checkpoint(job: ClaimedJob, done: int, total: Optional[int]) -> None:
+    # a lost lease just drops the save; the heartbeat is already stopping this ingest
+    await _set(job, chunks_done=done, chunks_total=total)
+
+
+async def _ingest(job: ClaimedJob) -> None:
+    checkpoint = IngestCheckpoint(
+        done=job.chunks_done,
+        total=job.chunks_total,
+        save=lambda done, total: _save_checkpoint(job, done, total),
+        fence=lambda db: _hold_lease(job, db),
+    )
+    if job.chunks_done:
+        logger.info("ingest job %s: resuming at chunk %d/%s", job.id, job.chunks_done, job.chunks_total)
+    with metrics.histogram("ingest_job_seconds").time():
+        async with AsyncSessionLocal() as db:
+            await ingest_file_s3(str(job.file_id), db, checkpoint=checkpoint)
+
+
+async def run_job(job: ClaimedJob) -> None:
+    logger.info("ingest job %s: file_id=%s attempt=%d owner=%s", job.id, job.file_id, job.attempts, job.owner)
+    work = asyncio.create_task(_ingest(job))
+    beat = asyncio.create_task(_heartbeat(job, work))
+    try:
+        await work
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            # shutdown: hand the job back right away instead of waiting for the lease to run out
+            await asyncio.shield(_release(job))
+            raise
+        return  # the heartbeat cancelled it: another worker owns the job now
+    except LeaseLost:
+        logger.warning("ingest job %s: lease lost, file left to the new owner", job.id)
+        metrics.counter("ingest_leases_lost").inc()
+    except Exception as e:
+        logger.warning("ingest job %s failed: %s", job.id, e)
+        await _finish(job, e)
+    else:
+        await _finish(job, None)
+    finally:
+        beat.cancel()
+
+
+class IngestWorkerPool:
+    def __init__(self):
+        self.worker_id = new_worker_id()
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._busy = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self, workers: int) -> None:
+        if self._tasks or workers < 1:
+            return
+        self._tasks = [asyncio.create_task(self._worker(n), name=f"ingest-worker-{n}") for n in range(workers)]
+        metrics.register_gauge("ingest_workers", lambda: {"size": len(self._tasks), "busy": self._busy})
+        logger.info("ingest worker pool %s started: %d workers", self.worker_id, workers)
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def notify(self) -> None:
+        """Wake idle workers now instead of at their next poll."""
+        self._wakeup.set()
+
+    async def _worker(self, n: int) -> None:
+        owner = f"{self.worker_id}/{n}"
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await claim_job(owner)
+            except Exception:
+                logger.exception("ingest worker %s: claim failed", owner)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.INGEST_POLL_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._busy += 1
+            try:
+                await run_job(job)
+            except Exception:
+                logger.exception("ingest worker %s: job %s could not be recorded", owner, job.id)
+            finally:
+                self._busy -= 1
+
+
+ingest_pool = IngestWorkerPool()
@@ -0,0 +1,223 @@
+# app/services/lexical_index.py
+"""
+Per-chat BM25 index over ingested chunks.
+
+Chunk texts are stored in Postgres (lexical_chunks) in the ingest's transaction, so what an
+ingest worker indexed is searchable from every API pod once the ingest commits. Each process
+builds a chat's index in memory on the first query after the chat's corpus_version changed,
+and keeps its postings in CSR-style NumPy arrays (term -> [doc ids], [term freqs]).
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from cachetools import LRUCache
+from langchain_core.documents import Document
+from sqlalchemy import delete, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.chat import Chat
+from app.models.file import File
+from app.models.lexical_chunk import LexicalChunk
+
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+(?:[.\-]\w+)*", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how in is it of on or that the this to was what "
+    "when where which who why with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.casefold()) if t not in _STOPWORDS]
+
+
+@dataclass
+class LexicalHit:
+    doc: Document
+    score: float
+
+
+@dataclass
+class LexicalResult:
+    hits: List[LexicalHit]
+    confident: bool
+
+
+class BM25Index:
+    def __init__(self, rows: List[dict]):
+        self.metadatas = [{"chat_id": r["chat_id"], "file_id": r["file_id"], "chunk_index": r["chunk_index"]}
+                          for r in rows]
+        self.texts = [r["text"] for r in rows]
+        self.vocab: dict[str, int] = {}
+
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        doc_len = np.zeros(len(rows), dtype=np.float32)
+        for doc_id, text in enumerate(self.texts):
+            counts = Counter(tokenize(text))
+            doc_len[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(self.vocab.setdefault(term, len(self.vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        t = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(t, kind="stable")
+        self.postings_doc = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.postings_tf = np.asarray(tfs, dtype=np.float32)[order]
+        df = np.bincount(t, minlength=len(self.vocab))
+        self.indptr = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        n = max(len(rows), 1)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.doc_len = doc_len
+        self.avgdl = float(doc_len.mean()) if len(rows) else 1.0
+
+    def search(self, query: str, k: int) -> Tuple[List[Tuple[int, float]], int, int]:
+        """Top-k (doc_id, score), the number of distinct query terms and how many the best doc contains."""
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        terms = [self.vocab[t] for t in query_terms if t in self.vocab]
+        if not terms or not self.texts:
+            return [], len(query_terms), 0
+
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        matched = np.zeros(len(self.texts), dtype=np.int32)
+        norm = K1 * (1 - B + B * self.doc_len / max(self.avgdl, 1e-6))
+        for t in terms:
+            lo, hi = self.indptr[t], self.indptr[t + 1]
+            docs, tf = self.postings_doc[lo:hi], self.postings_tf[lo:hi]
+            # doc ids are unique within one posting list, so fancy-index += is safe
+            scores[docs] += self.idf[t] * tf * (K1 + 1) / (tf + norm[docs])
+            matched[docs] += 1
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k < 1:
+            return [], len(query_terms), 0
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx])]
+        return [(int(i), float(scores[i])) for i in idx], len(query_terms), int(matched[idx[0]])
+
+
+# -----------------------
+# Storage (the caller's transaction; the caller commits)
+# -----------------------
+
+async def store_chunks(db: AsyncSession, file_id, chunks: Iterable[str], start_index: int = 0) -> None:
+    rows = [{"file_id": file_id, "chunk_index": i, "text": text} for i, text in enumerate(chunks, start=start_index)]
+    if rows:
+        await db.execute(insert(LexicalChunk), rows)
+
+
+async def drop_chunks(db: AsyncSession, file_id) -> None:
+    await db.execute(delete(LexicalChunk).where(LexicalChunk.file_id == file_id))
+
+
+async def copy_chunks(db: AsyncSession, from_file_id, to_file_id) -> None:
+    """Store the chunk texts of one file again under another (ingest dedup)."""
+    await db.execute(insert(LexicalChunk).from_select(
+        ["file_id", "chunk_index", "text"],
+        select(literal(to_file_id, LexicalChunk.file_id.type), LexicalChunk.chunk_index, LexicalChunk.text)
+        .where(LexicalChunk.file_id == from_file_id),
+    ))
+
+
+class DatabaseChunks:
+    """Where LexicalIndexStore reads a chat's chunks and the corpus_version they belong to."""
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+
+    async def corpus_version(self, chat_id) -> Optional[int]:
+        async with self.session_factory() as db:
+            return (await db.execute(select(Chat.corpus_version).where(Chat.id == chat_id))).scalar_one_or_none()
+
+    async def rows(self, chat_id) -> List[dict]:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(LexicalChunk.file_id, LexicalChunk.chunk_index, LexicalChunk.text)
+                .join(File, File.id == LexicalChunk.file_id)
+                .where(File.chat_id == chat_id)
+            )
+            return [
+                {"chat_id": str(chat_id), "file_id": str(r.file_id), "chunk_index": r.chunk_index, "text": r.text}
+                for r in result
+            ]
+
+
+class LexicalIndexStore:
+    def __init__(self, source, max_chats: int = 256):
+        self.source = source
+        self._indexes: LRUCache = LRUCache(maxsize=max_chats)  # chat -> (corpus_version, BM25Index)
+        self._lock = threading.Lock()
+
+    async def _load(self, chat_id, corpus_version: Optional[int]) -> Optional[BM25Index]:
+        if corpus_version is None:
+            corpus_version = await self.source.corpus_version(chat_id)
+        key = str(chat_id)
+        with self._lock:
+            cached = self._indexes.get(key)
+        if cached and cached[0] == corpus_version:
+            return cached[1]
+
+        # rows read after the version: at worst newer than it, and the next bump reloads them
+        rows = await self.source.rows(chat_id)
+        index = await asyncio.to_thread(BM25Index, rows) if rows else None
+        with self._lock:
+            self._indexes[key] = (corpus_version, index)
+        return index
+
+    async def search(self, chat_id, query: str, k: int, corpus_version: Optional[int] = None) -> LexicalResult:
+        """
+        BM25 hits for one chat. `confident` means the best chunk contains enough of the
+        query terms and clearly beats the runner-up, so vector search can be skipped.
+        Pass the chat's corpus_version when the caller has it; it is looked up otherwise.
+        """
+        index = await self._load(chat_id, corpus_version)
+        if index is None:
+            return LexicalResult([], False)
+        ranked, n_terms, best_matched = await asyncio.to_thread(index.search, query, k)
+        hits = [
+            LexicalHit(Document(page_content=index.texts[i], metadata=index.metadatas[i]), score)
+            for i, score in ranked
+        ]
+        confident = (
+            bool(hits)
+            and n_terms >= settings.LEXICAL_FASTPATH_MIN_TERMS
+            and best_matched / n_terms >= settings.LEXICAL_FASTPATH_MIN_COVERAGE
+            and (len(hits) == 1 or hits[0].score >= settings.LEXICAL_FASTPATH_MARGIN * hits[1].score)
+        )
+        return LexicalResult(hits, confident)
+
+
+def _chunk_key(doc: Document) -> Tuple[str, Optional[int]]:
+    md = doc.metadata or {}
+    index = md.get("chunk_index")
+    # Pinecone hands numbers back as floats: 3.0 must key the same chunk as the lexical 3
+    return str(md.get("file_id")), None if index is None else int(float(index))
+
+
+def rrf_fuse(ranked_lists: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """Reciprocal-rank fusion of several ranked doc lists, deduplicated by (file_id, chunk_index)."""
+    scores: dict = {}
+    docs: dict = {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked):
+            key = _chunk_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in best]
+
+
+lexical_index = LexicalIndexStore(DatabaseChunks())
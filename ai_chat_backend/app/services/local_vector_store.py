@@ -0,0 +1,384 @@
+# app/services/local_vector_store.py
+"""
+Local vector index: one shard per chat, scored with NumPy on memory-mapped arrays.
+
+Shard layout ({root}/{chat_id or _unscoped}/):
+- shard.json   {"dim": int, "dtype": "float32" | "float16"}
+- vectors.bin  row-major unit vectors, appended on add
+- meta.jsonl   one {"id", "text", "metadata"} line per row; its line count is the row count
+
+Vectors are L2-normalized on insert, so cosine similarity is a dot product.
+Writers take an exclusive flock on the shard, readers a shared one, so API and
+ingest processes can share one directory. Threads of one process share the _Shard
+objects: refresh() swaps in a fully loaded copy, so a concurrent reader never sees
+a half-loaded shard.
+
+Searches must name a chat (a chat_id filter): one without would score every shard, so
+unscoped search is left to the Pinecone backend. Deletes read the shards of the chats they
+are given, and fall back to every shard only when they get none.
+"""
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+UNSCOPED_SHARD = "_unscoped"
+SCORE_BLOCK_ROWS = 65_536
+
+
+def _eq_value(cond: Any) -> Any:
+    """Accept both {"field": value} and Pinecone-style {"field": {"$eq": value}}."""
+    if isinstance(cond, dict):
+        return cond.get("$eq")
+    return cond
+
+
+def _matches(metadata: dict, filter: Optional[dict]) -> bool:
+    if not filter:
+        return True
+    return all(str(metadata.get(k)) == str(_eq_value(v)) for k, v in filter.items())
+
+
+class _Shard:
+    def __init__(self, path: str, dtype: str):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.vectors: Optional[np.ndarray] = None
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._reload = threading.Lock()  # one thread reloads, the others wait for its result
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.path, "meta.jsonl")
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.bin")
+
+    @property
+    def info_path(self) -> str:
+        return os.path.join(self.path, "shard.json")
+
+    @contextmanager
+    def locked(self, exclusive: bool) -> Iterator[None]:
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _current_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def refresh(self) -> None:
+        """Reload ids/texts and remap vectors if another writer changed the shard. Call under lock."""
+        if self._current_stamp() == self._stamp:
+            return
+        with self._reload:
+            stamp = self._current_stamp()
+            if stamp == self._stamp:  # another thread got here first
+                return
+            ids: List[str] = []
+            texts: List[str] = []
+            metadatas: List[dict] = []
+            vectors: Optional[np.ndarray] = None
+            dim, dtype = self.dim, self.dtype
+            if stamp is not None:
+                with open(self.info_path) as fh:
+                    info = json.load(fh)
+                dim, dtype = info["dim"], np.dtype(info["dtype"])
+                with open(self.meta_path, encoding="utf-8") as fh:
+                    for line in fh:
+                        row = json.loads(line)
+                        ids.append(row["id"])
+                        texts.append(row["text"])
+                        metadatas.append(row["metadata"])
+                if ids:
+                    vectors = np.memmap(self.vectors_path, dtype=dtype, mode="r", shape=(len(ids), dim))
+            # readers that saw the old stamp keep working on the old lists; the stamp goes last
+            self.dim, self.dtype = dim, dtype
+            self.ids, self.texts, self.metadatas, self.vectors = ids, texts, metadatas, vectors
+            self._stamp = stamp
+
+    def append(self, ids: List[str], texts: List[str], metadatas: List[dict], vectors: np.ndarray) -> None:
+        """Call under an exclusive lock."""
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(self.info_path, "w") as fh:
+                json.dump({"dim": self.dim, "dtype": self.dtype.name}, fh)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"vector dim {vectors.shape[1]} != shard dim {self.dim}")
+
+        # vectors first: meta.jsonl defines the row count readers map
+        with open(self.vectors_path, "ab") as fh:
+            fh.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+        with open(self.meta_path, "a", encoding="utf-8") as fh:
+            for id_, text, md in zip(ids, texts, metadatas):
+                fh.write(json.dumps({"id": id_, "text": text, "metadata": md}, ensure_ascii=False) + "\n")
+
+    def rewrite(self, keep: np.ndarray) -> None:
+        """Compact the shard to the rows in the boolean mask `keep`. Call under an exclusive lock."""
+        kept_vectors = np.asarray(self.vectors[keep]) if self.vectors is not None else None
+        tmp_vectors, tmp_meta = self.vectors_path + ".tmp", self.meta_path + ".tmp"
+        with open(tmp_vectors, "wb") as fh:
+            if kept_vectors is not None:
+                fh.write(kept_vectors.tobytes())
+        with open(tmp_meta, "w", encoding="utf-8") as fh:
+            for i in np.flatnonzero(keep):
+                fh.write(json.dumps(
+                    {"id": self.ids[i], "text": self.texts[i], "metadata": self.metadatas[i]},
+                    ensure_ascii=False,
+                ) + "\n")
+        self.vectors = None  # drop the old mapping before replacing the file
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_meta, self.meta_path)
+
+    def top_k(self, query: np.ndarray, k: int, filter: Optional[dict]) -> List[Tuple[int, float]]:
+        """Call under a lock, after refresh()."""
+        if self.vectors is None or not len(self.ids) or k < 1:
+            return []
+        n = len(self.ids)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            block = self.vectors[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+        np.clip(scores, -1.0, 1.0, out=scores)  # float16 rounding can overshoot
+
+        extra = {k_: v for k_, v in (filter or {}).items() if k_ != "chat_id"}
+        if extra:
+            mask = np.fromiter((_matches(md, extra) for md in self.metadatas), dtype=bool, count=n)
+            scores[~mask] = -np.inf
+
+        k = min(k, n)
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx])]
+        return [(int(i), float(scores[i])) for i in idx if np.isfinite(scores[i])]
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, root: str, embedding: Embeddings, dtype: str = "float32"):
+        if dtype not in ("float32", "float16"):
+            raise ValueError("dtype must be float32 or float16")
+        self.root = root
+        self._embedding = embedding
+        self.dtype = dtype
+        self._shards: dict[str, _Shard] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def _shard(self, chat_id: Any) -> _Shard:
+        name = str(chat_id) if chat_id else UNSCOPED_SHARD
+        with self._lock:
+            if name not in self._shards:
+                self._shards[name] = _Shard(os.path.join(self.root, name), self.dtype)
+            return self._shards[name]
+
+    def _all_shards(self) -> List[_Shard]:
+        names = [d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d))]
+        return [self._shard(None if n == UNSCOPED_SHARD else n) for n in names]
+
+    def _shards_of(self, chat_ids: Optional[Iterable[Any]]) -> List[_Shard]:
+        """The shards of `chat_ids` (None for the unscoped one); all of them when `chat_ids` is None."""
+        if chat_ids is None:
+            return self._all_shards()
+        return [self._shard(c) for c in dict.fromkeys(str(c) if c else None for c in chat_ids)]
+
+    @staticmethod
+    def _normalize(vectors: Iterable[List[float]]) -> np.ndarray:
+        arr = np.asarray(list(vectors), dtype=np.float32)
+        norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return arr / norms
+
+    # -----------------------
+    # Write
+    # -----------------------
+
+    def add_vectors(
+            self,
+            texts: List[str],
+            vectors: List[List[float]],
+            metadatas: Optional[List[dict]] = None,
+            ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Add pre-computed embeddings, grouped into per-chat shards."""
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        arr = self._normalize(vectors)
+
+        groups: dict[str, List[int]] = {}
+        for i, md in enumerate(metadatas):
+            groups.setdefault(str(md.get("chat_id") or ""), []).append(i)
+        for chat_id, rows in groups.items():
+            shard = self._shard(chat_id)
+            with shard.locked(exclusive=True):
+                shard.refresh()
+                shard.append(
+                    [ids[i] for i in rows], [texts[i] for i in rows],
+                    [metadatas[i] for i in rows], arr[rows],
+                )
+        return ids
+
+    def add_texts(
+            self,
+            texts: Iterable[str],
+            metadatas: Optional[List[dict]] = None,
+            ids: Optional[List[str]] = None,
+            **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_vectors(texts, self._embedding.embed_documents(texts), metadatas, ids)
+
+    def delete(
+            self,
+            ids: Optional[List[str]] = None,
+            filter: Optional[dict] = None,
+            chat_ids: Optional[Iterable[Any]] = None,
+            **kwargs: Any,
+    ) -> bool:
+        """
+        Delete by vector ids and/or a metadata filter such as {"file_id": {"$eq": ...}}.
+        Only the filter's chat, else the shards of `chat_ids`, are rewritten; every shard is read
+        when neither names one.
+        """
+        if not ids and not filter:
+            return False
+        wanted = set(ids or [])
+        chat_id = _eq_value((filter or {}).get("chat_id"))
+        shards = [self._shard(chat_id)] if chat_id else self._shards_of(chat_ids)
+        for shard in shards:
+            if not os.path.isdir(shard.path):
+                continue
+            with shard.locked(exclusive=True):
+                shard.refresh()
+                if not shard.ids:
+                    continue
+                drop = np.fromiter(
+                    ((not wanted or id_ in wanted) and _matches(md, filter)
+                     for id_, md in zip(shard.ids, shard.metadatas)),
+                    dtype=bool, count=len(shard.ids),
+                )
+                if drop.any():
+                    shard.rewrite(~drop)
+        return True
+
+    # -----------------------
+    # Read
+    # -----------------------
+
+    def get_vectors(
+            self, ids: List[str], chat_ids: Optional[Iterable[Any]] = None
+    ) -> List[Tuple[str, str, np.ndarray, dict]]:
+        """
+        (id, text, stored unit vector, metadata) for the given ids, in any order; missing ids are
+        skipped. Only the shards of `chat_ids` (None for the unscoped one) are read; all of them
+        when `chat_ids` is None.
+        """
+        wanted = set(ids)
+        shards = self._shards_of(chat_ids)
+        found: List[Tuple[str, str, np.ndarray, dict]] = []
+        for shard in shards:
+            if not os.path.isdir(shard.path):
+                continue
+            with shard.locked(exclusive=False):
+                shard.refresh()
+                ids_, texts, metadatas, vectors = shard.ids, shard.texts, shard.metadatas, shard.vectors
+                for i, id_ in enumerate(ids_):
+                    if id_ in wanted:
+                        found.append((id_, texts[i], np.array(vectors[i], dtype=np.float32), metadatas[i]))
+        return found
+
+    def similarity_search_with_vectors(
+            self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float, np.ndarray]]:
+        """
+        Top-k (doc, cosine similarity, stored unit vector) in the chat named by the filter's
+        chat_id ("" or None for the unscoped shard). Raises ValueError without one.
+        """
+        if not filter or "chat_id" not in filter:
+            raise ValueError("LocalVectorStore only searches one chat: pass a chat_id filter")
+        query = self._normalize([embedding])[0]
+        shard = self._shard(_eq_value(filter["chat_id"]))
+
+        hits: List[Tuple[Document, float, np.ndarray]] = []
+        if not os.path.isdir(shard.path):
+            return hits
+        with shard.locked(exclusive=False):
+            shard.refresh()
+            for i, score in shard.top_k(query, k, filter):  # best first
+                doc = Document(page_content=shard.texts[i], metadata=shard.metadatas[i], id=shard.ids[i])
+                hits.append((doc, score, np.array(shard.vectors[i], dtype=np.float32)))
+        return hits
+
+    def similarity_search_by_vector_with_score(
+            self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float]]:
+        return [(doc, score) for doc, score, _ in self.similarity_search_with_vectors(embedding, k, filter)]
+
+    def similarity_search_with_score(
+            self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search(
+            self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    async def asimilarity_search_with_score(
+            self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = await self._embedding.aembed_query(query)
+        return await asyncio.to_thread(self.similarity_search_by_vector_with_score, embedding, k, filter)
+
+    async def _asimilarity_search_with_relevance_scores(
+            self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        relevance = self._select_relevance_score_fn()
+        results = await self.asimilarity_search_with_score(query, k, **kwargs)
+        return [(doc, relevance(score)) for doc, score in results]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # same scale as PineconeVectorStore's cosine relevance, so MIN_SCORE means the same thing
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(
+            cls,
+            texts: List[str],
+            embedding: Embeddings,
+            metadatas: Optional[List[dict]] = None,
+            ids: Optional[List[str]] = None,
+            root: str = "vector_index",
+            **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(root, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
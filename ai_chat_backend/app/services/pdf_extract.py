@@ -0,0 +1,174 @@
+# app/services/pdf_extract.py
+"""
+Page-parallel PDF text extraction.
+
+The page list is cut into ranges of PDF_PAGES_PER_TASK that run on a shared process pool
+(PDF_EXTRACT_PROCESSES, 0 = one per CPU). Workers open the spooled download by path, so
+only (path, start, stop) is pickled, never the document bytes, and keep the last few
+documents open across their ranges instead of parsing them again for each one. Pages are
+yielded in order while later ranges still run. Each page gets PDF_PAGE_TIMEOUT_S (SIGALRM in
+the worker); a page that overruns or fails yields "".
+"""
+import logging
+import os
+import signal
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from multiprocessing import get_context
+from typing import IO, Deque, Iterator, List, Optional, Tuple
+
+from PyPDF2 import PdfReader
+
+from app.config import settings
+from app.services.chunker import PAGE_BREAK
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+PAGE_SEPARATOR = PAGE_BREAK  # the chunker treats page breaks as boundaries
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class _PageTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise _PageTimeout()
+
+
+# pool process only: readers of the documents it last worked on, keyed by path and inode,
+# least recently used first
+READERS_PER_WORKER = 4
+_readers: "OrderedDict[Tuple[str, int], Tuple[IO[bytes], PdfReader]]" = OrderedDict()
+
+
+def _open_reader(path: str) -> PdfReader:
+    """
+    Reuse open readers while ranges of their documents keep coming: opening a PDF parses its
+    xref and walking to a page flattens the page tree, both in proportion to the page count,
+    which per range would cost more than the extraction itself on long documents. Ranges of
+    concurrent ingests interleave on the shared pool, so the last READERS_PER_WORKER documents
+    stay open; the least recently used is closed when another arrives, so an idle worker holds
+    at most that many (possibly already deleted) spool files open.
+    """
+    key = (path, os.stat(path).st_ino)
+    entry = _readers.get(key)
+    if entry is not None:
+        _readers.move_to_end(key)
+        return entry[1]
+    fh = open(path, "rb")
+    try:
+        reader = PdfReader(fh)
+        reader.pages[0]  # flatten the page tree once
+    except Exception:
+        fh.close()
+        raise
+    _readers[key] = (fh, reader)
+    while len(_readers) > READERS_PER_WORKER:
+        _, (old_fh, _) = _readers.popitem(last=False)
+        old_fh.close()
+    return reader
+
+
+def _extract_range(path: str, start: int, stop: int, timeout_s: float) -> Tuple[List[str], int]:
+    """Runs in a pool process: text of pages [start, stop) and how many timed out."""
+    signal.signal(signal.SIGALRM, _on_alarm)
+    pages: List[str] = []
+    timeouts = 0
+    reader = _open_reader(path)
+    for i in range(start, stop):
+        signal.setitimer(signal.ITIMER_REAL, timeout_s)
+        try:
+            pages.append(reader.pages[i].extract_text() or "")
+        except _PageTimeout:
+            pages.append("")
+            timeouts += 1
+        except Exception:
+            pages.append("")
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return pages, timeouts
+
+
+def pool_size() -> int:
+    return settings.PDF_EXTRACT_PROCESSES or os.cpu_count() or 1
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the API process runs threads and an event loop, which fork would copy mid-flight
+            _pool = ProcessPoolExecutor(max_workers=pool_size(), mp_context=get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pages_inline(stream: IO[bytes]) -> Iterator[str]:
+    """Single-threaded fallback, no per-page timeout."""
+    for pg in PdfReader(stream).pages:
+        try:
+            yield pg.extract_text() or ""
+        except Exception:
+            yield ""
+
+
+def iter_pdf_pages(path: str) -> Iterator[str]:
+    """
+    Page texts in order, as their ranges finish. At most two ranges per pool process are
+    submitted ahead of the consumer, so a slow consumer holds back extraction.
+    """
+    with open(path, "rb") as fh:
+        n_pages = len(PdfReader(fh).pages)
+    if n_pages == 0:
+        return
+    if pool_size() <= 1:
+        with open(path, "rb") as fh:
+            yield from iter_pages_inline(fh)
+        return
+
+    step = settings.PDF_PAGES_PER_TASK
+    timeout_s = settings.PDF_PAGE_TIMEOUT_S
+    pool = _get_pool()
+    starts = iter(range(0, n_pages, step))
+    submit = lambda start: pool.submit(_extract_range, path, start, min(start + step, n_pages), timeout_s)
+    pending: Deque[Future] = deque()
+    timeouts = 0
+    try:
+        pending.extend(submit(start) for start in islice(starts, 2 * pool_size()))
+        while pending:
+            try:
+                # SIGALRM bounds each page; this only catches a worker wedged outside Python
+                range_text, range_timeouts = pending.popleft().result(timeout=timeout_s * step + 30)
+            except (BrokenProcessPool, TimeoutError):
+                logger.error("pdf extraction pool failed on %s; restarting it", path)
+                shutdown_pool()
+                raise
+            timeouts += range_timeouts
+            pending.extend(submit(start) for start in islice(starts, 1))
+            yield from range_text
+    finally:
+        for fut in pending:  # the consumer stopped early
+            fut.cancel()
+
+    if timeouts:
+        logger.warning("pdf extraction: %d of %d pages timed out in %s", timeouts, n_pages, path)
+        metrics.counter("pdf_page_timeouts").inc(timeouts)
+    metrics.counter("pdf_pages_extracted").inc(n_pages)
+
+
+def extract_pdf_text(path: str) -> str:
+    return PAGE_SEPARATOR.join(iter_pdf_pages(path))
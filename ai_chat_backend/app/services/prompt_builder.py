@@ -0,0 +1,115 @@
+# app/services/prompt_builder.py
+"""
+Token-budgeted prompt assembly.
+
+The system prompt, template and question are always sent. Whatever is left of the budget
+is split between retrieved context (`context_share`) and chat history; a share one side
+doesn't need carries over to the other.
+- Context chunks arrive best-first: the lowest-ranked are truncated, then dropped.
+- History is kept newest-first: the oldest turns are dropped.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List
+
+import tiktoken
+
+ENCODING_NAME = "o200k_base"  # gpt-4.1 family
+MESSAGE_OVERHEAD = 4  # role/framing tokens per chat message
+MIN_TRUNCATED_CHUNK = 64  # below this a partial chunk isn't worth sending
+CHUNK_SEPARATOR = "\n\n"
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> tiktoken.Encoding:
+    # loaded on first use: tiktoken may have to fetch the BPE file
+    return tiktoken.get_encoding(ENCODING_NAME)
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    tokens = _encoding().encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return _encoding().decode(tokens[:max_tokens])
+
+
+@dataclass
+class BuiltPrompt:
+    messages: List[dict]
+    prompt_tokens: int
+    saved_tokens: int
+    chunks_used: int
+    history_used: int
+
+
+def _pack_chunks(chunks: List[str], chunk_tokens: List[int], cap: int) -> tuple[List[str], int]:
+    kept: List[str] = []
+    used = 0
+    for text, n in zip(chunks, chunk_tokens):
+        if used + n <= cap:
+            kept.append(text)
+            used += n
+            continue
+        room = cap - used
+        if room >= MIN_TRUNCATED_CHUNK:
+            kept.append(truncate_tokens(text, room))
+            used += room
+        break
+    return kept, used
+
+
+def _pack_history(history: List[dict], history_tokens: List[int], cap: int) -> tuple[List[dict], int]:
+    kept: List[dict] = []
+    used = 0
+    for msg, n in zip(reversed(history), reversed(history_tokens)):
+        if used + n > cap:
+            break
+        kept.append(msg)
+        used += n
+    kept.reverse()
+    return kept, used
+
+
+def build_prompt(
+        system_prompt: str,
+        template: str,
+        query: str,
+        chunks: List[str],
+        history: List[dict] | None,
+        budget: int,
+        context_share: float,
+        context_header: str = "",
+) -> BuiltPrompt:
+    history = history or []
+    fixed = (
+        count_tokens(system_prompt)
+        + count_tokens(template.format(context=context_header, query=query))
+        + 2 * MESSAGE_OVERHEAD
+    )
+    sep = count_tokens(CHUNK_SEPARATOR)
+    chunk_tokens = [count_tokens(c) + sep for c in chunks]
+    history_tokens = [count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in history]
+
+    available = max(budget - fixed, 0)
+    history_reserve = min(sum(history_tokens), int(available * (1 - context_share)))
+    kept_chunks, context_used = _pack_chunks(chunks, chunk_tokens, available - history_reserve)
+    kept_history, history_used = _pack_history(history, history_tokens, available - context_used)
+
+    context = context_header + CHUNK_SEPARATOR.join(kept_chunks)
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(kept_history)
+    messages.append({"role": "user", "content": template.format(context=context, query=query)})
+
+    prompt_tokens = fixed + context_used + history_used
+    untrimmed = fixed + sum(chunk_tokens) + sum(history_tokens)
+    return BuiltPrompt(
+        messages=messages,
+        prompt_tokens=prompt_tokens,
+        saved_tokens=max(untrimmed - prompt_tokens, 0),
+        chunks_used=len(kept_chunks),
+        history_used=len(kept_history),
+    )
@@ -1,7 +1,18 @@
-from typing import List, Tuple, Any
+import asyncio
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Tuple, Any
 from uuid import UUID
-from openai import OpenAI
-from app.services.rag_store import get_vectorstore
+import numpy as np
+from cachetools import TTLCache
+from openai import AsyncOpenAI
+from app.config import settings
+from app.utils import metrics
+from app.services.answer_cache import answer_cache, history_digest
+from app.services.lexical_index import LexicalResult, lexical_index, rrf_fuse
+from app.services.prompt_builder import build_prompt, count_tokens
+from app.services.rag_store import get_vectorstore, get_embeddings, asearch_with_vectors, searches_unscoped
+from app.services.rerank import mmr_select
 
 PROMPT_TEMPLATE = """Use the information in the context below as your primary source when answering.
 You may use outside knowledge only to complement the context, not to override or contradict it.
@@ -15,15 +26,29 @@ Context:
 Question: {query}
 """
 
-client = OpenAI()
+client = AsyncOpenAI(timeout=settings.LLM_TIMEOUT_S)
 MODEL = "gpt-4.1-mini"
 REFUSAL_PREFIX = "I can only help with questions about your uploaded documents."
 NO_CONTEXT_PREFIX = "I couldn't find any relevant content in your uploaded documents."
+NO_CONTEXT_ANSWER = (
+    NO_CONTEXT_PREFIX + " "
+    "Please upload or attach study materials, then ask your question."
+)
 
 MIN_SCORE = 0.35
 TOP_K_PRIMARY = 4
 TOP_K_FALLBACK = 3
 
+# MMR re-ranking of the chat-scoped search: over-fetch, then keep a diverse subset
+USE_MMR = True
+MMR_FETCH_K = 20
+MMR_K = 3
+MMR_LAMBDA = 0.5
+GLOBAL_CONTEXT_HEADER = "[Global context — not chat-scoped]\n"
+
+# chats whose own documents recently matched: the global fallback is skipped for them
+_chat_scoped_hint: TTLCache = TTLCache(maxsize=10_000, ttl=max(settings.RAG_FALLBACK_HINT_TTL_S, 1))
+
 
 SYSTEM_PROMPT = (
     "You are a document assistant. Your sole purpose is to help users with questions "
@@ -39,22 +64,87 @@ SYSTEM_PROMPT = (
     "Please ask me something about your files.'"
 )
 
-def _call_llm(context: str, query: str, history: list | None = None) -> Tuple[str, int]:
-    prompt = PROMPT_TEMPLATE.format(context=context, query=query)
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-    if history:
-        messages.extend(history)
-    messages.append({"role": "user", "content": prompt})
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=messages,
-        temperature=0,
+@dataclass
+class StreamedAnswer:
+    """Filled in by stream_rag_answer while the caller consumes its tokens."""
+    parts: List[str] = field(default_factory=list)
+    tokens_used: int = 0
+    prompt_tokens: int = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def estimate_tokens(self) -> int:
+        if self.tokens_used or not self.prompt_tokens:
+            return self.tokens_used  # no LLM call (cache hit / no context) costs nothing
+        # usage only arrives with the final stream chunk; count locally when it never came
+        return self.prompt_tokens + count_tokens(self.text)
+
+
+@dataclass
+class RetrievedContext:
+    chunks: List[str]  # best-first
+    chat_scoped: bool = True
+    lexical: bool = False  # from the lexical fast path: the question was never embedded
+
+
+def _build_messages(context: RetrievedContext, query: str, history: list | None = None) -> Tuple[list, int]:
+    prompt = build_prompt(
+        SYSTEM_PROMPT,
+        PROMPT_TEMPLATE,
+        query,
+        context.chunks,
+        history,
+        budget=settings.PROMPT_TOKEN_BUDGET,
+        context_share=settings.PROMPT_CONTEXT_SHARE,
+        context_header="" if context.chat_scoped else GLOBAL_CONTEXT_HEADER,
+    )
+    metrics.counter("prompt_tokens_saved").inc(prompt.saved_tokens)
+    metrics.histogram("prompt_tokens", buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000)).observe(
+        prompt.prompt_tokens
+    )
+    return prompt.messages, prompt.prompt_tokens
+
+
+async def _call_llm(context: RetrievedContext, query: str, history: list | None = None) -> Tuple[str, int]:
+    messages, _ = _build_messages(context, query, history)
+    # wait_for cancels the in-flight HTTP request on timeout instead of leaving it running
+    response = await asyncio.wait_for(
+        client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            temperature=0,
+        ),
+        timeout=settings.LLM_TIMEOUT_S,
     )
     return response.choices[0].message.content, response.usage.total_tokens
 
 
-def _has_scores_api(vs) -> bool:
-    return hasattr(vs, "similarity_search_with_score") or hasattr(vs, "similarity_search_with_relevance_scores")
+async def _stream_llm(
+        context: RetrievedContext, query: str, history: list | None, result: StreamedAnswer
+) -> AsyncIterator[str]:
+    messages, result.prompt_tokens = _build_messages(context, query, history)
+    stream = await asyncio.wait_for(
+        client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            temperature=0,
+            stream=True,
+            stream_options={"include_usage": True},
+        ),
+        timeout=settings.LLM_TIMEOUT_S,
+    )
+    try:
+        async for chunk in stream:
+            if chunk.usage:
+                result.tokens_used = chunk.usage.total_tokens
+            if chunk.choices and (delta := chunk.choices[0].delta.content):
+                result.parts.append(delta)
+                yield delta
+    finally:
+        await stream.close()
+
 
 def _filter_by_score(results: List[Tuple[Any, float]]) -> List[Any]:
     return [doc for (doc, s) in results if (s is None or s >= MIN_SCORE)]
@@ -67,57 +157,213 @@ def _to_docs_only(results) -> List[Any]:
     return results
 
 
-def get_rag_answer(query_text: str, chat_id: UUID, history: list | None = None) -> Tuple[str, int]:
-    vs = get_vectorstore()
+async def _search(vs, query_text: str, k: int, filter: dict | None = None) -> List[Any]:
+    """
+    Async similarity search; stores without a relevance-score API fall back to plain search.
+    Raises asyncio.TimeoutError after RAG_SEARCH_TIMEOUT_S.
+    """
+    kwargs = {"filter": filter} if filter else {}
 
-    # === Try 1: search by chat_id ===
-    docs_primary = []
-    if _has_scores_api(vs):
+    async def _run() -> List[Any]:
         try:
-            if hasattr(vs, "similarity_search_with_relevance_scores"):
-                results = vs.similarity_search_with_relevance_scores(
-                    query_text, k=TOP_K_PRIMARY,
-                    filter={"chat_id": {"$eq": str(chat_id)}}
-                )
-            else:
-                results = vs.similarity_search_with_score(
-                    query_text, k=TOP_K_PRIMARY,
-                    filter={"chat_id": {"$eq": str(chat_id)}}
-                )
-            docs_primary = _filter_by_score(results)
-        except TypeError:
-            docs_primary = _to_docs_only(vs.similarity_search(query_text, k=TOP_K_PRIMARY))
-    else:
-        docs_primary = _to_docs_only(vs.similarity_search(
-            query_text, k=TOP_K_PRIMARY,
-            filter={"chat_id": {"$eq": str(chat_id)}}
-        ))
+            results = await vs.asimilarity_search_with_relevance_scores(query_text, k=k, **kwargs)
+            return _filter_by_score(results)
+        except (TypeError, NotImplementedError):
+            return _to_docs_only(await vs.asimilarity_search(query_text, k=k, **kwargs))
 
-    if docs_primary:
-        context = "\n\n".join(doc.page_content for doc in docs_primary)
-        return _call_llm(context, query_text, history)
+    return await asyncio.wait_for(_run(), timeout=settings.RAG_SEARCH_TIMEOUT_S)
+
+
+async def _embed_query(query_text: str) -> List[float]:
+    """The query's embedding, bounded like the LLM call: raises asyncio.TimeoutError after EMBED_TIMEOUT_S."""
+    return await asyncio.wait_for(get_embeddings().aembed_query(query_text), timeout=settings.EMBED_TIMEOUT_S)
 
-    # === Fallback: global search ===
-    docs_fallback = []
-    if _has_scores_api(vs):
+
+async def _search_mmr(query_text: str, filter: dict | None) -> List[Any]:
+    """
+    Fetch MMR_FETCH_K candidates with their stored vectors and keep MMR_K that are
+    relevant (>= MIN_SCORE) but not near-duplicates of each other.
+    """
+    embedding = await _embed_query(query_text)
+    candidates = await asyncio.wait_for(
+        asearch_with_vectors(embedding, MMR_FETCH_K, filter), timeout=settings.RAG_SEARCH_TIMEOUT_S
+    )
+    candidates = [c for c in candidates if c[1] >= MIN_SCORE]
+    if not candidates:
+        return []
+    with metrics.histogram("rag_mmr_seconds", buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005)).time():
+        picked = mmr_select(
+            np.asarray(embedding, dtype=np.float32),
+            np.stack([vec for _, _, vec in candidates]),
+            k=MMR_K,
+            lambda_mult=MMR_LAMBDA,
+        )
+    return [candidates[i][0] for i in picked]
+
+
+async def _search_primary(vs, query_text: str, chat_filter: dict) -> List[Any]:
+    if USE_MMR:
         try:
-            if hasattr(vs, "similarity_search_with_relevance_scores"):
-                results_fb = vs.similarity_search_with_relevance_scores(query_text, k=TOP_K_FALLBACK)
-            else:
-                results_fb = vs.similarity_search_with_score(query_text, k=TOP_K_FALLBACK)
-            docs_fallback = _filter_by_score(results_fb)
-        except TypeError:
-            docs_fallback = _to_docs_only(vs.similarity_search(query_text, k=TOP_K_FALLBACK))
-    else:
-        docs_fallback = _to_docs_only(vs.similarity_search(query_text, k=TOP_K_FALLBACK))
+            return await _search_mmr(query_text, chat_filter)
+        except NotImplementedError:
+            pass
+    return await _search(vs, query_text, TOP_K_PRIMARY, filter=chat_filter)
+
+
+async def _retrieve_sequential(
+        vs, query_text: str, chat_filter: dict, with_fallback: bool
+) -> Tuple[List[Any], List[Any]]:
+    docs_primary = await _search_primary(vs, query_text, chat_filter)
+    if docs_primary or not with_fallback:
+        return docs_primary, []
+    return [], await _search(vs, query_text, TOP_K_FALLBACK)
+
+
+async def _retrieve_parallel(vs, query_text: str, chat_filter: dict) -> Tuple[List[Any], List[Any]]:
+    """
+    Start the chat-scoped and global searches together; the global result is
+    dropped as soon as the chat-scoped one has hits above MIN_SCORE.
+    """
+    # embed once up front: both searches then read the query vector from the embedding cache
+    await _embed_query(query_text)
+    primary = asyncio.create_task(_search_primary(vs, query_text, chat_filter))
+    fallback = asyncio.create_task(_search(vs, query_text, TOP_K_FALLBACK))
+    try:
+        docs_primary = await primary
+        if docs_primary:
+            return docs_primary, []
+        return [], await fallback
+    finally:
+        for task in (primary, fallback):
+            if not task.done():
+                task.cancel()
+
+
+async def search_lexical(
+        query_text: str, chat_id: UUID, corpus_version: int | None = None
+) -> LexicalResult | None:
+    """
+    The chat's BM25 hits, or None with HYBRID_RETRIEVAL off. Callers check `confident` before
+    the answer cache: a confident question is answered without ever being embedded. Hand the
+    result to get_rag_answer / stream_rag_answer so the chat is not searched twice.
+    """
+    if not settings.HYBRID_RETRIEVAL:
+        return None
+    return await lexical_index.search(chat_id, query_text, settings.LEXICAL_TOP_K, corpus_version)
+
+
+async def _retrieve_context(
+        query_text: str,
+        chat_id: UUID,
+        corpus_version: int | None = None,
+        lexical: LexicalResult | None = None,
+) -> RetrievedContext | None:
+    vs = get_vectorstore()
+    chat_filter = {"chat_id": {"$eq": str(chat_id)}}
+    hinted = settings.RAG_FALLBACK_HINT_TTL_S > 0 and str(chat_id) in _chat_scoped_hint
+
+    lexical_docs: List[Any] = []
+    if lexical is None:
+        lexical = await search_lexical(query_text, chat_id, corpus_version)
+    if lexical is not None:
+        if lexical.confident:
+            # exact-term match is unambiguous: answer without embedding the query
+            metrics.counter("rag_lexical_fastpath").inc()
+            return RetrievedContext([h.doc.page_content for h in lexical.hits[:TOP_K_PRIMARY]], lexical=True)
+        lexical_docs = [h.doc for h in lexical.hits]
+
+    # the local store has no global search: its chats get no fallback
+    unscoped = searches_unscoped()
+    strategy = settings.RAG_RETRIEVAL_STRATEGY
+    if not unscoped:
+        strategy = "scoped"
+    elif hinted:
+        strategy = "hinted"
+    with metrics.histogram("rag_retrieval_seconds", strategy=strategy).time():
+        if strategy == "parallel" and not lexical_docs:
+            docs_primary, docs_fallback = await _retrieve_parallel(vs, query_text, chat_filter)
+        else:
+            # chat-scoped lexical hits already rule out the global fallback
+            docs_primary, docs_fallback = await _retrieve_sequential(
+                vs, query_text, chat_filter, with_fallback=unscoped and not (hinted or lexical_docs)
+            )
+
+    if lexical_docs:
+        docs_primary = rrf_fuse([docs_primary, lexical_docs], k=TOP_K_PRIMARY, rrf_k=settings.RRF_K)
+
+    if docs_primary:
+        _chat_scoped_hint[str(chat_id)] = True
+        return RetrievedContext([doc.page_content for doc in docs_primary])
 
     if docs_fallback:
-        context = "[Global context — not chat-scoped]\n" + "\n\n".join(doc.page_content for doc in docs_fallback)
-        return _call_llm(context, query_text, history)
-
-    # === No context ===
-    return (
-        "I couldn't find any relevant content in your uploaded documents. "
-        "Please upload or attach study materials, then ask your question.",
-        0,
-    )
+        return RetrievedContext([doc.page_content for doc in docs_fallback], chat_scoped=False)
+
+    return None
+
+
+async def lookup_cached_answer(
+        query_text: str, chat_id: UUID, corpus_version: int, history: list | None = None
+) -> str | None:
+    """Answer from the semantic cache if a near-identical question was already answered after the same history."""
+    embedding = await _embed_query(query_text)
+    return answer_cache.lookup(chat_id, corpus_version, embedding, history_digest(history))
+
+
+async def _store_answer(
+        query_text: str, chat_id: UUID, corpus_version: int | None, history: list | None, answer: str
+) -> None:
+    if corpus_version is None or not answer:
+        return
+    try:
+        embedding = await _embed_query(query_text)
+    except asyncio.TimeoutError:
+        metrics.counter("answer_cache_store_skipped", reason="embed_timeout").inc()
+        return  # the answer was delivered; it just isn't cached
+    answer_cache.store(chat_id, corpus_version, embedding, answer, history_digest(history))
+
+
+async def get_rag_answer(
+        query_text: str,
+        chat_id: UUID,
+        history: list | None = None,
+        corpus_version: int | None = None,
+        lexical: LexicalResult | None = None,
+) -> Tuple[str, int]:
+    """
+    Pass the chat's corpus_version to store the generated answer in the semantic answer cache,
+    and `lexical` when the caller already ran search_lexical.
+    Answers from the lexical fast path are not cached: their lookups skip the cache too.
+    """
+    context = await _retrieve_context(query_text, chat_id, corpus_version, lexical)
+    if context is None:
+        return NO_CONTEXT_ANSWER, 0
+    answer, tokens_used = await _call_llm(context, query_text, history)
+    if not context.lexical:
+        await _store_answer(query_text, chat_id, corpus_version, history, answer)
+    return answer, tokens_used
+
+
+async def stream_rag_answer(
+        query_text: str,
+        chat_id: UUID,
+        history: list | None,
+        result: StreamedAnswer,
+        corpus_version: int | None = None,
+        lexical: LexicalResult | None = None,
+) -> AsyncIterator[str]:
+    """
+    Same flow as get_rag_answer, but yields answer tokens as they arrive.
+    The full text and token usage accumulate in `result`.
+    """
+    context = await _retrieve_context(query_text, chat_id, corpus_version, lexical)
+    if context is None:
+        result.parts.append(NO_CONTEXT_ANSWER)
+        yield NO_CONTEXT_ANSWER
+        return
+
+    async with aclosing(_stream_llm(context, query_text, history, result)) as tokens:
+        async for delta in tokens:
+            yield delta
+    # only a fully streamed answer (usage arrives with the last chunk) is cached
+    if result.tokens_used and not context.lexical:
+        await _store_answer(query_text, chat_id, corpus_version, history, result.text)
@@ -1,19 +1,49 @@
 # app/services/rag_store.py
-from typing import Optional
+import asyncio
+import uuid
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
 from pinecone import Pinecone
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
 from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from app.config import settings
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.local_vector_store import LocalVectorStore
+
+EMBEDDING_MODEL = "text-embedding-3-small"
 
 _pc: Optional[Pinecone] = None
-_embeddings: Optional[OpenAIEmbeddings] = None
-_vectorstore: Optional[PineconeVectorStore] = None
+_embeddings: Optional[CachedEmbeddings] = None
+_vectorstore: Optional[VectorStore] = None
 
 def init_rag() -> None:
+    """
+    Build the embeddings and the vector store selected by VECTOR_BACKEND:
+    - pinecone: hosted index PINECONE_INDEX_NAME
+    - local: memory-mapped per-chat shards under LOCAL_INDEX_PATH
+    """
     global _pc, _embeddings, _vectorstore
-    if _pc is not None:
+    if _vectorstore is not None:
         return
 
+    _embeddings = CachedEmbeddings(
+        OpenAIEmbeddings(model=EMBEDDING_MODEL),
+        model=EMBEDDING_MODEL,
+        maxsize=settings.EMBED_CACHE_SIZE,
+        ttl_s=settings.EMBED_CACHE_TTL_S,
+        redis_url=settings.REDIS_URL,
+    )
+
+    if settings.VECTOR_BACKEND == "local":
+        _vectorstore = LocalVectorStore(
+            settings.LOCAL_INDEX_PATH, _embeddings, dtype=settings.LOCAL_INDEX_DTYPE
+        )
+        return
+    if settings.VECTOR_BACKEND != "pinecone":
+        raise RuntimeError(f"Unknown VECTOR_BACKEND: {settings.VECTOR_BACKEND}")
+
     _pc = Pinecone(api_key=settings.OPENAI_API_KEY if False else settings.PINECONE_API_KEY)
 
     if not _pc.has_index(settings.PINECONE_INDEX_NAME):
@@ -22,19 +52,117 @@ def init_rag() -> None:
             cloud="aws",
             region="us-east-1",
             embed={
-                "model": "text-embedding-3-small",
+                "model": EMBEDDING_MODEL,
                 "field_map": {"text": "chunk_text"}
             }
         )
 
-    _embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
     _vectorstore = PineconeVectorStore.from_existing_index(
         index_name=settings.PINECONE_INDEX_NAME,
         embedding=_embeddings,
         text_key="text",
     )
 
-def get_vectorstore() -> PineconeVectorStore:
+def get_vectorstore() -> VectorStore:
     if _vectorstore is None:
         init_rag()
     return _vectorstore
+
+def get_embeddings() -> CachedEmbeddings:
+    if _embeddings is None:
+        init_rag()
+    return _embeddings
+
+def searches_unscoped() -> bool:
+    """
+    Whether the store serves searches without a chat_id filter (the global fallback).
+    The local store only searches one chat's shard: unscoped search needs Pinecone.
+    """
+    return not isinstance(get_vectorstore(), LocalVectorStore)
+
+def _in_chats(vs: VectorStore, chat_ids: Optional[Iterable]) -> dict:
+    # delete() narrowing for the local store's shards; Pinecone would send it on as an API field
+    return {"chat_ids": chat_ids} if chat_ids is not None and isinstance(vs, LocalVectorStore) else {}
+
+def delete_file_vectors(file_id, chat_ids: Optional[Iterable] = None) -> None:
+    """
+    Remove every chunk of a file from the vector store.
+    `chat_ids` narrows a sharded store to the chats the vectors can be in (Pinecone ignores it).
+    """
+    vs = get_vectorstore()
+    vs.delete(filter={"file_id": {"$eq": str(file_id)}}, **_in_chats(vs, chat_ids))
+
+def delete_vectors(ids: List[str], chat_ids: Optional[Iterable] = None) -> None:
+    """`chat_ids` as for delete_file_vectors."""
+    vs = get_vectorstore()
+    step = settings.UPSERT_BATCH_SIZE
+    for i in range(0, len(ids), step):
+        vs.delete(ids=ids[i:i + step], **_in_chats(vs, chat_ids))
+
+def upsert_vectors(
+        texts: List[str], vectors: List[List[float]], metadatas: List[dict], ids: Optional[List[str]] = None
+) -> List[str]:
+    """Write pre-computed embeddings, so callers control embedding batching and retries."""
+    vs = get_vectorstore()
+    if hasattr(vs, "add_vectors"):  # LocalVectorStore and friends
+        return vs.add_vectors(texts, vectors, metadatas, ids)
+    if not isinstance(vs, PineconeVectorStore):
+        raise NotImplementedError(f"{type(vs).__name__} does not accept pre-computed vectors")
+    ids = ids or [str(uuid.uuid4()) for _ in texts]
+    records = [
+        {"id": id_, "values": vec, "metadata": {**md, "text": text}}
+        for id_, text, vec, md in zip(ids, texts, vectors, metadatas)
+    ]
+    step = settings.UPSERT_BATCH_SIZE
+    for i in range(0, len(records), step):
+        vs.index.upsert(vectors=records[i:i + step])
+    return ids
+
+def fetch_vectors(ids: List[str], chat_ids: Optional[Iterable] = None) -> dict:
+    """
+    Stored chunks by vector id: {id: (text, vector, metadata)}; missing ids are left out.
+    `chat_ids` narrows a sharded store to the chats the vectors can be in (Pinecone ignores it).
+    """
+    vs = get_vectorstore()
+    if hasattr(vs, "get_vectors"):  # LocalVectorStore and friends
+        return {id_: (text, vec, md) for id_, text, vec, md in vs.get_vectors(ids, chat_ids)}
+    if not isinstance(vs, PineconeVectorStore):
+        raise NotImplementedError(f"{type(vs).__name__} does not return stored vectors")
+    found = {}
+    step = settings.UPSERT_BATCH_SIZE
+    for i in range(0, len(ids), step):
+        res = vs.index.fetch(ids=ids[i:i + step])
+        for id_, vec in res.vectors.items():
+            metadata = dict(vec.metadata or {})
+            found[id_] = (metadata.pop("text", ""), vec.values, metadata)
+    return found
+
+def _pinecone_search_with_vectors(
+        vs: PineconeVectorStore, embedding: List[float], k: int, filter: Optional[dict]
+) -> List[Tuple[Document, float, np.ndarray]]:
+    res = vs.index.query(
+        vector=embedding, top_k=k, filter=filter, include_metadata=True, include_values=True
+    )
+    hits = []
+    for match in res["matches"]:
+        metadata = dict(match.get("metadata") or {})
+        text = metadata.pop("text", "")
+        doc = Document(page_content=text, metadata=metadata, id=match["id"])
+        hits.append((doc, match["score"], np.asarray(match["values"], dtype=np.float32)))
+    return hits
+
+async def asearch_with_vectors(
+        embedding: List[float], k: int, filter: Optional[dict] = None
+) -> List[Tuple[Document, float, np.ndarray]]:
+    """
+    Top-k (doc, relevance, stored vector) for re-ranking. Relevance uses the same
+    (cosine + 1) / 2 scale as similarity_search_with_relevance_scores.
+    """
+    vs = get_vectorstore()
+    if hasattr(vs, "similarity_search_with_vectors"):  # LocalVectorStore and friends
+        hits = await asyncio.to_thread(vs.similarity_search_with_vectors, embedding, k, filter)
+    elif isinstance(vs, PineconeVectorStore):
+        hits = await asyncio.to_thread(_pinecone_search_with_vectors, vs, embedding, k, filter)
+    else:
+        raise NotImplementedError(f"{type(vs).__name__} does not return stored vectors")
+    return [(doc, (score + 1) / 2, vec) for doc, score, vec in hits]
@@ -0,0 +1,41 @@
+# app/services/rerank.py
+"""
+Maximal-marginal-relevance selection over an over-fetched candidate set.
+"""
+from typing import List
+
+import numpy as np
+
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Greedy MMR: pick k of the candidate rows, trading relevance to `query` against
+    similarity to what was already picked (lambda_mult=1 is pure relevance).
+
+    Relevance is one (n, d) @ (d,) pass; each pick then adds a single row of the
+    candidate-candidate similarity, so the cost is O(k·n·d) instead of O(n²·d).
+    Cosine normalization is applied to those products, never to the matrix itself.
+    Returns candidate indices in selection order.
+    """
+    n = len(candidates)
+    if n == 0 or k < 1:
+        return []
+    cand = np.asarray(candidates, dtype=np.float32)
+    q = np.asarray(query, dtype=np.float32)
+    inv_norms = 1.0 / np.maximum(np.sqrt(np.einsum("ij,ij->i", cand, cand)), 1e-12)
+
+    relevance = (cand @ q) * inv_norms / max(float(np.linalg.norm(q)), 1e-12)
+    first = int(np.argmax(relevance))
+    selected = [first]
+    max_sim = (cand @ cand[first]) * inv_norms * inv_norms[first]
+    taken = np.zeros(n, dtype=bool)
+    taken[first] = True
+
+    for _ in range(min(k, n) - 1):
+        score = lambda_mult * relevance - (1 - lambda_mult) * max_sim
+        score[taken] = -np.inf
+        j = int(np.argmax(score))
+        selected.append(j)
+        taken[j] = True
+        np.maximum(max_sim, (cand @ cand[j]) * inv_norms * inv_norms[j], out=max_sim)
+    return selected
@@ -1,5 +1,6 @@
 # app/utils/dependencies.py
 from typing import AsyncGenerator
+from uuid import UUID
 
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -7,6 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import AsyncSessionLocal
 from app.models.user import User
+from app.services.auth_cache import Principal, auth_cache
 from app.utils.security import verify_token
 
 
@@ -21,13 +23,8 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
 bearer_scheme = HTTPBearer(auto_error=False)
 
 
-async def get_current_user(
-        request: Request,
-        creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-        db: AsyncSession = Depends(get_db),
-) -> User:
-    token = None
-
+def _authenticate(request: Request, creds: HTTPAuthorizationCredentials | None) -> UUID:
+    """The user id of a valid bearer token or access_token cookie; decoded tokens are cached."""
     if creds:
         token = creds.credentials
     else:
@@ -37,14 +34,45 @@ async def get_current_user(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="Missing token")
 
-    payload = verify_token(token)
-    if payload is None or (user_id := payload.get("sub")) is None:
+    payload = auth_cache.get_claims(token)
+    if payload is None:
+        payload = verify_token(token)
+        if payload is not None:
+            auth_cache.put_claims(token, payload)
+    try:
+        return UUID(payload["sub"])
+    except (TypeError, KeyError, ValueError):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="Invalid token")
 
-    user = await db.get(User, user_id)
+
+async def get_current_user(
+        request: Request,
+        creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+        db: AsyncSession = Depends(get_db),
+) -> User:
+    """The ORM user, loaded in the request's session: for endpoints that change the user."""
+    user = await db.get(User, _authenticate(request, creds))
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="User not found")
 
     return user
+
+
+async def get_current_principal(
+        request: Request,
+        creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+        db: AsyncSession = Depends(get_db),
+) -> Principal:
+    """A cached snapshot of the user: for endpoints that only need who is asking."""
+    user_id = _authenticate(request, creds)
+    principal = await auth_cache.get_principal(user_id)
+    if principal is None:
+        user = await db.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                                detail="User not found")
+        principal = Principal.from_user(user)
+        await auth_cache.put_principal(principal)
+    return principal
@@ -0,0 +1,132 @@
+# app/utils/metrics.py
+"""
+Minimal in-process metrics: counters, fixed-bucket histograms and callback gauges.
+Values are per worker process and are served as JSON by GET /metrics.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> dict:
+        return {"value": self._value}
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def _quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self._count:
+            return None
+        rank = q * self._count
+        seen = 0
+        for le, n in zip(self.buckets, self._counts):
+            seen += n
+            if seen >= rank:
+                return le
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative, seen = {}, 0
+            for le, n in zip(self.buckets, self._counts):
+                seen += n
+                cumulative[str(le)] = seen
+            cumulative["+Inf"] = self._count
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "buckets": cumulative,
+                "p50": self._quantile(0.5),
+                "p95": self._quantile(0.95),
+                "p99": self._quantile(0.99),
+            }
+
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, _LabelKey], Counter] = {}
+_histograms: Dict[Tuple[str, _LabelKey], Histogram] = {}
+_gauges: Dict[str, Callable[[], object]] = {}
+
+
+def _label_key(labels: dict) -> _LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def counter(name: str, **labels) -> Counter:
+    key = (name, _label_key(labels))
+    with _lock:
+        if key not in _counters:
+            _counters[key] = Counter()
+        return _counters[key]
+
+
+def histogram(name: str, buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+    key = (name, _label_key(labels))
+    with _lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram(buckets)
+        return _histograms[key]
+
+
+def register_gauge(name: str, fn: Callable[[], object]) -> None:
+    """`fn` is called on every snapshot; it may return a number or a dict."""
+    with _lock:
+        _gauges[name] = fn
+
+
+def _group(metrics: dict) -> dict:
+    out: dict = {}
+    for (name, labels), m in metrics.items():
+        out.setdefault(name, []).append({"labels": dict(labels), **m.snapshot()})
+    return out
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters, histograms, gauges = dict(_counters), dict(_histograms), dict(_gauges)
+    return {
+        "counters": _group(counters),
+        "histograms": _group(histograms),
+        "gauges": {name: fn() for name, fn in gauges.items()},
+    }
@@ -0,0 +1,53 @@
+# app/utils/pagination.py
+"""
+Keyset pagination over a (timestamp, id) pair.
+
+A page is read with a row comparison against the last row of the previous page, so it is
+an index range scan on (..., timestamp, id) however deep into the list it is, unlike OFFSET.
+The id breaks ties between rows with the same timestamp. The cursor is opaque to clients.
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Sequence, Tuple, TypeVar
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import Select, tuple_
+
+T = TypeVar("T")
+
+NEWEST_FIRST, OLDEST_FIRST = "desc", "asc"
+
+
+def encode_cursor(ts: datetime, id_: UUID) -> str:
+    return base64.urlsafe_b64encode(f"{ts.isoformat()}|{id_}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, id_ = raw.split("|")
+        return datetime.fromisoformat(ts), UUID(id_)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(stmt: Select, ts_col, id_col, cursor: Optional[str], limit: int, order: str) -> Select:
+    """`stmt` ordered by (ts_col, id_col) and limited to the rows after `cursor`, plus one to tell if there are more."""
+    if cursor:
+        key = tuple_(*decode_cursor(cursor))
+        stmt = stmt.where(tuple_(ts_col, id_col) < key if order == NEWEST_FIRST else tuple_(ts_col, id_col) > key)
+    if order == NEWEST_FIRST:
+        stmt = stmt.order_by(ts_col.desc(), id_col.desc())
+    else:
+        stmt = stmt.order_by(ts_col.asc(), id_col.asc())
+    return stmt.limit(limit + 1)
+
+
+def split_page(rows: Sequence[T], limit: int, ts_attr: str) -> Tuple[Sequence[T], Optional[str]]:
+    """The page's rows and the cursor of the next page, None on the last one."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, ts_attr), last.id)
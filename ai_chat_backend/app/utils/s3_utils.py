@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import os
+import tempfile
 import uuid
-from typing import Iterable, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Iterable, List, Optional, Tuple
 from urllib.parse import unquote
 
 import boto3
 from botocore.config import Config
+from botocore.exceptions import ClientError
 from app.config import settings
 from app.models.file import File, FileStatus
 from app.services.rag_store import get_vectorstore  # vector store đã có
@@ -49,12 +53,86 @@ def parse_s3_url(url: str) -> Tuple[str, str]:
 def s3_download_bytes(bucket: str, key: str) -> bytes:
     """
     Download the entire object into memory.
-    For large files, consider streaming/chunking.
+    For large files use s3_download_to_tempfile.
     """
     s3 = get_s3_client()
     obj = s3.get_object(Bucket=bucket, Key=key)
     return obj["Body"].read()
 
+def s3_head(bucket: str, key: str) -> Tuple[str, int]:
+    """(ETag without quotes, size) as S3 reports them."""
+    obj = get_s3_client().head_object(Bucket=bucket, Key=key)
+    return obj["ETag"].strip('"'), obj["ContentLength"]
+
+
+MB = 1024 * 1024
+STREAM_CHUNK = MB  # bytes held in memory per open stream
+
+
+class ObjectChanged(Exception):
+    """The object was overwritten while it was being read (S3 answered 412 to If-Match)."""
+
+
+def _get_object(s3, bucket: str, key: str, etag: Optional[str], **kwargs):
+    if etag:
+        kwargs["IfMatch"] = '"%s"' % etag.strip('"')
+    try:
+        return s3.get_object(Bucket=bucket, Key=key, **kwargs)
+    except ClientError as e:
+        if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 412:
+            raise ObjectChanged(f"s3://{bucket}/{key} no longer has ETag {etag}") from e
+        raise
+
+
+def _spool_range(s3, bucket: str, key: str, etag: str, fd: int, start: int, end: int) -> None:
+    body = _get_object(s3, bucket, key, etag, Range=f"bytes={start}-{end}")["Body"]
+    offset = start
+    for chunk in body.iter_chunks(STREAM_CHUNK):
+        os.pwrite(fd, chunk, offset)
+        offset += len(chunk)
+
+
+def s3_download_to_tempfile(bucket: str, key: str, etag: Optional[str] = None) -> IO[bytes]:
+    """
+    Spool an object to a named temp file (under INGEST_TMP_DIR) and return it open at offset 0;
+    the file is deleted when closed. Memory stays bounded regardless of object size:
+    - below S3_RANGE_THRESHOLD_MB: one streamed GET, STREAM_CHUNK at a time
+    - above: S3_RANGE_PART_MB ranged GETs, S3_RANGE_CONCURRENCY at a time, written in place
+    Every GET carries If-Match on `etag` (or, when not given, the ETag the first GET saw), so
+    parts of two versions are never stitched together: an overwrite raises ObjectChanged.
+    """
+    s3 = get_s3_client()
+    fh = tempfile.NamedTemporaryFile(prefix="ingest-", dir=settings.INGEST_TMP_DIR or None)
+    try:
+        obj = _get_object(s3, bucket, key, etag)
+        size = obj["ContentLength"]
+        if size < settings.S3_RANGE_THRESHOLD_MB * MB:
+            for chunk in obj["Body"].iter_chunks(STREAM_CHUNK):
+                fh.write(chunk)
+        else:
+            obj["Body"].close()
+            etag = obj["ETag"]
+            fh.truncate(size)
+            part = settings.S3_RANGE_PART_MB * MB
+            with ThreadPoolExecutor(max_workers=settings.S3_RANGE_CONCURRENCY) as pool:
+                futures = [
+                    pool.submit(_spool_range, s3, bucket, key, etag, fh.fileno(), start,
+                                min(start + part, size) - 1)
+                    for start in range(0, size, part)
+                ]
+                try:
+                    for fut in futures:
+                        fut.result()
+                except BaseException:
+                    pool.shutdown(cancel_futures=True)
+                    raise
+        fh.flush()
+        fh.seek(0)
+        return fh
+    except BaseException:
+        fh.close()
+        raise
+
 
 def _norm_uuid_list(xs: Iterable) -> list[uuid.UUID]:
     out = []
@@ -0,0 +1,81 @@
+# app/utils/streams.py
+"""
+Plumbing for staged async pipelines: a blocking iterator run on a worker thread behind a
+bounded queue, the reverse bridge for feeding an async stage into blocking code, and batching.
+The bounded queue is the backpressure: a stage that falls behind stalls the one before it.
+"""
+import asyncio
+import threading
+from typing import AsyncIterable, AsyncIterator, Callable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+_END = object()
+
+
+async def iterate_in_thread(make_iter: Callable[[], Iterator[T]], maxsize: int) -> AsyncIterator[T]:
+    """
+    Items of `make_iter()`, produced on a worker thread at most `maxsize` ahead of the consumer.
+    Closing this generator (aclose, or leaving `async with aclosing(...)`) stops the producer
+    after the item it is working on.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce() -> None:
+        it = make_iter()
+        try:
+            for item in it:
+                if stop.is_set():
+                    return
+                put((item, None))
+            put((_END, None))
+        except BaseException as e:
+            if not stop.is_set():
+                put((_END, e))
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+
+    producer = asyncio.ensure_future(asyncio.to_thread(produce))
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        while not producer.done():
+            while not queue.empty():  # unblock a put the producer is waiting on
+                queue.get_nowait()
+            await asyncio.wait({producer}, timeout=0.05)
+        if not producer.cancelled():
+            producer.exception()  # already delivered through the queue, or beside the point now
+
+
+def iterate_blocking(source: AsyncIterator[T], loop: asyncio.AbstractEventLoop) -> Iterator[T]:
+    """Items of an async iterator for code on a worker thread; each next() waits on `loop`."""
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(source.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+async def batched(source: AsyncIterable[T], size: int) -> AsyncIterator[List[T]]:
+    batch: List[T] = []
+    async for item in source:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,41 @@
+# app/worker.py
+"""
+Standalone ingest worker: serves the ingest_jobs queue without the HTTP API.
+
+    python -m app.worker
+
+Runs INGEST_WORKERS concurrent jobs. Scale ingest by adding worker replicas and set
+INGEST_WORKERS=0 on the API so it only enqueues. SIGTERM hands running jobs back to
+the queue before exiting.
+"""
+import asyncio
+import logging
+import signal
+
+from app.config import settings
+from app.services.ingest_queue import ingest_pool
+from app.services.pdf_extract import shutdown_pool as shutdown_pdf_pool
+from app.services.rag_store import init_rag
+
+logger = logging.getLogger("app.worker")
+
+
+async def main() -> None:
+    init_rag()
+    workers = max(settings.INGEST_WORKERS, 1)
+    ingest_pool.start(workers)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("ingest worker %s shutting down", ingest_pool.worker_id)
+    await ingest_pool.stop()
+    shutdown_pdf_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+# bench/corpus.py
+"""
+Seeded synthetic corpora: Zipf-distributed pseudo-words, with a per-chat topic
+vocabulary mixed in so chats are distinguishable by both BM25 and embeddings.
+"""
+from __future__ import annotations
+
+import textwrap
+import uuid
+from dataclasses import dataclass
+from typing import Iterator, List
+
+import numpy as np
+
+_SYLLABLES = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+TOPIC_SHARE = 0.3
+
+
+class TextGenerator:
+    def __init__(self, seed: int = 0, vocab_size: int = 20_000, zipf_s: float = 1.1):
+        self.rng = np.random.default_rng(seed)
+        words = set()
+        while len(words) < vocab_size:
+            n = int(self.rng.integers(2, 5))
+            words.add("".join(self.rng.choice(_SYLLABLES, size=n)))
+        self.vocab = np.array(sorted(words))
+        self.rng.shuffle(self.vocab)
+        ranks = np.arange(1, vocab_size + 1, dtype=np.float64)
+        weights = 1.0 / ranks ** zipf_s
+        self.p = weights / weights.sum()
+
+    def topic(self, size: int = 200) -> np.ndarray:
+        """A random slice of the rarer words, used as one chat's subject matter."""
+        return self.rng.choice(self.vocab[len(self.vocab) // 10:], size=size, replace=False)
+
+    def words(self, n: int, topic: np.ndarray | None = None) -> List[str]:
+        out = self.vocab[self.rng.choice(len(self.vocab), size=n, p=self.p)]
+        if topic is not None and len(topic):
+            mask = self.rng.random(n) < TOPIC_SHARE
+            out[mask] = self.rng.choice(topic, size=int(mask.sum()))
+        return out.tolist()
+
+    def prose(self, n_words: int, topic: np.ndarray | None = None) -> str:
+        """Sentences of 8-20 words, paragraphs of 3-7 sentences."""
+        words = self.words(n_words, topic)
+        paragraphs, sentences, i = [], [], 0
+        while i < len(words):
+            n = int(self.rng.integers(8, 21))
+            sentence = words[i:i + n]
+            sentences.append(" ".join(sentence).capitalize() + ".")
+            i += n
+            if len(sentences) >= int(self.rng.integers(3, 8)):
+                paragraphs.append(" ".join(sentences))
+                sentences = []
+        if sentences:
+            paragraphs.append(" ".join(sentences))
+        return "\n\n".join(paragraphs)
+
+    def document(self, n_words: int, words_per_page: int = 600) -> str:
+        """Form-feed separated pages of prose, each opening with a numbered heading."""
+        pages = []
+        for i, start in enumerate(range(0, n_words, words_per_page), 1):
+            title = " ".join(self.words(3)).title()
+            pages.append(f"{i}. {title}\n\n" + self.prose(min(words_per_page, n_words - start)))
+        return "\f".join(pages)
+
+
+@dataclass
+class CorpusFile:
+    chat_id: str
+    file_id: str
+    chunks: List[str]
+    topic: np.ndarray
+
+
+def make_corpus(
+        gen: TextGenerator,
+        n_chunks: int,
+        n_chats: int,
+        words_per_chunk: int = 120,
+        chunks_per_file: int = 20,
+) -> Iterator[CorpusFile]:
+    """n_chunks spread evenly over n_chats, grouped into files of chunks_per_file."""
+    base, extra = divmod(n_chunks, n_chats)
+    for c in range(n_chats):
+        chat_id = str(uuid.UUID(int=int(gen.rng.integers(0, 2 ** 63)) << 64 | c))
+        topic = gen.topic()
+        remaining = base + (1 if c < extra else 0)
+        while remaining > 0:
+            n = min(chunks_per_file, remaining)
+            yield CorpusFile(
+                chat_id=chat_id,
+                file_id=str(uuid.UUID(int=int(gen.rng.integers(0, 2 ** 63)))),
+                chunks=[gen.prose(words_per_chunk, topic) for _ in range(n)],
+                topic=topic,
+            )
+            remaining -= n
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: List[str], line_chars: int = 90, lines_per_page: int = 60) -> bytes:
+    """Minimal uncompressed PDF with one Helvetica text block per page."""
+    n = len(pages)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {n} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(pages):
+        lines = textwrap.wrap(text, line_chars)[:lines_per_page]
+        ops = ["BT /F1 10 Tf 12 TL 50 780 Td"] + [f"({_pdf_escape(line)}) '" for line in lines] + ["ET"]
+        content = "\n".join(ops).encode("latin-1", "replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
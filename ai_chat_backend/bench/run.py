@@ -0,0 +1,928 @@
+# bench/run.py
+"""
+Benchmark runner. Stages:
+- chunk_text/{mb}MB: token-budgeted chunking of a paged document, with throughput (MB/s) and
+  whether every chunk stayed within CHUNK_TOKENS
+- extract_text/{pdf,plain}: ingest building blocks
+- upsert_chunks, upsert_chunks/latency_{ms}ms/in_flight_{n}, upsert_chunks/rate_limited: batched
+  embed+upsert, its throughput against a slow embedder and its retries under rate limiting
+- ingest_dedup/copy_vectors: re-storing a duplicate upload's vectors, with zero embed calls
+- ingest_stream/{mb}MB: the streamed ingest pipeline over a text file, with the time until the
+  first batch is stored, busy time per stage and its peak allocation next to loading the whole
+  document first
+- pdf_extract/{pages}p/{procs}: page-parallel PDF extraction at 1 (in-process) and more pool
+  processes, with speedup over the in-process run, and the API process's CPU time and
+  event-loop lag while an ingest extracts on a thread
+- s3_download/{in_memory,stream,ranged}: S3 download against FakeS3; the streamed modes
+  report whether peak allocation stayed within their fixed bound
+- index_build/{chunks}x{chats}: embedding + vector/lexical indexing of a synthetic corpus
+- get_rag_answer/{chunks}x{chats}: one ask per query, cold and then warm embedding cache
+- embedding_cache/{uncached,memory,redis}: embedding round trips and latency per ask on
+  repeated, differently typed questions, without the cache, with its in-process tier and (with
+  REDIS_URL set) from a cold worker over a warm Redis
+- ask_concurrency/{chunks}x{chats}: concurrent asks against a slow LLM, with event-loop lag
+- ask_pool/{chunks}x{chats}/c{n}: the /ai/ask handler at n concurrent asks over a fixed pool of
+  simulated DB connections, with the time spent waiting for a connection and holding one
+- ask_with_history/{chunks}x{chats}/{history_alone,history,ask}: GET /message/{chat_id} from a
+  few readers alone, then while /ai/ask runs concurrently on the same loop and pool, with the
+  throughput of both
+- message_history/{n}/{full,page,deep_page}: GET /message/{chat_id} over an n-message chat in
+  SQLite (query, ORM load, response serialization): the whole history against one keyset page
+  at the newest end and one halfway back, and whether the page queries used the index
+- auth/{uncached,principal,orm_user}: resolving the caller of an authenticated request (JWT
+  decode + user lookup over a simulated 1 ms DB) without the auth cache, through
+  get_current_principal with it, and through get_current_user, with DB checkouts per request
+- mmr_select: re-ranking micro-benchmark
+
+Each stage reports latency percentiles (ms) and the allocations of one traced run.
+Results are JSON; --compare exits 1 when p50/p95 latency or peak allocation regressed.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from contextlib import aclosing
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.chat import Chat
+from app.models.message import Message, RoleType
+from app.models.user import User
+from app.routers import ai, message
+from app.schemas.chat import ChatAskRequest
+from app.schemas.message import MessagePage, MessageResponse
+from app.services import chunker, pdf_extract, prompt_builder, rag_service, rag_store
+from app.services.auth_cache import AuthCache, Principal
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.chunker import chunk_text
+from app.services.ingest_from_s3 import (
+    IngestStats, chunk_hash, chunk_vector_ids, copy_vectors, extract_text, index_chunks, stream_chunks,
+    upsert_chunks,
+)
+from app.services.lexical_index import lexical_index
+from app.services.rerank import mmr_select
+from app.utils import dependencies, metrics, s3_utils
+from app.utils.pagination import NEWEST_FIRST, encode_cursor, keyset_page, split_page
+from app.utils.security import create_access_token
+from bench.corpus import TextGenerator, make_corpus, make_pdf
+from bench.stubs import (
+    DiscardingVectorStore, FakeS3, HashEmbeddings, InMemoryChunks, InMemoryVectorStore, PooledSessions, StubLLM,
+    WordEncoding,
+)
+
+SCHEMA_VERSION = 1
+
+# (chunks, chats) per corpus
+PROFILES = {
+    "quick": [(100, 1), (1_000, 10)],
+    "default": [(100, 1), (1_000, 10), (10_000, 100)],
+    "full": [(100, 1), (1_000, 10), (10_000, 100), (100_000, 1_000)],
+}
+
+MIN_DELTA_MS = 0.05  # ignore sub-50µs swings when comparing
+MIN_DELTA_KIB = 64.0
+
+
+# -----------------------
+# Measurement
+# -----------------------
+
+def summarize(samples: List[float]) -> dict:
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    p50, p90, p95, p99 = np.percentile(ms, [50, 90, 95, 99])
+    return {
+        "n": int(ms.size),
+        "mean": round(float(ms.mean()), 4),
+        "min": round(float(ms.min()), 4),
+        "p50": round(float(p50), 4),
+        "p90": round(float(p90), 4),
+        "p95": round(float(p95), 4),
+        "p99": round(float(p99), 4),
+        "max": round(float(ms.max()), 4),
+    }
+
+
+def _alloc_report(current: int, peak: int) -> dict:
+    return {"peak_kib": round(peak / 1024, 1), "retained_kib": round(current / 1024, 1)}
+
+
+def time_sync(fn: Callable[[], object], iterations: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def trace_sync(fn: Callable[[], object]) -> dict:
+    tracemalloc.start()
+    try:
+        fn()
+        return _alloc_report(*tracemalloc.get_traced_memory())
+    finally:
+        tracemalloc.stop()
+
+
+async def time_async(calls: List[Callable[[], Awaitable[object]]]) -> List[float]:
+    samples = []
+    for call in calls:
+        start = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def trace_async(call: Callable[[], Awaitable[object]]) -> dict:
+    tracemalloc.start()
+    try:
+        await call()
+        return _alloc_report(*tracemalloc.get_traced_memory())
+    finally:
+        tracemalloc.stop()
+
+
+class Recorder:
+    def __init__(self):
+        self.stages: dict = {}
+
+    def add(self, name: str, samples: List[float], alloc: Optional[dict] = None, **extra) -> None:
+        stage = {"ms": summarize(samples)}
+        if alloc is not None:
+            stage["alloc"] = alloc
+        stage.update(extra)
+        self.stages[name] = stage
+        ms = stage["ms"]
+        peak = f"{alloc['peak_kib']:>10.1f}" if alloc else f"{'-':>10}"
+        print(
+            f"{name:<34} n={ms['n']:<5} p50={ms['p50']:>9.3f} p95={ms['p95']:>9.3f} "
+            f"p99={ms['p99']:>9.3f} ms  peak={peak} KiB",
+            file=sys.stderr,
+        )
+
+
+# -----------------------
+# Wiring
+# -----------------------
+
+def _use_tokenizer(mode: str) -> str:
+    """The real BPE file may not be downloadable offline; fall back to a word-level stub."""
+    if mode == "tiktoken" or mode == "auto":
+        try:
+            prompt_builder._encoding()
+            return prompt_builder.ENCODING_NAME
+        except Exception:
+            if mode == "tiktoken":
+                raise
+    stub = WordEncoding()
+    prompt_builder._encoding = lambda: stub
+    chunker._encoding = lambda: stub
+    return "stub-words"
+
+
+def _install(store: InMemoryVectorStore, embeddings: CachedEmbeddings) -> None:
+    rag_store._embeddings = embeddings
+    rag_store._vectorstore = store
+
+
+def _cached(inner: HashEmbeddings) -> CachedEmbeddings:
+    return CachedEmbeddings(
+        inner, model="bench-hash", maxsize=settings.EMBED_CACHE_SIZE, ttl_s=settings.EMBED_CACHE_TTL_S
+    )
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -----------------------
+# Stages
+# -----------------------
+
+def bench_chunk_text(rec: Recorder, gen: TextGenerator, sizes_mb: List[int], iterations: int) -> None:
+    enc = chunker._encoding()
+    n = max(iterations // 4, 3)
+    for mb in sizes_mb:
+        text = gen.document(mb * 150_000)  # ~1 MB per 150k words
+        chunks = chunk_text(text)
+        tokens = [len(enc.encode(c, disallowed_special=())) for c in chunks]
+        samples = time_sync(lambda: chunk_text(text), n)
+        rec.add(
+            f"chunk_text/{mb}MB", samples, trace_sync(lambda: chunk_text(text)),
+            bytes=len(text.encode("utf-8")),
+            mb_per_s=round(len(text.encode("utf-8")) / 1e6 / float(np.median(samples)), 2),
+            chunks=len(chunks),
+            max_tokens=max(tokens),
+            mean_tokens=round(sum(tokens) / len(tokens), 1),
+            within_budget=max(tokens) <= settings.CHUNK_TOKENS,
+        )
+
+
+def bench_ingest_blocks(rec: Recorder, gen: TextGenerator, dim: int, iterations: int) -> None:
+    text = gen.prose(150_000)  # ~1 MB of text
+
+    pdf = make_pdf([gen.prose(700) for _ in range(50)])
+    n = max(iterations // 4, 3)
+    rec.add("extract_text/pdf", time_sync(lambda: extract_text(pdf, "application/pdf"), n),
+            trace_sync(lambda: extract_text(pdf, "application/pdf")), pages=50, bytes=len(pdf))
+
+    raw = text.encode("utf-8")
+    rec.add("extract_text/plain", time_sync(lambda: extract_text(raw, "text/plain"), iterations),
+            trace_sync(lambda: extract_text(raw, "text/plain")), bytes=len(raw))
+
+
+async def bench_upsert(rec: Recorder, gen: TextGenerator, dim: int, iterations: int, latency_ms: float) -> None:
+    chunks = chunk_text(gen.prose(300_000))
+    meta = {"chat_id": "bench", "file_id": "bench", "source": "bench.txt"}
+    n = max(iterations // 4, 3)
+    saved = (settings.EMBED_MAX_IN_FLIGHT, settings.EMBED_RETRY_BASE_S, settings.EMBED_RETRY_MAX_S)
+
+    def upsert(inner: HashEmbeddings) -> Callable[[], Awaitable[object]]:
+        async def call() -> None:
+            embeddings = _cached(inner)
+            _install(InMemoryVectorStore(embeddings), embeddings)
+            stats.append(await upsert_chunks(chunks, metadata_common=meta))
+        return call
+
+    try:
+        stats = []
+        rec.add("upsert_chunks", await time_async([upsert(HashEmbeddings(dim)) for _ in range(n)]),
+                await trace_async(upsert(HashEmbeddings(dim))), chunks=len(chunks))
+
+        # simulated embedding round trips: throughput should scale with batches in flight
+        for in_flight in sorted({1, saved[0]}):
+            settings.EMBED_MAX_IN_FLIGHT = in_flight
+            stats = []
+            samples = await time_async([upsert(HashEmbeddings(dim, latency_ms / 1000)) for _ in range(n)])
+            rec.add(f"upsert_chunks/latency_{latency_ms:g}ms/in_flight_{in_flight}", samples, chunks=len(chunks),
+                    chunks_per_s=round(float(np.median([s.chunks_per_s for s in stats])), 1))
+
+        # every 4th embedding request is rate limited and retried
+        settings.EMBED_RETRY_BASE_S, settings.EMBED_RETRY_MAX_S = 0.001, 0.005
+        stats = []
+        samples = await time_async([upsert(HashEmbeddings(dim, fail_every=4)) for _ in range(n)])
+        rec.add("upsert_chunks/rate_limited", samples, chunks=len(chunks),
+                retries=stats[-1].retries, batches=stats[-1].batches)
+    finally:
+        settings.EMBED_MAX_IN_FLIGHT, settings.EMBED_RETRY_BASE_S, settings.EMBED_RETRY_MAX_S = saved
+
+    # dedup: a duplicate upload copies the stored vectors instead of embedding again
+    inner = HashEmbeddings(dim, latency_ms / 1000)
+    embeddings = _cached(inner)
+    _install(InMemoryVectorStore(embeddings), embeddings)
+    hashes = [chunk_hash(c) for c in chunks]
+    ids = chunk_vector_ids("bench", hashes)
+    await upsert_chunks(chunks, metadata_common=meta, ids=ids)
+    calls = inner.calls
+    copy = lambda: copy_vectors(ids, hashes, "bench-copy", {**meta, "file_id": "bench-copy"})
+    rec.add("ingest_dedup/copy_vectors", time_sync(copy, n), trace_sync(copy), chunks=len(chunks),
+            embed_calls=inner.calls - calls)
+
+
+async def bench_ingest_stream(rec: Recorder, gen: TextGenerator, dim: int, mb: int, latency_ms: float) -> None:
+    """Streamed extract → chunk → embed → upsert against loading the whole document first."""
+    meta = {"chat_id": "bench", "file_id": "bench-stream", "source": "bench.txt"}
+    with tempfile.NamedTemporaryFile(prefix="bench-", suffix=".txt") as fh:
+        fh.write(gen.document(mb * 150_000).encode("utf-8"))
+        fh.flush()
+        size = fh.tell()
+
+        def fresh_store() -> None:
+            embeddings = _cached(HashEmbeddings(dim, latency_ms / 1000))
+            _install(DiscardingVectorStore(embeddings), embeddings)
+
+        first_stored: List[float] = []  # per run, until its first batch was stored
+        stage_seconds: List[dict] = []
+
+        async def streamed() -> None:
+            fresh_store()
+            t0 = time.perf_counter()
+            first: List[float] = []
+
+            async def on_progress(done: int) -> None:
+                if not first:
+                    first.append(time.perf_counter() - t0)
+
+            stats = IngestStats()
+            async with aclosing(stream_chunks(fh, "text/plain", stats)) as chunks:
+                await index_chunks("bench-stream", None, chunks, meta, False, on_progress, stats.upsert)
+            first_stored.extend(first)
+            stage_seconds.append(stats.stage_seconds())
+
+        async def whole() -> None:
+            fresh_store()
+            chunks = chunk_text(extract_text(fh, "text/plain"))
+            await upsert_chunks(chunks, metadata_common=meta)
+
+        samples = await time_async([streamed for _ in range(3)])
+        stages = stage_seconds[-1]  # of an untraced run
+        alloc = await trace_async(streamed)
+        whole_alloc = await trace_async(whole)
+        rec.add(f"ingest_stream/{mb}MB", samples, alloc, bytes=size,
+                first_batch_ms=round(float(np.median(first_stored)) * 1000, 1),
+                stage_ms={k: round(v * 1000, 1) for k, v in stages.items()},
+                whole_document_peak_kib=whole_alloc["peak_kib"])
+
+
+def bench_s3_download(rec: Recorder, iterations: int) -> None:
+    fake = FakeS3()
+    s3_utils.get_s3_client = lambda: fake
+    small = 16 * s3_utils.MB
+    large = max(settings.S3_RANGE_THRESHOLD_MB * 3, 64) * s3_utils.MB
+    fake.put("bench", "small", small)
+    fake.put("bench", "large", large)
+    n = max(iterations // 4, 3)
+
+    def in_memory() -> None:
+        s3_utils.s3_download_bytes("bench", "small")
+
+    rec.add("s3_download/in_memory", time_sync(in_memory, n), trace_sync(in_memory), bytes=small)
+
+    # one chunk per open stream plus slack for the pattern slices and executor bookkeeping
+    for label, key, size, streams in (
+            ("stream", "small", small, 1),
+            ("ranged", "large", large, settings.S3_RANGE_CONCURRENCY),
+    ):
+        def spool(key=key) -> None:
+            s3_utils.s3_download_to_tempfile("bench", key).close()
+
+        alloc = trace_sync(spool)
+        bound_kib = (streams + 1) * s3_utils.STREAM_CHUNK / 1024 + 256
+        rec.add(f"s3_download/{label}", time_sync(spool, n), alloc, bytes=size,
+                bound_kib=bound_kib, within_bound=alloc["peak_kib"] <= bound_kib)
+
+
+async def _extract_in_background(run: Callable[[], object]) -> tuple:
+    """Run `run` on a thread the way an ingest does; (event-loop lag samples, this process's CPU s)."""
+    lags: List[float] = []
+    done = asyncio.Event()
+
+    async def heartbeat() -> None:
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    beat = asyncio.create_task(heartbeat())
+    cpu = time.process_time()
+    try:
+        await asyncio.to_thread(run)
+    finally:
+        cpu = time.process_time() - cpu
+        done.set()
+        await beat
+    return lags, cpu
+
+
+async def bench_pdf_extract(rec: Recorder, gen: TextGenerator, pages: int, iterations: int) -> None:
+    saved = settings.PDF_EXTRACT_PROCESSES
+    cpus = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, cpus})
+    n = max(iterations // 10, 2)
+    with tempfile.NamedTemporaryFile(prefix="bench-", suffix=".pdf") as fh:
+        fh.write(make_pdf([gen.prose(700) for _ in range(pages)]))
+        fh.flush()
+        run = lambda: pdf_extract.extract_pdf_text(fh.name)
+        base_p50 = None
+        try:
+            for procs in counts:
+                settings.PDF_EXTRACT_PROCESSES = procs
+                pdf_extract.shutdown_pool()
+                samples = time_sync(run, n)  # the warmup run spawns the pool
+                p50 = float(np.median(samples))
+                base_p50 = base_p50 or p50
+                # the API process's side of an ingest: its CPU time and how late the event loop runs
+                lags, api_cpu_s = await _extract_in_background(run)
+                lag = summarize(lags)
+                # tracemalloc only sees this process, so the pooled runs report the parent's side
+                rec.add(f"pdf_extract/{pages}p/{procs}", samples, trace_sync(run), pages=pages,
+                        processes=procs, cpus=cpus, speedup=round(base_p50 / p50, 2),
+                        api_cpu_s=round(api_cpu_s, 2),
+                        loop_lag_ms={k: lag[k] for k in ("p50", "p99", "max")})
+        finally:
+            settings.PDF_EXTRACT_PROCESSES = saved
+            pdf_extract.shutdown_pool()
+
+
+def bench_mmr(rec: Recorder, dim: int, iterations: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    query = rng.standard_normal(dim).astype(np.float32)
+    candidates = rng.standard_normal((300, dim)).astype(np.float32)
+
+    def run() -> None:
+        mmr_select(query, candidates, k=rag_service.MMR_K, lambda_mult=rag_service.MMR_LAMBDA)
+
+    rec.add("mmr_select", time_sync(run, iterations * 10), trace_sync(run), candidates=300, dim=dim)
+
+
+def bench_message_history(rec: Recorder, gen: TextGenerator, n_messages: int, iterations: int) -> None:
+    engine = create_engine("sqlite://")
+    Message.__table__.create(engine)  # with ix_messages_chat_created
+    chat_id, other_chat = uuid.uuid4(), uuid.uuid4()
+    start = datetime(2026, 1, 1)
+    with Session(engine) as session:
+        for cid in (chat_id, other_chat):
+            session.add_all(
+                Message(
+                    id=uuid.uuid4(), chat_id=cid, role=RoleType.USER if i % 2 == 0 else RoleType.ASSISTANT,
+                    content=gen.prose(60), created_at=start + timedelta(seconds=i // 2),  # pairs share a second
+                )
+                for i in range(n_messages)
+            )
+        session.commit()
+        middle = session.scalars(
+            select(Message).where(Message.chat_id == chat_id)
+            .order_by(Message.created_at.desc(), Message.id.desc()).offset(n_messages // 2).limit(1)
+        ).one()
+        middle_cursor = encode_cursor(middle.created_at, middle.id)
+
+    as_list = TypeAdapter(List[MessageResponse])
+    limit = 50
+
+    def full() -> bytes:
+        with Session(engine) as session:
+            rows = session.scalars(
+                select(Message).where(Message.chat_id == chat_id).order_by(Message.created_at.asc())
+            ).all()
+            return as_list.dump_json(as_list.validate_python(rows, from_attributes=True))
+
+    def paged(cursor: Optional[str]) -> Callable[[], bytes]:
+        stmt = keyset_page(select(Message).where(Message.chat_id == chat_id),
+                           Message.created_at, Message.id, cursor, limit, NEWEST_FIRST)
+
+        def run() -> bytes:
+            with Session(engine) as session:
+                items, next_cursor = split_page(session.scalars(stmt).all(), limit, "created_at")
+                return MessagePage(items=items, next_cursor=next_cursor).model_dump_json().encode()
+        return run
+
+    def uses_index(cursor: Optional[str]) -> bool:
+        stmt = keyset_page(select(Message).where(Message.chat_id == chat_id),
+                           Message.created_at, Message.id, cursor, limit, NEWEST_FIRST)
+        compiled = stmt.compile(engine, compile_kwargs={"literal_binds": True})
+        with engine.connect() as conn:
+            plan = " ".join(str(row[-1]) for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+        return "ix_messages_chat_created" in plan and "TEMP B-TREE" not in plan
+
+    full_samples = time_sync(full, max(iterations // 4, 3))
+    rec.add(f"message_history/{n_messages}/full", full_samples, trace_sync(full),
+            rows=n_messages, response_kib=round(len(full()) / 1024, 1))
+    for label, cursor in (("page", None), ("deep_page", middle_cursor)):
+        run = paged(cursor)
+        samples = time_sync(run, iterations * 5)
+        rec.add(f"message_history/{n_messages}/{label}", samples, trace_sync(run),
+                rows=limit, response_kib=round(len(run()) / 1024, 1), index_range_scan=uses_index(cursor),
+                speedup_vs_full=round(float(np.median(full_samples) / np.median(samples)), 1))
+    engine.dispose()
+
+
+async def bench_auth(rec: Recorder, iterations: int) -> None:
+    pool = PooledSessions(size=4, query_latency_s=0.001)
+    user = User(id=uuid.uuid4(), email="bench@example.com", name="bench", created_at=datetime.now(timezone.utc))
+    pool.rows[user.id] = user
+    request = SimpleNamespace(cookies={"access_token": create_access_token({"sub": str(user.id)})})
+    n = iterations * 10
+
+    def resolve(dependency) -> Callable[[], Awaitable[object]]:
+        async def call():
+            async with pool() as db:
+                return await dependency(request, None, db)
+        return call
+
+    cases = (
+        ("uncached", dependencies.get_current_principal, AuthCache(ttl_s=0)),
+        ("principal", dependencies.get_current_principal, AuthCache()),
+        ("orm_user", dependencies.get_current_user, AuthCache()),
+    )
+    original = dependencies.auth_cache
+    try:
+        for label, dependency, cache in cases:
+            dependencies.auth_cache = cache
+            call = resolve(dependency)
+            await call()  # warm: the cached variants start from a filled cache
+            pool.waits.clear()
+            samples = await time_async([call] * n)
+            checkouts = len(pool.waits) / n
+            rec.add(f"auth/{label}", samples, await trace_async(call),
+                    db_checkouts_per_request=round(checkouts, 3))
+    finally:
+        dependencies.auth_cache = original
+
+
+def _respell(question: str, variant: int) -> str:
+    """The same question as typed another time: other case, other spacing."""
+    if variant % 3 == 1:
+        return question.upper()
+    if variant % 3 == 2:
+        return "  " + question.replace(" ", "  ") + "\n"
+    return question
+
+
+async def bench_embedding_cache(rec: Recorder, gen: TextGenerator, dim: int, n_asks: int, latency_ms: float) -> None:
+    """
+    Embedding round trips per get_rag_answer on repeated questions (each asked ~5 times, in
+    varying case and spacing): without the cache, with its in-process tier, and, when
+    REDIS_URL is set, from a second worker whose memory is empty but whose Redis is warm.
+    """
+    store = InMemoryVectorStore(HashEmbeddings(dim))
+    samples: list = []
+    for f in make_corpus(gen, 1_000, 10):
+        store.add_texts(f.chunks, [
+            {"chat_id": f.chat_id, "file_id": f.file_id, "chunk_index": i} for i in range(len(f.chunks))
+        ])
+        samples.append((f.chat_id, f.chunks[0], f.topic))
+    distinct = _make_queries(gen, samples, max(n_asks // 5, 1))
+    asks = [(_respell(distinct[int(p)][0], i), distinct[int(p)][1])
+            for i, p in enumerate(gen.rng.integers(len(distinct), size=n_asks))]
+
+    model = f"bench-hash-{uuid.uuid4().hex[:8]}"  # fresh Redis keys for every run
+    in_redis = lambda inner: CachedEmbeddings(
+        inner, model, maxsize=settings.EMBED_CACHE_SIZE, ttl_s=settings.EMBED_CACHE_TTL_S, redis_url=settings.REDIS_URL
+    )
+    tiers = [("uncached", None, lambda inner: inner), ("memory", None, _cached)]
+    if settings.REDIS_URL:
+        tiers.append(("redis", in_redis, in_redis))
+
+    async def ask_all(embeddings) -> List[float]:
+        store._embedding = embeddings
+        _install(store, embeddings)
+        rag_service._chat_scoped_hint.clear()
+        return await time_async([lambda q=q: rag_service.get_rag_answer(q[0], chat_id=q[1]) for q in asks])
+
+    saved = settings.HYBRID_RETRIEVAL, rag_service.client
+    settings.HYBRID_RETRIEVAL = False  # every ask reaches the vector search
+    rag_service.client = StubLLM()
+    try:
+        for label, warm_with, wrap in tiers:
+            if warm_with is not None:  # another worker asked these first
+                await ask_all(warm_with(HashEmbeddings(dim)))
+            inner = HashEmbeddings(dim, latency_ms / 1000)
+            embeddings = wrap(inner)
+            samples_s = await ask_all(embeddings)
+            extra = {"embed_calls_per_ask": round(inner.calls / len(asks), 3), "distinct_questions": len(distinct)}
+            if isinstance(embeddings, CachedEmbeddings):
+                extra["cache"] = embeddings.stats()
+            rec.add(f"embedding_cache/{label}", samples_s, embed_latency_ms=latency_ms, **extra)
+    finally:
+        settings.HYBRID_RETRIEVAL, rag_service.client = saved
+
+
+def _make_queries(gen: TextGenerator, samples: list, n: int) -> List[tuple]:
+    """Mostly words lifted from a chunk of the chat; every fifth one is off-topic."""
+    queries = []
+    for i in range(n):
+        chat_id, chunk, topic = samples[int(gen.rng.integers(len(samples)))]
+        if i % 5 == 4:
+            words = gen.words(5)
+        else:
+            pool = chunk.replace(".", "").split()
+            words = [pool[int(j)] for j in gen.rng.integers(len(pool), size=5)]
+        queries.append((" ".join(words) + "?", chat_id))
+    return queries
+
+
+async def bench_corpus(
+        rec: Recorder,
+        gen: TextGenerator,
+        n_chunks: int,
+        n_chats: int,
+        dim: int,
+        n_queries: int,
+        concurrency: int,
+        concurrency_llm_ms: float,
+        pool_size: int,
+) -> None:
+    label = f"{n_chunks}x{n_chats}"
+    inner = HashEmbeddings(dim)
+    embeddings = _cached(inner)
+    store = InMemoryVectorStore(embeddings)
+    _install(store, embeddings)
+    lexical_rows = InMemoryChunks()
+    lexical_index.source = lexical_rows
+    lexical_index._indexes.clear()
+    rag_service._chat_scoped_hint.clear()
+
+    samples: list = []
+    start = time.perf_counter()
+    for f in make_corpus(gen, n_chunks, n_chats):
+        store.add_texts(f.chunks, [
+            {"chat_id": f.chat_id, "file_id": f.file_id, "chunk_index": i} for i in range(len(f.chunks))
+        ])
+        lexical_rows.add(f.chat_id, f.file_id, f.chunks)
+        if len(samples) < 1000:
+            samples.append((f.chat_id, f.chunks[0], f.topic))
+    build_s = time.perf_counter() - start
+    rec.add(f"index_build/{label}", [build_s], chunks=len(store), chunks_per_s=round(len(store) / build_s, 1))
+
+    queries = _make_queries(gen, samples, n_queries + 1)
+    traced, queries = queries[0], queries[1:]
+    rag_service.client = StubLLM()
+
+    def ask(q: tuple) -> Callable[[], Awaitable[object]]:
+        return lambda: rag_service.get_rag_answer(q[0], chat_id=q[1])
+
+    fastpath = metrics.counter("rag_lexical_fastpath")
+    for phase in ("cold", "warm"):
+        calls_before, fast_before = inner.calls, fastpath.value
+        times = await time_async([ask(q) for q in queries])
+        alloc = await trace_async(ask(traced)) if phase == "cold" else None
+        rec.add(
+            f"get_rag_answer/{label}/{phase}", times, alloc,
+            embed_calls_per_ask=round((inner.calls - calls_before) / len(queries), 3),
+            lexical_fastpath_rate=round((fastpath.value - fast_before) / len(queries), 3),
+        )
+
+    # concurrent asks with a realistic model latency: the event loop must keep serving
+    rag_service.client = StubLLM(latency_s=concurrency_llm_ms / 1000)
+    lags: List[float] = []
+    stop = asyncio.Event()
+
+    async def heartbeat() -> None:
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    async def timed(q: tuple) -> float:
+        start = time.perf_counter()
+        await rag_service.get_rag_answer(q[0], chat_id=q[1])
+        return time.perf_counter() - start
+
+    beat = asyncio.create_task(heartbeat())
+    sem = asyncio.Semaphore(concurrency)
+
+    async def bounded(q: tuple) -> float:
+        async with sem:
+            return await timed(q)
+
+    start = time.perf_counter()
+    times = await asyncio.gather(*(bounded(q) for q in queries))
+    wall = time.perf_counter() - start
+    stop.set()
+    await beat
+    lag = summarize(lags) if lags else None
+    rec.add(
+        f"ask_concurrency/{label}", list(times),
+        concurrency=concurrency,
+        llm_latency_ms=concurrency_llm_ms,
+        asks_per_s=round(len(queries) / wall, 1),
+        loop_lag_ms={k: lag[k] for k in ("p50", "p99", "max")} if lag else None,
+    )
+
+    for level in (max(concurrency // 4, 1), concurrency, concurrency * 4):
+        await bench_ask_pool(rec, label, queries, level, pool_size)
+    await bench_ask_with_history(rec, label, queries, concurrency, pool_size)
+
+
+async def bench_ask_pool(rec: Recorder, label: str, queries: List[tuple], concurrency: int, pool_size: int) -> None:
+    """
+    The /ai/ask handler end to end, sessions drawn from `pool_size` connections: a handler
+    that holds its connection across the LLM call makes the others wait for one.
+    """
+    pool = PooledSessions(pool_size)
+    saved = ai.AsyncSessionLocal
+    ai.AsyncSessionLocal = pool
+    user_id = uuid.uuid4()
+    for _, chat_id in queries:
+        # no corpus_version: the semantic answer cache stays out of it and every ask reaches the LLM
+        pool.rows[uuid.UUID(chat_id)] = SimpleNamespace(user_id=user_id, corpus_version=None)
+    request = SimpleNamespace(is_disconnected=lambda: asyncio.sleep(0, False))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def ask(q: tuple) -> float:
+        async with sem:
+            start = time.perf_counter()
+            async with pool() as db:
+                await db.get(User, user_id)  # get_current_user
+                user = User(id=user_id, daily_token_count=0, last_ask_date=date.today())
+                await ai.ask_chat(ChatAskRequest(chat_id=q[1], question=q[0]), request, db, user)
+            return time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        times = await asyncio.gather(*(ask(q) for q in queries))
+        wall = time.perf_counter() - start
+    finally:
+        ai.AsyncSessionLocal = saved
+    waits, holds = summarize(pool.waits), summarize(pool.holds)
+    rec.add(
+        f"ask_pool/{label}/c{concurrency}", list(times),
+        concurrency=concurrency,
+        pool_size=pool_size,
+        asks_per_s=round(len(queries) / wall, 1),
+        pool_wait_ms={k: waits[k] for k in ("p50", "p99", "max")},
+        pool_hold_ms={k: holds[k] for k in ("p50", "p99", "max")},
+    )
+
+
+async def bench_ask_with_history(
+        rec: Recorder, label: str, queries: List[tuple], concurrency: int, pool_size: int, readers: int = 4
+) -> None:
+    """
+    GET /message/{chat_id} served alone, then while /ai/ask runs `concurrency` asks at a time
+    over the same pool and event loop. The stub session has no message rows, so a page comes
+    back empty: what is measured is the share of the loop and the pool a history read gets.
+    """
+    pool = PooledSessions(pool_size)
+    saved = ai.AsyncSessionLocal
+    ai.AsyncSessionLocal = pool
+    user_id = uuid.uuid4()
+    for _, chat_id in queries:
+        pool.rows[uuid.UUID(chat_id)] = SimpleNamespace(user_id=user_id, corpus_version=None)
+    principal = Principal(id=user_id, email="bench@example.com", name=None, avatar=None, created_at=None)
+    request = SimpleNamespace(is_disconnected=lambda: asyncio.sleep(0, False))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def ask(q: tuple) -> float:
+        async with sem:
+            start = time.perf_counter()
+            async with pool() as db:
+                user = User(id=user_id, daily_token_count=0, last_ask_date=date.today())
+                await ai.ask_chat(ChatAskRequest(chat_id=q[1], question=q[0]), request, db, user)
+            return time.perf_counter() - start
+
+    async def read_history(until: Callable[[], bool], n: Optional[int] = None) -> List[float]:
+        times: List[float] = []
+        while not until() and (n is None or len(times) < n):
+            chat_id = uuid.UUID(queries[len(times) % len(queries)][1])
+            start = time.perf_counter()
+            async with pool() as db:
+                await message.get_messages_by_chat(chat_id, 50, None, NEWEST_FIRST, db, principal)
+            times.append(time.perf_counter() - start)
+        return times
+
+    try:
+        start = time.perf_counter()
+        alone = [t for ts in await asyncio.gather(*(read_history(lambda: False, len(queries) // readers)
+                                                    for _ in range(readers))) for t in ts]
+        alone_rps = len(alone) / (time.perf_counter() - start)
+
+        done = asyncio.Event()
+        start = time.perf_counter()
+        readers_task = asyncio.gather(*(read_history(done.is_set) for _ in range(readers)))
+        ask_times = await asyncio.gather(*(ask(q) for q in queries))
+        wall = time.perf_counter() - start
+        done.set()
+        loaded = [t for ts in await readers_task for t in ts]
+    finally:
+        ai.AsyncSessionLocal = saved
+    rec.add(f"ask_with_history/{label}/history_alone", alone, readers=readers,
+            requests_per_s=round(alone_rps, 1))
+    rec.add(f"ask_with_history/{label}/history", loaded, readers=readers,
+            requests_per_s=round(len(loaded) / wall, 1))
+    rec.add(f"ask_with_history/{label}/ask", list(ask_times), concurrency=concurrency, pool_size=pool_size,
+            asks_per_s=round(len(queries) / wall, 1))
+
+
+# -----------------------
+# Compare
+# -----------------------
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, stage in current["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        for q in ("p50", "p95"):
+            new, old = stage["ms"][q], base["ms"][q]
+            if new > old * (1 + threshold) and new - old > MIN_DELTA_MS:
+                regressions.append(f"{name} {q}: {old:.3f} -> {new:.3f} ms (x{new / max(old, 1e-9):.2f})")
+        if "alloc" in stage and "alloc" in base:
+            new, old = stage["alloc"]["peak_kib"], base["alloc"]["peak_kib"]
+            if new > old * (1 + threshold) and new - old > MIN_DELTA_KIB:
+                regressions.append(f"{name} peak alloc: {old:.1f} -> {new:.1f} KiB")
+    return regressions
+
+
+# -----------------------
+# Main
+# -----------------------
+
+def _parse_corpus(value: str) -> tuple:
+    chunks, _, chats = value.partition("x")
+    return int(chunks), int(chats or 1)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(prog="python -m bench.run", description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--profile", choices=sorted(PROFILES), default="default")
+    p.add_argument("--corpus", action="append", type=_parse_corpus, metavar="CHUNKSxCHATS",
+                   help="override the profile's corpora, e.g. --corpus 5000x50 (repeatable)")
+    p.add_argument("--queries", type=int, default=200, help="asks per corpus")
+    p.add_argument("--iterations", type=int, default=20, help="samples per micro-benchmark")
+    p.add_argument("--dim", type=int, default=1536, help="embedding dimension")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--embed-latency-ms", type=float, default=20.0,
+                   help="simulated embedding round trip for the upsert_chunks/latency stages")
+    p.add_argument("--pdf-pages", type=int, default=500, help="pages in the pdf_extract document")
+    p.add_argument("--stream-mb", type=int, default=4, help="document size for the ingest_stream stage")
+    p.add_argument("--chunk-mb", type=int, action="append", metavar="MB",
+                   help="chunk_text input size, repeatable (default: 1 and 4)")
+    p.add_argument("--history-messages", type=int, default=10_000,
+                   help="messages in the chat of the message_history stage")
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--concurrency-llm-ms", type=float, default=50.0)
+    p.add_argument("--pool-size", type=int, default=15,
+                   help="simulated DB connections for ask_pool (SQLAlchemy's default 5 + 10 overflow)")
+    p.add_argument("--tokenizer", choices=("auto", "tiktoken", "stub"), default="auto")
+    p.add_argument("--out", help="write results JSON here")
+    p.add_argument("--compare", metavar="BASELINE", help="results JSON to compare against")
+    p.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (0.2 = 20%%)")
+    return p.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    corpora = args.corpus or PROFILES[args.profile]
+    tokenizer = _use_tokenizer(args.tokenizer)
+    gen = TextGenerator(seed=args.seed)
+    rec = Recorder()
+
+    bench_chunk_text(rec, gen, args.chunk_mb or [1, 4], args.iterations)
+    bench_ingest_blocks(rec, gen, args.dim, args.iterations)
+    await bench_upsert(rec, gen, args.dim, args.iterations, args.embed_latency_ms)
+    await bench_ingest_stream(rec, gen, args.dim, args.stream_mb, args.embed_latency_ms)
+    bench_s3_download(rec, args.iterations)
+    await bench_pdf_extract(rec, gen, args.pdf_pages, args.iterations)
+    bench_mmr(rec, args.dim, args.iterations, args.seed)
+    bench_message_history(rec, gen, args.history_messages, args.iterations)
+    await bench_auth(rec, args.iterations)
+    await bench_embedding_cache(rec, gen, args.dim, args.queries, args.embed_latency_ms)
+    for n_chunks, n_chats in corpora:
+        await bench_corpus(rec, gen, n_chunks, n_chats, args.dim, args.queries,
+                           args.concurrency, args.concurrency_llm_ms, args.pool_size)
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "profile": args.profile,
+            "corpora": [f"{n}x{c}" for n, c in corpora],
+            "queries": args.queries,
+            "iterations": args.iterations,
+            "dim": args.dim,
+            "seed": args.seed,
+            "pdf_pages": args.pdf_pages,
+            "pool_size": args.pool_size,
+            "history_messages": args.history_messages,
+            "chunk_mb": args.chunk_mb or [1, 4],
+            "stream_mb": args.stream_mb,
+            "embed_latency_ms": args.embed_latency_ms,
+            "tokenizer": tokenizer,
+            "hybrid_retrieval": settings.HYBRID_RETRIEVAL,
+            "retrieval_strategy": settings.RAG_RETRIEVAL_STRATEGY,
+            "use_mmr": rag_service.USE_MMR,
+        },
+        "stages": rec.stages,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"no regressions vs {baseline.get('commit') or args.compare}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,548 @@
+# bench/stubs.py
+"""
+Deterministic stand-ins for the external services on the answer path.
+
+- HashEmbeddings: feature-hashed bag of words, so overlapping texts get similar vectors
+- InMemoryVectorStore: per-chat NumPy matrices with LocalVectorStore's filter and score conventions
+- DiscardingVectorStore: counts upserted vectors and keeps none of them
+- InMemoryChunks: LexicalIndexStore source keeping chunk texts in a dict instead of Postgres
+- StubLLM: drop-in for rag_service.client (chat.completions.create, plain and streamed)
+- WordEncoding: tiktoken-shaped encoder used when the real BPE file can't be fetched
+- FakeS3: local S3 stand-in for get_object (streamed bodies, Range and If-Match requests)
+- PooledSessions: AsyncSession stand-in over a fixed pool of simulated connections, recording
+  how long each checkout waited
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from botocore.exceptions import ClientError
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.services.local_vector_store import UNSCOPED_SHARD, _eq_value, _matches
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class RateLimited(Exception):
+    """Looks like a 429 to the ingest retry policy."""
+    status = 429
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Every word adds ±1 to one of `dim` buckets picked by its blake2b digest.
+    `calls` counts round trips (one per embed_query / embed_documents batch),
+    `latency_s` simulates the network cost of each, and every `fail_every`-th
+    embed_documents call raises RateLimited instead.
+    """
+
+    def __init__(self, dim: int = 1536, latency_s: float = 0.0, fail_every: int = 0):
+        self.dim = dim
+        self.latency_s = latency_s
+        self.fail_every = fail_every
+        self.calls = 0
+        self.texts_embedded = 0
+        self._slots: dict[str, Tuple[int, float]] = {}
+
+    def _slot(self, word: str) -> Tuple[int, float]:
+        slot = self._slots.get(word)
+        if slot is None:
+            digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            slot = self._slots[word] = (digest % self.dim, 1.0 if digest >> 63 else -1.0)
+        return slot
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD_RE.findall(text.casefold()):
+            idx, sign = self._slot(word)
+            vec[idx] += sign
+        norm = float(np.linalg.norm(vec))
+        if norm:
+            vec /= norm
+        return vec.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if self.fail_every and self.calls % self.fail_every == 0:
+            raise RateLimited("rate limited")
+        self.texts_embedded += len(texts)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        self.texts_embedded += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return [self._embed(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        self.texts_embedded += 1
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return self._embed(text)
+
+
+class _Bucket:
+    def __init__(self):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self._blocks: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def append(self, ids: List[str], texts: List[str], metadatas: List[dict], vectors: np.ndarray) -> None:
+        self.ids.extend(ids)
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        self._blocks.append(vectors)
+        self._matrix = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.concatenate(self._blocks) if self._blocks else np.zeros((0, 0), np.float32)
+            self._blocks = [self._matrix]
+        return self._matrix
+
+    def top_k(self, query: np.ndarray, k: int, filter: Optional[dict]) -> List[Tuple[int, float]]:
+        if not self.ids:
+            return []
+        scores = self.matrix @ query
+        extra = {k_: v for k_, v in (filter or {}).items() if k_ != "chat_id"}
+        if extra:
+            keep = np.fromiter((_matches(md, extra) for md in self.metadatas), dtype=bool, count=len(self.ids))
+            scores = np.where(keep, scores, -np.inf)
+        k = min(k, len(scores))
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx])]
+        return [(int(i), float(scores[i])) for i in idx if np.isfinite(scores[i])]
+
+
+class InMemoryVectorStore(VectorStore):
+    """Unit vectors per chat in NumPy arrays; cosine similarity is a dot product."""
+
+    def __init__(self, embedding: Embeddings):
+        self._embedding = embedding
+        self._buckets: dict[str, _Bucket] = {}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return sum(len(b.ids) for b in self._buckets.values())
+
+    def _bucket(self, chat_id: Any) -> _Bucket:
+        return self._buckets.setdefault(str(chat_id) if chat_id else UNSCOPED_SHARD, _Bucket())
+
+    def add_vectors(
+            self,
+            texts: List[str],
+            vectors: List[List[float]],
+            metadatas: Optional[List[dict]] = None,
+            ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        arr = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        arr = arr / norms
+
+        groups: dict[str, List[int]] = {}
+        for i, md in enumerate(metadatas):
+            groups.setdefault(str(md.get("chat_id") or ""), []).append(i)
+        for chat_id, rows in groups.items():
+            self._bucket(chat_id).append(
+                [ids[i] for i in rows], [texts[i] for i in rows], [metadatas[i] for i in rows], arr[rows]
+            )
+        return ids
+
+    def add_texts(
+            self,
+            texts: Iterable[str],
+            metadatas: Optional[List[dict]] = None,
+            ids: Optional[List[str]] = None,
+            **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_vectors(texts, self._embedding.embed_documents(texts), metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[dict] = None, **kwargs: Any) -> bool:
+        if not ids and not filter:
+            return False
+        wanted = set(ids or [])
+        for name, bucket in list(self._buckets.items()):
+            keep = [
+                i for i, (id_, md) in enumerate(zip(bucket.ids, bucket.metadatas))
+                if not ((not wanted or id_ in wanted) and _matches(md, filter))
+            ]
+            if len(keep) == len(bucket.ids):
+                continue
+            fresh = _Bucket()
+            if keep:
+                fresh.append(
+                    [bucket.ids[i] for i in keep], [bucket.texts[i] for i in keep],
+                    [bucket.metadatas[i] for i in keep], bucket.matrix[keep],
+                )
+            self._buckets[name] = fresh
+        return True
+
+    def get_vectors(
+            self, ids: List[str], chat_ids: Optional[Iterable[Any]] = None
+    ) -> List[Tuple[str, str, np.ndarray, dict]]:
+        wanted = set(ids)
+        if chat_ids is None:
+            buckets = list(self._buckets.values())
+        else:
+            names = dict.fromkeys(str(c) if c else UNSCOPED_SHARD for c in chat_ids)
+            buckets = [self._buckets[n] for n in names if n in self._buckets]
+        return [
+            (id_, bucket.texts[i], bucket.matrix[i], bucket.metadatas[i])
+            for bucket in buckets
+            for i, id_ in enumerate(bucket.ids) if id_ in wanted
+        ]
+
+    def similarity_search_with_vectors(
+            self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float, np.ndarray]]:
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        chat_id = _eq_value((filter or {}).get("chat_id"))
+        buckets = [self._bucket(chat_id)] if chat_id else list(self._buckets.values())
+
+        hits: List[Tuple[Document, float, np.ndarray]] = []
+        for bucket in buckets:
+            for i, score in bucket.top_k(query, k, filter):
+                doc = Document(page_content=bucket.texts[i], metadata=bucket.metadatas[i], id=bucket.ids[i])
+                hits.append((doc, min(score, 1.0), bucket.matrix[i]))
+        hits.sort(key=lambda h: h[1], reverse=True)
+        return hits[:k]
+
+    def similarity_search_by_vector_with_score(
+            self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float]]:
+        return [(doc, score) for doc, score, _ in self.similarity_search_with_vectors(embedding, k, filter)]
+
+    def similarity_search_with_score(
+            self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search(
+            self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    async def asimilarity_search_with_score(
+            self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = await self._embedding.aembed_query(query)
+        return await asyncio.to_thread(self.similarity_search_by_vector_with_score, embedding, k, filter)
+
+    async def _asimilarity_search_with_relevance_scores(
+            self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        relevance = self._select_relevance_score_fn()
+        results = await self.asimilarity_search_with_score(query, k, **kwargs)
+        return [(doc, relevance(score)) for doc, score in results]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(
+            cls,
+            texts: List[str],
+            embedding: Embeddings,
+            metadatas: Optional[List[dict]] = None,
+            ids: Optional[List[str]] = None,
+            **kwargs: Any,
+    ) -> "InMemoryVectorStore":
+        store = cls(embedding)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+
+class DiscardingVectorStore:
+    """Upsert target for measuring the ingest pipeline alone: it keeps nothing but a count."""
+
+    def __init__(self, embedding: Embeddings):
+        self.embeddings = embedding
+        self.stored = 0
+
+    def add_vectors(
+            self,
+            texts: List[str],
+            vectors: List[List[float]],
+            metadatas: Optional[List[dict]] = None,
+            ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        self.stored += len(texts)
+        return ids or []
+
+
+class InMemoryChunks:
+    """Chunk rows per chat for LexicalIndexStore; every add bumps the chat's corpus version."""
+
+    def __init__(self):
+        self._rows: dict = {}
+        self._versions: dict = {}
+
+    def add(self, chat_id: Any, file_id: Any, chunks: List[str]) -> None:
+        key = str(chat_id)
+        self._rows.setdefault(key, []).extend(
+            {"chat_id": key, "file_id": str(file_id), "chunk_index": i, "text": text}
+            for i, text in enumerate(chunks)
+        )
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    async def corpus_version(self, chat_id: Any) -> Optional[int]:
+        return self._versions.get(str(chat_id))
+
+    async def rows(self, chat_id: Any) -> List[dict]:
+        return list(self._rows.get(str(chat_id), ()))
+
+
+class _StubStream:
+    def __init__(self, words: List[str], total_tokens: int, delay_s: float):
+        self._words = words
+        self._total_tokens = total_tokens
+        self._delay_s = delay_s
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for word in self._words:
+            if self._delay_s:
+                await asyncio.sleep(self._delay_s)
+            delta = SimpleNamespace(content=word)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=self._total_tokens))
+
+    async def close(self) -> None:
+        return None
+
+
+class StubLLM:
+    """
+    Answers every prompt with `answer_words` words derived from its digest, after
+    `latency_s` (time to first token). Token usage is prompt chars / 4 plus the answer.
+    """
+
+    def __init__(self, latency_s: float = 0.0, answer_words: int = 64, token_delay_s: float = 0.0):
+        self.latency_s = latency_s
+        self.answer_words = answer_words
+        self.token_delay_s = token_delay_s
+        self.calls = 0
+        self.prompt_chars = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, *, model: str, messages: List[dict], stream: bool = False, **kwargs: Any):
+        self.calls += 1
+        chars = sum(len(m["content"]) for m in messages)
+        self.prompt_chars += chars
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+
+        seed = hashlib.blake2b(messages[-1]["content"].encode("utf-8"), digest_size=8).hexdigest()
+        words = [f"w{seed[i % 16]}{i}" for i in range(self.answer_words)]
+        total_tokens = chars // 4 + self.answer_words
+        if stream:
+            return _StubStream([w + " " for w in words], total_tokens, self.token_delay_s)
+        message = SimpleNamespace(content=" ".join(words))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message)],
+            usage=SimpleNamespace(total_tokens=total_tokens),
+        )
+
+
+class WordEncoding:
+    """Roughly one token per word or punctuation mark; encode/decode round-trip."""
+
+    _TOKEN_RE = re.compile(r"\s*\S+")
+
+    def __init__(self):
+        self._ids: dict[str, int] = {}
+        self._pieces: List[str] = []
+
+    def encode(self, text: str, **kwargs: Any) -> List[int]:
+        out = []
+        for piece in self._TOKEN_RE.findall(text):
+            tid = self._ids.get(piece)
+            if tid is None:
+                tid = self._ids[piece] = len(self._pieces)
+                self._pieces.append(piece)
+            out.append(tid)
+        return out
+
+    def decode(self, tokens: List[int]) -> str:
+        return "".join(self._pieces[t] for t in tokens)
+
+
+_PATTERN = bytes(range(256)) * 4096  # 1 MiB, sliced to generate object bodies
+
+
+class _FakeBody:
+    def __init__(self, start: int, end: int):
+        self._start = start
+        self._end = end
+
+    def iter_chunks(self, chunk_size: int = 1024):
+        pos = self._start
+        while pos < self._end:
+            n = min(chunk_size, self._end - pos, len(_PATTERN) - pos % len(_PATTERN))
+            offset = pos % len(_PATTERN)
+            yield bytes(memoryview(_PATTERN)[offset:offset + n])  # a fresh buffer, like a socket read
+            pos += n
+
+    def read(self) -> bytes:
+        return b"".join(self.iter_chunks(1 << 20))
+
+    def close(self) -> None:
+        return None
+
+
+class FakeS3:
+    """Generated objects of a given size; never holds a whole body in memory."""
+
+    def __init__(self):
+        self.objects: dict[Tuple[str, str], int] = {}
+        self.requests = 0
+
+    def put(self, bucket: str, key: str, size: int) -> None:
+        self.objects[(bucket, key)] = size
+
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None,
+                   IfMatch: Optional[str] = None) -> dict:
+        self.requests += 1
+        size = self.objects[(Bucket, Key)]
+        etag = f'"{size:x}"'
+        if IfMatch is not None and IfMatch != etag:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"},
+                               "ResponseMetadata": {"HTTPStatusCode": 412}}, "GetObject")
+        start, end = 0, size - 1
+        if Range:
+            lo, _, hi = Range.removeprefix("bytes=").partition("-")
+            start, end = int(lo), min(int(hi), size - 1)
+        return {"ContentLength": end - start + 1, "ETag": etag, "Body": _FakeBody(start, end + 1)}
+
+
+class _Result:
+    def __init__(self, rows: List[Any]):
+        self._rows = rows
+
+    def scalars(self) -> "_Result":
+        return self
+
+    def all(self) -> List[Any]:
+        return self._rows
+
+    def first(self) -> Any:
+        return self._rows[0] if self._rows else None
+
+    def scalar_one_or_none(self) -> Any:
+        return self.first()
+
+
+class PooledSessions:
+    """
+    Session factory over `size` simulated connections. A session checks one out on its first
+    statement and gives it back at commit, rollback or close, as AsyncSession does; every
+    statement takes `query_latency_s`. `rows` serves get(); execute() returns no rows.
+    `waits` records how long each checkout waited, `holds` how long each connection was kept.
+    """
+
+    def __init__(self, size: int, query_latency_s: float = 0.001):
+        self.size = size
+        self.query_latency_s = query_latency_s
+        self.rows: dict = {}
+        self.waits: List[float] = []
+        self.holds: List[float] = []
+        self._free = asyncio.Semaphore(size)
+
+    def __call__(self) -> "PooledSession":
+        return PooledSession(self)
+
+
+class PooledSession:
+    def __init__(self, pool: PooledSessions):
+        self._pool = pool
+        self._connected = False
+        self._checked_out = 0.0
+        self._pending: List[Any] = []
+
+    async def _statement(self) -> None:
+        if not self._connected:
+            start = time.perf_counter()
+            await self._pool._free.acquire()
+            self._checked_out = time.perf_counter()
+            self._pool.waits.append(self._checked_out - start)
+            self._connected = True
+        await asyncio.sleep(self._pool.query_latency_s)
+
+    def _release(self) -> None:
+        if self._connected:
+            self._connected = False
+            self._pool.holds.append(time.perf_counter() - self._checked_out)
+            self._pool._free.release()
+
+    async def get(self, cls: Any, ident: Any) -> Any:
+        await self._statement()
+        return self._pool.rows.get(ident)
+
+    async def execute(self, statement: Any, params: Any = None) -> _Result:
+        await self._statement()
+        return _Result([])
+
+    def add(self, obj: Any) -> None:
+        self._pending.append(obj)
+
+    async def commit(self) -> None:
+        if self._pending:
+            await self._statement()  # the INSERT flush
+            for obj in self._pending:
+                obj.id = getattr(obj, "id", None) or uuid.uuid4()
+                obj.created_at = getattr(obj, "created_at", None) or datetime.now(timezone.utc)
+            self._pending = []
+        self._release()
+
+    async def rollback(self) -> None:
+        self._pending = []
+        self._release()
+
+    async def refresh(self, obj: Any) -> None:
+        await self._statement()
+
+    async def close(self) -> None:
+        await self.rollback()
+
+    async def __aenter__(self) -> "PooledSession":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
@@ -0,0 +1,25 @@
+# tests/test_query_plans.py
+"""
+Runs bench.query_plans against the Postgres named by QUERY_PLANS_DSN; skipped when it is unset.
+Seeding the default volumes takes about a minute.
+"""
+import os
+
+import pytest
+
+from bench import query_plans
+
+DSN = os.environ.get("QUERY_PLANS_DSN")
+
+pytestmark = pytest.mark.skipif(not DSN, reason="QUERY_PLANS_DSN is not set")
+
+
+@pytest.fixture(scope="module")
+def results():
+    return query_plans.run(query_plans.parse_args(["--dsn", DSN]))
+
+
+def test_hot_queries_use_indexes(results):
+    assert results["queries"]
+    failed = {name: r["problems"] for name, r in results["queries"].items() if not r["ok"]}
+    assert not failed, failed
@@ -0,0 +1,99 @@
+# tests/test_s3_download.py
+"""s3_download_to_tempfile against moto's S3: both download paths, and an overwrite mid-download."""
+import hashlib
+import os
+import tracemalloc
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.config import settings
+from app.utils import s3_utils
+from app.utils.s3_utils import MB, ObjectChanged, s3_download_to_tempfile
+from bench.stubs import FakeS3
+
+BUCKET = "ingest-test"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setattr(settings, "AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setattr(settings, "AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr(settings, "AWS_REGION", "us-east-1")
+    monkeypatch.setattr(settings, "S3_ENDPOINT", "")
+    monkeypatch.setattr(settings, "INGEST_TMP_DIR", "")
+    monkeypatch.setattr(settings, "S3_RANGE_THRESHOLD_MB", 4)
+    monkeypatch.setattr(settings, "S3_RANGE_PART_MB", 1)
+    monkeypatch.setattr(settings, "S3_RANGE_CONCURRENCY", 2)
+    with mock_aws():
+        client = s3_utils.get_s3_client()
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def _put(client, key: str, size: int) -> bytes:
+    data = os.urandom(size)
+    client.put_object(Bucket=BUCKET, Key=key, Body=data)
+    return data
+
+
+def _download(key: str, etag=None):
+    with s3_download_to_tempfile(BUCKET, key, etag) as fh:
+        return fh.read()
+
+
+def test_single_stream(s3):
+    data = _put(s3, "small.pdf", 3 * MB + 17)
+    assert _download("small.pdf") == data
+
+
+def test_ranged_size_and_hash(s3):
+    size = 12 * MB + 5
+    data = _put(s3, "large.pdf", size)
+    with s3_download_to_tempfile(BUCKET, "large.pdf") as fh:
+        assert os.fstat(fh.fileno()).st_size == size
+        assert hashlib.file_digest(fh, "sha256").hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_ranged_peak_memory(s3, monkeypatch):
+    # moto reads the whole object for every GET, so memory is measured against FakeS3, which
+    # generates bodies as they are read: what is left is what the download itself holds
+    fake = FakeS3()
+    fake.put(BUCKET, "large.pdf", 64 * MB)
+    monkeypatch.setattr(s3_utils, "get_s3_client", lambda: fake)
+    tracemalloc.start()
+    try:
+        s3_download_to_tempfile(BUCKET, "large.pdf").close()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # one chunk per open stream, plus slack for executor bookkeeping
+    assert peak <= (settings.S3_RANGE_CONCURRENCY + 1) * s3_utils.STREAM_CHUNK + 256 * 1024, peak
+
+
+def test_stale_etag_is_rejected(s3):
+    _put(s3, "doc.pdf", MB)
+    etag, _ = s3_utils.s3_head(BUCKET, "doc.pdf")
+    _put(s3, "doc.pdf", MB)
+    with pytest.raises(ObjectChanged):
+        _download("doc.pdf", etag)
+
+
+def test_overwrite_between_ranged_parts(s3, monkeypatch):
+    _put(s3, "doc.pdf", 8 * MB)
+    monkeypatch.setattr(settings, "S3_RANGE_CONCURRENCY", 1)
+    calls = []
+
+    def overwrite_after_first_part(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 2:  # the initial GET, then part one has been served
+            _put(s3, "doc.pdf", 8 * MB)
+
+    client = s3_utils.get_s3_client()
+    client.meta.events.register("after-call.s3.GetObject", overwrite_after_first_part)
+    monkeypatch.setattr(s3_utils, "get_s3_client", lambda: client)
+    with pytest.raises(ObjectChanged):
+        _download("doc.pdf")
+    # the failed part stops the download: the parts still queued are never requested
+    assert len(calls) < 2 + 8
@@ -121,28 +121,54 @@ const ChatScreen: React.FC = () => {
     const [input, setInput] = useState("");
     const [isLoading, setIsLoading] = useState(false);
     const [isFetching, setIsFetching] = useState(true);
+    const [olderCursor, setOlderCursor] = useState<string | null>(null);
+    const [isFetchingOlder, setIsFetchingOlder] = useState(false);
     const [sendError, setSendError] = useState<string | null>(null);
 
     const listRef = useRef<HTMLDivElement | null>(null);
     const textareaRef = useRef<HTMLTextAreaElement | null>(null);
+    // distance from the bottom to keep when earlier messages are prepended
+    const keepOffsetRef = useRef<number | null>(null);
 
 
     useEffect(() => {
         if (!chatId) return;
         setIsFetching(true);
         getMessagesByChatId(chatId)
-            .then(setMessages)
+            .then(({messages, nextCursor}) => {
+                setMessages(messages);
+                setOlderCursor(nextCursor);
+            })
             .catch((err) => console.error("Failed to fetch messages:", err))
             .finally(() => setIsFetching(false));
         ;
     }, [chatId]);
 
     useEffect(() => {
-        if (listRef.current) {
-            listRef.current.scrollTop = listRef.current.scrollHeight;
-        }
+        const el = listRef.current;
+        if (!el) return;
+        const offset = keepOffsetRef.current;
+        keepOffsetRef.current = null;
+        el.scrollTop = offset === null ? el.scrollHeight : el.scrollHeight - offset;
     }, [messages, isLoading]);
 
+    const loadEarlier = async () => {
+        if (!chatId || !olderCursor || isFetchingOlder) return;
+        setIsFetchingOlder(true);
+        try {
+            const {messages: older, nextCursor} = await getMessagesByChatId(chatId, olderCursor);
+            if (listRef.current) {
+                keepOffsetRef.current = listRef.current.scrollHeight - listRef.current.scrollTop;
+            }
+            setMessages((prev) => [...older, ...prev]);
+            setOlderCursor(nextCursor);
+        } catch (err) {
+            console.error("Failed to fetch earlier messages:", err);
+        } finally {
+            setIsFetchingOlder(false);
+        }
+    };
+
     useEffect(() => {
         const el = textareaRef.current;
         if (el) {
@@ -217,6 +243,17 @@ const ChatScreen: React.FC = () => {
                                 </div>
                             ) : (
                                 <>
+                                    {olderCursor && (
+                                        <div className="flex justify-center">
+                                            <button
+                                                onClick={loadEarlier}
+                                                disabled={isFetchingOlder}
+                                                className="text-xs text-white/60 hover:text-white/90 disabled:opacity-50"
+                                            >
+                                                {isFetchingOlder ? "Loading..." : "Load earlier messages"}
+                                            </button>
+                                        </div>
+                                    )}
                                     {messages.map((m) => (
                                         <Bubble key={m.id} msg={m}/>
                                     ))}
@@ -1,16 +1,20 @@
 // src/pages/Dashboard.tsx
-import React, { useEffect, useMemo, useState, useRef } from "react";
+import React, { useCallback, useEffect, useMemo, useState, useRef } from "react";
 import Sidebar from "../components/Sidebar";
 import ProjectCard from "../components/ProjectCard";
 import Footer from "../components/Footer";
 import { useNavigate } from "react-router-dom";
-import {deleteChat, getAllChats, Project} from "../utils/api";
+import {deleteChat, getChats, Project} from "../utils/api";
 import { FiSearch } from "react-icons/fi";
 
 const Dashboard: React.FC = () => {
   const navigate = useNavigate();
   const [projects, setProjects] = useState<Project[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [loadMoreFailed, setLoadMoreFailed] = useState(false);
+  const sentinelRef = useRef<HTMLDivElement | null>(null);
   const [query, setQuery] = useState("");
   const [showSearch, setShowSearch] = useState(false);
   const inputRef = useRef<HTMLInputElement | null>(null);
@@ -25,11 +29,15 @@ const Dashboard: React.FC = () => {
       alert("Failed to delete project.");
     }
   };
-  // load projects
+  // load the first page of projects; the rest come in as the list is scrolled
   useEffect(() => {
     let mounted = true;
-    getAllChats()
-      .then((res) => mounted && setProjects(res))
+    getChats()
+      .then(({ chats, nextCursor }) => {
+        if (!mounted) return;
+        setProjects(chats);
+        setNextCursor(nextCursor);
+      })
       .catch((err) => console.error("Failed to load chats", err))
       .finally(() => mounted && setLoading(false));
     return () => {
@@ -37,6 +45,39 @@ const Dashboard: React.FC = () => {
     };
   }, []);
 
+  const loadMore = useCallback(async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    setLoadMoreFailed(false);
+    try {
+      const { chats, nextCursor: cursor } = await getChats(nextCursor);
+      setProjects((prev) => {
+        const seen = new Set(prev.map((p) => p.id));
+        return [...prev, ...chats.filter((c) => !seen.has(c.id))];
+      });
+      setNextCursor(cursor);
+    } catch (err) {
+      console.error("Failed to load more chats", err);
+      setLoadMoreFailed(true); // retried from the button, not on every scroll
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [nextCursor, loadingMore]);
+
+  // next page when the end of the list scrolls into view
+  useEffect(() => {
+    const el = sentinelRef.current;
+    if (!el || !nextCursor || loadMoreFailed) return;
+    const observer = new IntersectionObserver(
+      (entries) => {
+        if (entries.some((e) => e.isIntersecting)) loadMore();
+      },
+      { rootMargin: "200px" }
+    );
+    observer.observe(el);
+    return () => observer.disconnect();
+  }, [nextCursor, loadMore, loadMoreFailed, loading]);
+
   // focus vào input khi mở search
   useEffect(() => {
     if (showSearch) {
@@ -141,7 +182,7 @@ const Dashboard: React.FC = () => {
                     Loading your chats…
                   </div>
                 </div>
-              ) : filtered.length === 0 ? (
+              ) : filtered.length === 0 && !nextCursor ? (
                 <div className="text-center text-white/80 py-16">
                   <h2 className="text-lg font-medium">No projects found</h2>
                   <p className="mt-1 text-sm">
@@ -167,6 +208,20 @@ const Dashboard: React.FC = () => {
                   ))}
                 </div>
               )}
+              {!loading && nextCursor && (
+                <div ref={sentinelRef} className="py-6 text-center text-sm text-white/60">
+                  {loadingMore ? (
+                    "Loading more…"
+                  ) : loadMoreFailed ? (
+                    <button
+                      onClick={loadMore}
+                      className="px-4 py-2 rounded-xl bg-white/10 hover:bg-white/20 text-white ring-1 ring-white/10"
+                    >
+                      Load more
+                    </button>
+                  ) : null}
+                </div>
+              )}
             </div>
           </div>
         </div>
@@ -40,6 +40,11 @@ export type PresignResp = {
 
 export type ConfirmResp = { ok: boolean };
 
+export interface Page<T> {
+    items: T[];
+    next_cursor: string | null;
+}
+
 export interface MessageOut {
     id: string;
     content: string;
@@ -49,10 +54,16 @@ export interface MessageOut {
 
 /** ========= Chats ========= */
 
-export const getAllChats = async (): Promise<Project[]> => {
-    const res = await axios.get<Project[]>('/chat/', {withCredentials: true})
-    return res.data
-}
+/** One page of chats, most recently updated first: the first page if `cursor` is omitted. */
+export const getChats = async (
+    cursor?: string | null
+): Promise<{ chats: Project[]; nextCursor: string | null }> => {
+    const res = await axios.get<Page<Project>>('/chat/', {
+        params: {cursor: cursor ?? undefined},
+        withCredentials: true,
+    });
+    return {chats: res.data.items, nextCursor: res.data.next_cursor};
+};
 
 export const getChatTitle = async (chatId: string): Promise<string> => {
     const res = await axios.get<{ title: string }>(`/chat/title/${chatId}`, {
@@ -84,11 +95,16 @@ export const deleteChat = async (chatId: string): Promise<void> => {
 
 /** ========= Messages ========= */
 
-export const getMessagesByChatId = async (chatId: string): Promise<Message[]> => {
-    const res = await axios.get<Message[]>(`/message/${chatId}`, {
+/** The newest messages before `cursor` (the latest ones if omitted), oldest first. */
+export const getMessagesByChatId = async (
+    chatId: string,
+    cursor?: string | null
+): Promise<{ messages: Message[]; nextCursor: string | null }> => {
+    const res = await axios.get<Page<Message>>(`/message/${chatId}`, {
+        params: {cursor: cursor ?? undefined},
         withCredentials: true,
     });
-    return res.data;
+    return {messages: [...res.data.items].reverse(), nextCursor: res.data.next_cursor};
 };
 
 export const sendMessageToAI = async (